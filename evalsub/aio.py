@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+asyncio API of evalsub: evaluations awaited from an event loop, without blocking it.
+
+Evaluations (file reading included) run in a process pool, whose processes keep the references they preprocessed in
+memory (see `cached_ref`), at most `max_refs` of them per process (the least recently used ones are evicted). The
+number of evaluations submitted to the pool at once is bounded, so that many evaluations can be awaited concurrently
+without oversubscribing the CPUs: the others wait in the event loop, where cancelling them is immediate. An
+evaluation already running in a process cannot be interrupted: if it is cancelled, it finishes in the background,
+and its result is discarded.
+
+    from evalsub.aio import AsyncEvaluator
+    async with AsyncEvaluator(n_jobs=4) as evaluator:
+        results = await evaluator.evaluate_systems('ref.fr', ['sys1.fr', 'sys2.fr'], metrics=['Sigma'])
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+import sys
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+import evalsub.api as api
+import evalsub.util.constants as cst
+from evalsub.util.logs import cli_level, init_worker_logging
+from evalsub.util.util import set_ref_cache_max_refs
+
+
+def init_async_worker(log_level, max_refs):
+    init_worker_logging(log_level)
+    set_ref_cache_max_refs(max_refs)
+
+
+class AsyncEvaluator:
+    """
+    Evaluations awaited from an event loop, computed in a process pool of `n_jobs` processes (all the CPUs if None or
+    <= 0), with at most `max_concurrency` evaluations (by default, `n_jobs`) submitted to the pool at once. Each
+    process keeps the preprocessing of at most `max_refs` references (unbounded if None).
+    """
+    def __init__(self, n_jobs=None, max_concurrency=None, max_refs=cst.REF_CACHE_MAX_REFS):
+        if n_jobs is None or n_jobs <= 0:
+            n_jobs = os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=init_async_worker,
+                                            initargs=(cli_level(), max_refs))
+        self.max_concurrency = max_concurrency if max_concurrency is not None else n_jobs
+        # Created in the event loop of the evaluations
+        self.semaphore = None
+        self.loop = None
+
+    def close(self):
+        # Pending evaluations are cancelled, running ones are waited for
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def evaluate(self, ref_file_path, sys_file_path, metrics=cst.DEFAULT_METRICS, **kwargs):
+        """
+        Evaluate a system against a reference (see `api.evaluate`).
+
+        :return: results of the system (see `EvalResult`)
+        """
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.loop = loop
+
+        async with self.semaphore:
+            future = self.executor.submit(partial(api.evaluate, ref_file_path, sys_file_path, metrics=list(metrics),
+                                                  **kwargs))
+            # Cancelling the awaiting task cancels the evaluation if it has not started yet
+            return await asyncio.wrap_future(future)
+
+    async def evaluate_systems(self, ref_file_path, sys_file_paths, metrics=cst.DEFAULT_METRICS, **kwargs):
+        """
+        Evaluate systems against a reference, concurrently.
+
+        :return: list of the results of the systems (see `EvalResult`), in the order of `sys_file_paths`
+        """
+        return await asyncio.gather(*[self.evaluate(ref_file_path, sys_file_path, metrics=metrics, **kwargs)
+                                      for sys_file_path in sys_file_paths])
+
+
+# Evaluator of the module-level functions, created on demand
+DEFAULT_EVALUATOR = None
+
+
+def default_evaluator():
+    global DEFAULT_EVALUATOR
+    if DEFAULT_EVALUATOR is None:
+        DEFAULT_EVALUATOR = AsyncEvaluator()
+
+    return DEFAULT_EVALUATOR
+
+
+async def evaluate(ref_file_path, sys_file_path, metrics=cst.DEFAULT_METRICS, **kwargs):
+    """
+    Evaluate a system against a reference, with the default evaluator (one process per CPU).
+    """
+    return await default_evaluator().evaluate(ref_file_path, sys_file_path, metrics=metrics, **kwargs)
+
+
+async def evaluate_systems(ref_file_path, sys_file_paths, metrics=cst.DEFAULT_METRICS, **kwargs):
+    """
+    Evaluate systems against a reference, with the default evaluator (one process per CPU).
+    """
+    return await default_evaluator().evaluate_systems(ref_file_path, sys_file_paths, metrics=metrics, **kwargs)
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Library API of evalsub: evaluation of segmented subtitle files against a reference.
+
+Results are returned as `EvalResult` objects, and nothing is printed: progress and scores are logged (see
+`evalsub.util.logs`), and are only output if logging is configured, as done by `evalsub_main.py`.
+
+    from evalsub.api import evaluate
+    result = evaluate('ref.fr', 'sys.fr', metrics=['Sigma', 'TER_br'])
+    result.scores['Sigma']
+"""
+
+from collections import OrderedDict, namedtuple
+from contextlib import redirect_stdout
+from functools import partial
+import io
+import os
+import sys
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+import evalsub.eval.planner as planner
+from evalsub.eval.planner import load_metric
+import evalsub.util.constants as cst
+from evalsub.util.logs import cli_level, get_logger, init_worker_logging
+from evalsub.util.profiling import CPU_TIME, PEAK_MEMORY, WALL_TIME, format_profile, profile_stage, profiling
+
+logger = get_logger(__name__)
+
+
+class EvalResult(namedtuple('EvalResult', ['system', 'scores', 'confidence_intervals', 'profile'], defaults=(None,))):
+    """
+    Results of a system.
+
+    :param system: name of the system file
+    :param scores: metric -> score (with the window size, transposition span and alpha when they are used, see
+        `result_columns`)
+    :param confidence_intervals: metric -> (mean, 95% confidence interval half-width), for the metrics whose
+        confidence intervals were estimated (BLEU_br, BLEU_nb, Sigma, TER_br)
+    :param profile: profile of the evaluation stages, if profiled (see `evalsub.util.profiling`)
+    """
+    __slots__ = ()
+
+    def row(self):
+        """
+        Results as a row of a results file (see `ResultsWriter`), with the totals of the profile if profiled.
+        """
+        row = {cst.SYSTEM: self.system}
+        row.update(self.scores)
+        if self.profile is not None:
+            row.update((column, self.profile[column]) for column in (WALL_TIME, CPU_TIME, PEAK_MEMORY))
+
+        return row
+
+
+def result_columns(metrics, profile=False):
+    """
+    Columns of the results of metrics: system, metrics, then window size, transposition span and alpha if they are
+    used by the metrics, and the totals of the profile if profiled.
+    """
+    columns = [cst.SYSTEM] + list(metrics)
+    # Window size is saved if Pk or WindowDiff is computed
+    if cst.PK in metrics or cst.WIN_DIFF in metrics:
+        columns.append(cst.WIN_SIZE)
+    # Transposition span is saved if SegSim or BoundSim is computed
+    if cst.SEG_SIM in metrics or cst.BOUND_SIM in metrics:
+        columns.append(cst.NT)
+    # Boundaries to words ratio (alpha) is saved if Sigma is computed
+    if cst.SIGMA in metrics:
+        columns.append(cst.ALPHA)
+    if profile:
+        columns.extend([WALL_TIME, CPU_TIME, PEAK_MEMORY])
+
+    return columns
+
+
+def score_cis(scores):
+    """
+    Confidence intervals of sacrebleu scores, for the scores whose confidence intervals were estimated (the mean of
+    the others is -1).
+    """
+    return {metric: (float(score._mean), float(score._ci)) for metric, score in scores.items() if score._mean >= 0}
+
+
+# METRIC FAMILIES  #####################################################################################################
+
+def seg_family(inputs, metrics, window_size=None, nt=cst.DEFAULT_NT):
+    scores = dict()
+    seg_scores = load_metric(cst.PK)
+    win_size, pk, win_diff, seg_sim, bound_sim = seg_scores(
+        inputs[planner.SYS_MASSES], inputs[planner.REF_MASSES], inputs[planner.SYS_SETS], inputs[planner.REF_SETS],
+        window_size=window_size, nt=nt)
+    if cst.WIN_SIZE in metrics:
+        scores[cst.WIN_SIZE] = win_size
+    if cst.PK in metrics:
+        scores[cst.PK] = pk
+        logger.info('Pk: %s', round(pk, 3))
+    if cst.WIN_DIFF in metrics:
+        scores[cst.WIN_DIFF] = win_diff
+        logger.info('WindowDiff: %s', round(win_diff, 3))
+    if cst.NT in metrics:
+        scores[cst.NT] = nt
+    if cst.SEG_SIM in metrics:
+        scores[cst.SEG_SIM] = seg_sim
+        logger.info('Segmentation similarity: %s', round(seg_sim, 3))
+    if cst.BOUND_SIM in metrics:
+        scores[cst.BOUND_SIM] = bound_sim
+        logger.info('Boundary similarity: %s', round(bound_sim, 3))
+
+    return scores, dict()
+
+
+def cpl_family(inputs, metrics, max_cpl=cst.MAX_CPL):
+    cpl_scores = load_metric(cst.CPL_CONF)
+    cpl_conf = cpl_scores(inputs[planner.CAPTIONS], max_cpl=max_cpl)
+    logger.info("CPL conformity: %s%%", round(cpl_conf, 2))
+
+    return {cst.CPL_CONF: cpl_conf}, dict()
+
+
+def sigma_family(inputs, metrics, **kwargs):
+    scores = dict()
+    sigma_scores = load_metric(cst.SIGMA)
+    sigma_score = sigma_scores(*inputs[planner.PLACEHOLDER_SENTS], **kwargs)
+    bleu_br = sigma_score[cst.BLEU_BR]
+    bleu_nb = sigma_score[cst.BLEU_NB]
+    alpha = sigma_score[cst.ALPHA]
+    sigma = sigma_score[cst.SIGMA]
+    if cst.BLEU_BR in metrics:
+        scores[cst.BLEU_BR] = bleu_br.score
+        logger.info('BLEU_br: %s', bleu_br.format(score_only=True))
+    if cst.BLEU_NB in metrics:
+        scores[cst.BLEU_NB] = bleu_nb.score
+        logger.info('BLEU_nb: %s', bleu_nb.format(score_only=True))
+    if cst.ALPHA in metrics:
+        scores[cst.ALPHA] = alpha
+    if cst.SIGMA in metrics:
+        scores[cst.SIGMA] = sigma.score
+        logger.info('Sigma: %s', sigma.format(score_only=True))
+
+    cis = score_cis({metric: sigma_score[metric] for metric in (cst.BLEU_BR, cst.BLEU_NB, cst.SIGMA)
+                     if metric in metrics})
+
+    return scores, cis
+
+
+def ter_family(inputs, metrics, **kwargs):
+    ter_scores = load_metric(cst.TER_BR)
+    ter_br = ter_scores(*inputs[planner.MASKED_SENTS], **kwargs)
+    logger.info('TER_br: %s', ter_br.format(score_only=True))
+
+    return {cst.TER_BR: ter_br.score}, score_cis({cst.TER_BR: ter_br})
+
+
+def f1_family(inputs, metrics):
+    scores = dict()
+    f1_scores = load_metric(cst.F1)
+    precision, recall, f1 = f1_scores(inputs[planner.SYS_MASSES], inputs[planner.REF_MASSES], cst.NEUTRAL_TAG)
+    if cst.PRECISION in metrics:
+        scores[cst.PRECISION] = precision
+        logger.info('Precision: %s', round(precision, 3))
+    if cst.RECALL in metrics:
+        scores[cst.RECALL] = recall
+        logger.info('Recall: %s', round(recall, 3))
+    if cst.F1 in metrics:
+        scores[cst.F1] = f1
+        logger.info('F1: %s', round(f1, 3))
+
+    return scores, dict()
+
+
+def run_family(name, family):
+    with profile_stage('metric:%s' % name):
+        return family()
+
+
+def family_worker(named_family, profile=False):
+    """
+    Compute a metric family in an evaluation process.
+
+    :param named_family: name of the family, and function computing it
+    :param profile: whether to profile the computation
+    :return: scores and confidence intervals of the family, printed output, and profiled stages (None if not profiled)
+    """
+    with redirect_stdout(io.StringIO()) as output, profiling(profile) as family_profile:
+        scores = run_family(*named_family)
+
+    return scores, output.getvalue(), family_profile.stages if family_profile is not None else None
+
+
+# EVALUATION  ##########################################################################################################
+
+def evaluate(ref_file_path, sys_file_path, metrics=cst.DEFAULT_METRICS, window_size=None, nt=cst.DEFAULT_NT,
+             max_cpl=cst.MAX_CPL, srt=False, auto_seg=False, confidence_interval=False, ter_jobs=1,
+             auto_seg_chunk_size=None, auto_seg_jobs=1, auto_seg_cache_dir_path=cst.CACHE_DIR_PATH,
+             auto_seg_out_dir_path=None, adaptive_ci=False, ci_min_samples=cst.BS_MIN_SAMPLES,
+             ci_max_samples=cst.BS_MAX_SAMPLES, ci_tolerance=cst.BS_TOLERANCE, ci_jobs=1, metric_jobs=1,
+             profile=False):
+    """
+    Evaluate a system against a reference.
+
+    The preprocessing stages needed by the metrics are computed first, each one once (see `planner.plan`). The metric
+    families (segmentation metrics, CPL conformity, BLEU/Sigma, TER_br, F1) are then independent: with several
+    processes, they are computed concurrently, and their scores and outputs are merged in the sequential order.
+
+    :param ref_file_path: reference segmented subtitle file
+    :param sys_file_path: system segmented subtitle file
+    :param metrics: metrics to compute (see `cst.VALID_METRICS`)
+    :param metric_jobs: number of processes computing metric families (all the CPUs if None or <= 0)
+    :param profile: whether to profile the evaluation stages (see `evalsub.util.profiling`)
+    :return: results of the system (see `EvalResult`)
+    """
+    logger.info("Evaluating %s", sys_file_path)
+
+    with profiling(profile) as eval_profile:
+        metrics = result_columns(metrics)[1:]
+        inputs = planner.run_plan(planner.plan(metrics), ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg,
+                                  auto_seg_chunk_size=auto_seg_chunk_size, auto_seg_jobs=auto_seg_jobs,
+                                  auto_seg_cache_dir_path=auto_seg_cache_dir_path,
+                                  auto_seg_out_dir_path=auto_seg_out_dir_path)
+
+        def family_inputs(metric):
+            return {representation: inputs[representation] for representation in planner.METRIC_INPUTS[metric]}
+
+        ci_kwargs = dict(confidence_interval=confidence_interval, adaptive_ci=adaptive_ci,
+                         ci_min_samples=ci_min_samples, ci_max_samples=ci_max_samples, ci_tolerance=ci_tolerance,
+                         ci_jobs=ci_jobs)
+        families = list()  # (name, function)
+        if cst.PK in metrics or cst.WIN_DIFF in metrics or cst.SEG_SIM in metrics or cst.BOUND_SIM in metrics:
+            families.append(('seg', partial(seg_family, family_inputs(cst.PK), metrics, window_size=window_size,
+                                            nt=nt)))
+        if cst.CPL_CONF in metrics:
+            families.append(('cpl', partial(cpl_family, family_inputs(cst.CPL_CONF), metrics, max_cpl=max_cpl)))
+        if cst.BLEU_BR in metrics or cst.BLEU_NB in metrics or cst.SIGMA in metrics:
+            families.append(('sigma', partial(sigma_family, family_inputs(cst.SIGMA), metrics, **ci_kwargs)))
+        if cst.TER_BR in metrics:
+            families.append(('ter', partial(ter_family, family_inputs(cst.TER_BR), metrics, n_jobs=ter_jobs,
+                                            **ci_kwargs)))
+        if cst.PRECISION in metrics or cst.RECALL in metrics or cst.F1 in metrics:
+            families.append(('f1', partial(f1_family, family_inputs(cst.F1), metrics)))
+
+        if metric_jobs is None or metric_jobs <= 0:
+            metric_jobs = os.cpu_count()
+        metric_jobs = min(metric_jobs, len(families))
+        if metric_jobs <= 1:
+            family_results = [run_family(name, family) for name, family in families]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            family_results = list()
+            with ProcessPoolExecutor(max_workers=metric_jobs, initializer=init_worker_logging,
+                                     initargs=(cli_level(),)) as executor:
+                for family_result, output, family_stages in executor.map(partial(family_worker, profile=profile),
+                                                                         families):
+                    print(output, end='')
+                    family_results.append(family_result)
+                    if eval_profile is not None:
+                        eval_profile.add_stages(family_stages)
+
+    scores = dict()
+    cis = dict()
+    for family_scores, family_cis in family_results:
+        scores.update(family_scores)
+        cis.update(family_cis)
+
+    if eval_profile is not None:
+        eval_profile = eval_profile.as_dict()
+        for line in format_profile(eval_profile):
+            logger.info('%s', line)
+
+    return EvalResult(os.path.basename(sys_file_path), scores, cis, eval_profile)
+
+
+def init_eval_worker(ref_file_path, metrics, srt=False, log_level=None):
+    """
+    Parse and preprocess the reference once per evaluation process, for the given metrics (see `cached_ref`).
+    """
+    init_worker_logging(log_level)
+    planner.warm_ref(ref_file_path, metrics, srt=srt)
+
+
+def eval_worker(sys_file_path, ref_file_path, **kwargs):
+    """
+    Evaluate a system in an evaluation process.
+
+    :return: results of the system, and printed output
+    """
+    with redirect_stdout(io.StringIO()) as output:
+        result = evaluate(ref_file_path, sys_file_path, **kwargs)
+
+    return result, output.getvalue()
+
+
+def evaluate_systems(ref_file_path, sys_file_paths, metrics=cst.DEFAULT_METRICS, n_jobs=1, **kwargs):
+    """
+    Evaluate systems against a reference.
+
+    With several processes, each process preprocesses the reference once, and evaluates whole systems; the output of
+    each system is printed at once, in order.
+
+    :param ref_file_path: reference segmented subtitle file
+    :param sys_file_paths: system segmented subtitle files
+    :param metrics: metrics to compute (see `cst.VALID_METRICS`)
+    :param n_jobs: number of processes evaluating systems (all the CPUs if None or <= 0)
+    :param kwargs: evaluation settings (see `evaluate`)
+    :return: generator of the results of the systems (see `EvalResult`), in the order of `sys_file_paths`, each one
+        as soon as it is available
+    """
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count()
+    n_jobs = min(n_jobs, len(sys_file_paths))
+
+    if n_jobs <= 1:
+        for sys_file_path in sys_file_paths:
+            yield evaluate(ref_file_path, sys_file_path, metrics=metrics, **kwargs)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    metrics = list(metrics)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_eval_worker,
+                             initargs=(ref_file_path, metrics, kwargs.get('srt', False), cli_level())) as executor:
+        for result, output in executor.map(partial(eval_worker, ref_file_path=ref_file_path, metrics=metrics,
+                                                   **kwargs), sys_file_paths):
+            print(output, end='')
+            yield result
+
+
+# MANIFESTS  ###########################################################################################################
+
+def read_manifest(manifest_file_path):
+    """
+    Reference/system pairs of a manifest: CSV (or JSONL, if the file name ends with .jsonl) with reference and system
+    columns (`cst.MANIFEST_REFERENCE`, `cst.MANIFEST_SYSTEM`), and optional metadata columns.
+
+    :param manifest_file_path: manifest file
+    :return: metadata columns, and list of rows (dictionaries, with the file paths as written in the manifest)
+    """
+    from evalsub.util.results import read_results
+
+    if not os.path.isfile(manifest_file_path):
+        raise FileNotFoundError("No such manifest file: %s" % manifest_file_path)
+    columns, rows = read_results(manifest_file_path)
+    if not rows:
+        raise ValueError("Empty manifest: %s" % manifest_file_path)
+    for column in (cst.MANIFEST_REFERENCE, cst.MANIFEST_SYSTEM):
+        if column not in columns:
+            raise ValueError("Missing column in manifest %s: %s" % (manifest_file_path, column))
+
+    metadata_columns = [column for column in columns if column not in (cst.MANIFEST_REFERENCE, cst.MANIFEST_SYSTEM)]
+
+    return metadata_columns, rows
+
+
+def manifest_path(manifest_file_path, file_path):
+    """
+    Path of a file of a manifest (relative paths are relative to the directory of the manifest).
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(manifest_file_path)), file_path)
+
+
+def ref_group_worker(ref_file_path, sys_file_paths, **kwargs):
+    """
+    Evaluate systems against a reference in an evaluation process, then free the preprocessing of the reference.
+
+    :return: results of the systems, and printed output
+    """
+    from evalsub.util.util import evict_ref
+
+    results = list()
+    with redirect_stdout(io.StringIO()) as output:
+        try:
+            for sys_file_path in sys_file_paths:
+                results.append(evaluate(ref_file_path, sys_file_path, **kwargs))
+        finally:
+            evict_ref(ref_file_path)
+
+    return results, output.getvalue()
+
+
+def evaluate_pairs(pairs, metrics=cst.DEFAULT_METRICS, n_jobs=1, **kwargs):
+    """
+    Evaluate reference/system pairs, grouped by reference (files with the same real path), so that each reference is
+    preprocessed once for all its systems, and freed once they are evaluated.
+
+    With several processes, the systems of a reference are split into at most `n_jobs` groups, and each process
+    evaluates whole groups: references are evaluated in parallel, as well as the systems of a reference.
+
+    :param pairs: list of (reference file, system file) pairs
+    :param metrics: metrics to compute (see `cst.VALID_METRICS`)
+    :param n_jobs: number of evaluation processes (all the CPUs if None or <= 0)
+    :param kwargs: evaluation settings (see `evaluate`)
+    :return: generator of (index of the pair, results of the system) tuples (see `EvalResult`), grouped by reference,
+        in the order of the first pair of each reference, each one as soon as it is available
+    """
+    from evalsub.util.util import evict_ref
+
+    # Reference -> indices of its pairs
+    ref_groups = OrderedDict()
+    for i, (ref_file_path, _) in enumerate(pairs):
+        ref_groups.setdefault(os.path.realpath(ref_file_path), list()).append(i)
+
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count()
+    n_jobs = min(n_jobs, len(pairs))
+
+    if n_jobs <= 1:
+        for ref_file_path, indices in ref_groups.items():
+            try:
+                for i in indices:
+                    yield i, evaluate(ref_file_path, pairs[i][1], metrics=metrics, **kwargs)
+            finally:
+                evict_ref(ref_file_path)
+        return
+
+    tasks = list()  # (reference, indices of a group of its pairs)
+    for ref_file_path, indices in ref_groups.items():
+        n_groups = min(n_jobs, len(indices))
+        for k in range(n_groups):
+            tasks.append((ref_file_path, indices[k * len(indices) // n_groups:(k + 1) * len(indices) // n_groups]))
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker_logging,
+                             initargs=(cli_level(),)) as executor:
+        task_results = executor.map(partial(ref_group_worker, metrics=list(metrics), **kwargs),
+                                    [ref_file_path for ref_file_path, _ in tasks],
+                                    [[pairs[i][1] for i in indices] for _, indices in tasks])
+        for (_, indices), (results, output) in zip(tasks, task_results):
+            print(output, end='')
+            yield from zip(indices, results)
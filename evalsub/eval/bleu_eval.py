@@ -23,8 +23,11 @@ if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
 import evalsub.util.constants as cst
+from evalsub.util.logs import get_logger
 from evalsub.util.util import preprocess
 
+logger = get_logger(__name__)
+
 DESCRIPTION = """
 Computes BLEU and the difference between BLEU with and without breaks
 """
@@ -33,6 +36,11 @@ Computes BLEU and the difference between BLEU with and without breaks
 def bleu_preprocess(infile, remove_eol=False, remove_eob=False, replace=False):
     tagged_txt = preprocess(infile, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG, line_holder=cst.LINE_HOLDER,
                             caption_holder=cst.CAPTION_HOLDER)
+
+    return bleu_preprocess_str(tagged_txt, remove_eol=remove_eol, remove_eob=remove_eob, replace=replace)
+
+
+def bleu_preprocess_str(tagged_txt, remove_eol=False, remove_eob=False, replace=False):
     if remove_eol:
         tagged_txt = re.sub(cst.LINE_HOLDER, r" ", tagged_txt)
     if remove_eob:
@@ -91,11 +99,11 @@ def bleu_process(reference_file, system_file, extra=False, no_break=False):
         sys_nb = bleu_preprocess(system_file, replace=True)
         score_same = bleu.corpus_score(sys_nb, [ref_nb])
 
-        print('BLEU with breaks:', bleu_score)
-        print('BLEU regardless of type of break:', score_same)
-        print('BLEU without breaks:', score_nobreak)
-        print('BLEU only eol:', score_eol)
-        print('BLEU only eob:', score_eob)
-        print('BLEU difference without-with:', bleu_diff)
+        logger.info('BLEU with breaks: %s', bleu_score)
+        logger.info('BLEU regardless of type of break: %s', score_same)
+        logger.info('BLEU without breaks: %s', score_nobreak)
+        logger.info('BLEU only eol: %s', score_eol)
+        logger.info('BLEU only eob: %s', score_eob)
+        logger.info('BLEU difference without-with: %s', bleu_diff)
 
     return bleu_score
@@ -11,11 +11,13 @@
 # limitations under the License
 
 import argparse
+import json
 import os
 import re
-import statistics
 import sys
 
+import numpy as np
+
 # We include the path of the toplevel package in the system path,
 # so we can always use absolute imports within the package.
 toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -23,42 +25,203 @@ if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
 import evalsub.util.constants as cst
+from evalsub.util.logs import cli_logging
+from evalsub.util.profiling import profile_stage, profiled_main
 from evalsub.util.srt import SrtReader
+from evalsub.util.ttml import TtmlReader
 
 DESCRIPTION = """
-Computes the percentage of subtitles conforming to a max. length
+Computes the conformity of subtitles to display constraints (length, reading speed, number of lines, duration and gaps)
 """
 
+CPL = 'CPL'
+CPS = 'CPS'
+LINES = 'lines_per_block'
+DURATION = 'duration'
+GAP = 'gap'
+CONFORMITY = 'conformity'
+N_OVERLAPS = 'n_overlaps'
+PERCENTILES = (5, 50, 95)
 
-def cpl_process(sys_file_path, max_cpl=cst.MAX_CPL, srt=False, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
+
+def read_captions(sys_file_path, srt=False, ttml=False, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
+    """
+    Read the captions of a subtitle file, with their time spans (if any).
+
+    :param sys_file_path: segmented subtitle file (srt, ttml or tagged text)
+    :param srt: whether the file is in srt format
+    :param ttml: whether the file is in ttml format
+    :param line_tag: end-of-line tag (tagged text)
+    :param caption_tag: end-of-bloc/caption tag (tagged text)
+    :return: list of captions (lists of lines), and list of (begin, end) timecodes at format hh:mm:ss:ff
+        (None for tagged text)
+    """
+    captions = list()
+    time_spans = list()
     if srt:
         srt_reader = SrtReader(sys_file_path)
-        captions = srt_reader.read_all()
-        lines = list()
-        for caption in captions:
-            lines += caption
+        try:
+            while srt_reader.read_caption():
+                captions.append(srt_reader.current_lines())
+                time_spans.append(srt_reader.current_time_span())
+        finally:
+            srt_reader.close()
+
+    elif ttml:
+        ttml_reader = TtmlReader(sys_file_path, filtering=False, masking=False)
+        while not ttml_reader.is_file_over():
+            captions.append(ttml_reader.read_caption(flat=False))
+            time_spans.append(ttml_reader.current_time_span())
 
     else:
-        tagged_str = ' '.join([line.strip() for line in open(sys_file_path).readlines()])
+        with open(sys_file_path) as sys_file:
+            tagged_str = ' '.join([line.strip() for line in sys_file])
         # Removing spaces around boundaries
         tagged_str = re.sub(r"( )?(%s|%s)( )?" % (line_tag, caption_tag), r"\2", tagged_str)
         # Removing (potential) ending boundary
         tagged_str = re.sub(r"(%s|%s)$" % (line_tag, caption_tag), r"", tagged_str)
         # Split at boundaries
-        lines = re.split(r"%s|%s" % (line_tag, caption_tag), tagged_str)
+        captions = [caption.split(line_tag) for caption in tagged_str.split(caption_tag)]
+        time_spans = None
+
+    return captions, time_spans
+
+
+def timecodes_to_s(timecodes):
+    """
+    Vectorized conversion of timecodes at format hh:mm:ss:ff into seconds.
+    """
+    if not timecodes:
+        return np.zeros(0)
+    hmsf = np.array([timecode.split(':') for timecode in timecodes], dtype='float64')
+
+    return hmsf @ np.array([3600, 60, 1, 0.04])
+
+
+def distribution(values, conforming=None):
+    """
+    Summary of the distribution of a constraint's values.
+
+    :param values: values (array)
+    :param conforming: conformity of each value (boolean array)
+    :return: dictionary with the number of values, mean, standard deviation, minimum, percentiles, maximum
+        and the percentage of conforming values (NaN when there is no value)
+    """
+    n = len(values)
+    summary = {'n': n}
+    if n:
+        summary.update({'mean': float(np.mean(values)), 'std': float(np.std(values)), 'min': float(np.min(values))})
+        summary.update({'p%d' % q: float(p) for q, p in zip(PERCENTILES, np.percentile(values, PERCENTILES))})
+        summary['max'] = float(np.max(values))
+    else:
+        summary.update({'mean': np.nan, 'std': np.nan, 'min': np.nan})
+        summary.update({'p%d' % q: np.nan for q in PERCENTILES})
+        summary['max'] = np.nan
+    if conforming is not None:
+        summary[CONFORMITY] = 100 * float(np.mean(conforming)) if n else np.nan
+
+    return summary
+
+
+def conformity_stats(captions, time_spans=None, max_cpl=cst.MAX_CPL, max_cps=cst.MAX_CPS, max_lines=cst.MAX_LINES,
+                     min_duration=cst.MIN_DURATION, max_duration=cst.MAX_DURATION, min_gap=cst.MIN_GAP):
+    """
+    Compute the conformity of captions to all the display constraints at once.
+
+    :param captions: list of captions (lists of lines)
+    :param time_spans: list of (begin, end) timecodes at format hh:mm:ss:ff (if None, only CPL and lines per block
+        are computed)
+    :param max_cpl: maximum number of characters per line
+    :param max_cps: maximum number of characters per second (sum of the line lengths over the caption duration)
+    :param max_lines: maximum number of lines per caption
+    :param min_duration: minimum caption duration (in seconds)
+    :param max_duration: maximum caption duration (in seconds)
+    :param min_gap: minimum gap between consecutive captions (in seconds), overlaps being negative gaps
+    :return: dictionary of distributions (see `distribution`), by constraint
+    """
+    n_lines = np.fromiter((len(caption) for caption in captions), dtype='int64', count=len(captions))
+    cpls = np.fromiter((len(line) for caption in captions for line in caption), dtype='int64', count=n_lines.sum())
+
+    stats = {CPL: distribution(cpls, cpls <= max_cpl),
+             LINES: distribution(n_lines, n_lines <= max_lines)}
+
+    if time_spans is not None:
+        begins = timecodes_to_s([begin for begin, _ in time_spans])
+        ends = timecodes_to_s([end for _, end in time_spans])
+        durations = ends - begins
+        # Sum of the line lengths of each caption
+        n_chars = np.add.reduceat(cpls, np.cumsum(n_lines) - n_lines) if len(cpls) else np.zeros(len(captions))
+        n_chars = np.where(n_lines > 0, n_chars, 0)
+        timed = durations > 0
+        cps = n_chars[timed] / durations[timed]
+        gaps = begins[1:] - ends[:-1]
+
+        stats[CPS] = distribution(cps, cps <= max_cps)
+        stats[DURATION] = distribution(durations, (min_duration <= durations) & (durations <= max_duration))
+        stats[GAP] = distribution(gaps, gaps >= min_gap)
+        stats[GAP][N_OVERLAPS] = int(np.sum(gaps < 0))
 
-    cpls = [len(line) for line in lines]
-    n_cpls = len(cpls)
-    n_conforming_cpls = sum([cpl <= max_cpl for cpl in cpls])
-    cpl_conformity = -1
-    try:
-        cpl_conformity = 100 * (n_conforming_cpls / n_cpls)
-        # print('Length conformity: %.2f %% (%d/%d)' % (100 * cpl_conformity, n_conforming_cpls, n_cpls))
-        # print('Mean line length: %2.f Stdev: %2.f' % (statistics.mean(cpls), statistics.stdev(cpls)))
-    except (ZeroDivisionError, statistics.StatisticsError):
-        pass
+    return stats
 
-    return cpl_conformity
+
+def conformity_process(sys_file_path, srt=False, ttml=False, max_cpl=cst.MAX_CPL, max_cps=cst.MAX_CPS,
+                       max_lines=cst.MAX_LINES, min_duration=cst.MIN_DURATION, max_duration=cst.MAX_DURATION,
+                       min_gap=cst.MIN_GAP, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
+    with profile_stage('read'):
+        captions, time_spans = read_captions(sys_file_path, srt=srt, ttml=ttml, line_tag=line_tag,
+                                             caption_tag=caption_tag)
+
+    with profile_stage('metric:conformity'):
+        return conformity_stats(captions, time_spans=time_spans, max_cpl=max_cpl, max_cps=max_cps,
+                                max_lines=max_lines, min_duration=min_duration, max_duration=max_duration,
+                                min_gap=min_gap)
+
+
+def cpl_process(sys_file_path, max_cpl=cst.MAX_CPL, srt=False, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
+    captions, _ = read_captions(sys_file_path, srt=srt, line_tag=line_tag, caption_tag=caption_tag)
+
+    return cpl_scores(captions, max_cpl=max_cpl)
+
+
+def cpl_scores(captions, max_cpl=cst.MAX_CPL):
+    """
+    Percentage of lines not exceeding `max_cpl` characters (-1 if there is no line).
+
+    :param captions: list of captions (lists of lines)
+    """
+    cpl_conformity = conformity_stats(captions, max_cpl=max_cpl)[CPL][CONFORMITY]
+
+    return cpl_conformity if not np.isnan(cpl_conformity) else -1
+
+
+def cpl_counts(captions, max_cpl=cst.MAX_CPL):
+    """
+    Number of lines not exceeding `max_cpl` characters and number of lines, which can be summed over the shards of a
+    corpus.
+
+    :param captions: list of captions (lists of lines)
+    """
+    n_conforming = sum(len(line) <= max_cpl for caption in captions for line in caption)
+    n_lines = sum(len(caption) for caption in captions)
+
+    return n_conforming, n_lines
+
+
+def cpl_from_counts(n_conforming, n_lines):
+    """
+    CPL conformity of line counts (see `cpl_counts`), -1 if there is no line.
+    """
+    return 100 * (n_conforming / n_lines) if n_lines else -1
+
+
+def print_conformity(stats):
+    columns = ['n', 'mean', 'std', 'min'] + ['p%d' % q for q in PERCENTILES] + ['max', CONFORMITY]
+    print(('%-16s' + ' %10s' * len(columns)) % tuple([''] + columns))
+    for constraint, summary in stats.items():
+        values = ['%10d' % summary['n']] + ['%10.2f' % summary[column] for column in columns[1:]]
+        print('%-16s %s' % (constraint, ' '.join(values)))
+    if GAP in stats:
+        print('Overlapping captions: %d' % stats[GAP][N_OVERLAPS])
 
 
 def parse_args():
@@ -68,8 +231,25 @@ def parse_args():
                         help="Segmented subtitle file to evaluate.")
     parser.add_argument('--max_length', '-len', type=int, default=cst.MAX_CPL,
                         help="Maximum allowed length for subtitles")
+    parser.add_argument('--max_cps', '-cps', type=float, default=cst.MAX_CPS,
+                        help="Maximum allowed reading speed (characters per second).")
+    parser.add_argument('--max_lines', '-lines', type=int, default=cst.MAX_LINES,
+                        help="Maximum allowed number of lines per caption.")
+    parser.add_argument('--min_duration', '-mind', type=float, default=cst.MIN_DURATION,
+                        help="Minimum allowed caption duration (in seconds).")
+    parser.add_argument('--max_duration', '-maxd', type=float, default=cst.MAX_DURATION,
+                        help="Maximum allowed caption duration (in seconds).")
+    parser.add_argument('--min_gap', '-gap', type=float, default=cst.MIN_GAP,
+                        help="Minimum allowed gap between consecutive captions (in seconds).")
     parser.add_argument('--srt', '-srt', action='store_true',
                         help="Wether the subtitle files are in srt format.")
+    parser.add_argument('--ttml', '-ttml', action='store_true',
+                        help="Wether the subtitle files are in ttml format.")
+    parser.add_argument('--output_file', '-of', type=str,
+                        help="If set, JSON file where to write the conformity statistics.")
+    parser.add_argument('--profile', '-prof', action='store_true',
+                        help="Whether to profile the evaluation stages (wall time, CPU time and peak memory), and "
+                             "print them.")
 
     args = parser.parse_args()
     return args
@@ -77,11 +257,24 @@ def parse_args():
 
 def main(args):
     sys_file_path = args.system_file
-    max_cpl = args.max_length
     srt = args.srt
+    ttml = args.ttml
+    output_file_path = args.output_file
+
+    stats = conformity_process(sys_file_path, srt=srt, ttml=ttml, max_cpl=args.max_length, max_cps=args.max_cps,
+                               max_lines=args.max_lines, min_duration=args.min_duration,
+                               max_duration=args.max_duration, min_gap=args.min_gap)
+    print_conformity(stats)
 
-    cpl_process(sys_file_path, max_cpl=max_cpl, srt=srt)
+    if output_file_path is not None:
+        with open(output_file_path, 'w') as output_file:
+            # NaN (no value) written as null
+            json.dump({constraint: {key: None if isinstance(value, float) and np.isnan(value) else value
+                                    for key, value in summary.items()}
+                       for constraint, summary in stats.items()}, output_file, indent=2)
 
 
 if __name__ == '__main__':
-    main(parse_args())
+    cli_logging()
+    args = parse_args()
+    profiled_main(main, args, profile=args.profile)
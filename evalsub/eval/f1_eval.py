@@ -21,7 +21,11 @@ if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
 import evalsub.util.constants as cst
-from evalsub.util.util import get_masses
+from evalsub.util.logs import cli_logging, get_logger
+from evalsub.util.profiling import profile_stage, profiled_main
+from evalsub.util.util import cached_ref, get_masses
+
+logger = get_logger(__name__)
 
 DESCRIPTION = """
 Script for computing precision/recall/F1 for the quality evaluation of subtitle segmentations 
@@ -40,10 +44,25 @@ def boundary_positions(masses):
 
 
 def f1_process(ref_file_path, sys_file_path, tag, srt=False, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
-    sys_eob_masses, sys_eol_masses, sys_eox_masses = get_masses(sys_file_path, srt=srt, line_tag=line_tag,
-                                                                caption_tag=caption_tag)
-    ref_eob_masses, ref_eol_masses, ref_eox_masses = get_masses(ref_file_path, srt=srt, line_tag=line_tag,
-                                                                caption_tag=caption_tag)
+    with profile_stage('preprocess'):
+        sys_masses = get_masses(sys_file_path, srt=srt, line_tag=line_tag, caption_tag=caption_tag)
+        ref_masses = cached_ref(get_masses, ref_file_path, srt=srt, line_tag=line_tag, caption_tag=caption_tag)
+
+    with profile_stage('metric:f1'):
+        return f1_scores(sys_masses, ref_masses, tag)
+
+
+def f1_scores(sys_masses, ref_masses, tag):
+    """
+    Precision, recall and F1 of the boundaries of a tag type.
+
+    :param sys_masses: system <eob>, <eol> and <eox> segmentation masses (see `get_masses`)
+    :param ref_masses: reference <eob>, <eol> and <eox> segmentation masses
+    :param tag: boundary type (`cst.CAPTION_TAG`, `cst.LINE_TAG`, or `cst.NEUTRAL_TAG` for both)
+    :return: precision, recall and F1 (-1 if undefined)
+    """
+    sys_eob_masses, sys_eol_masses, sys_eox_masses = sys_masses
+    ref_eob_masses, ref_eol_masses, ref_eox_masses = ref_masses
 
     if tag == cst.CAPTION_TAG:
         sys_masses, ref_masses = sys_eob_masses, ref_eob_masses
@@ -65,10 +84,10 @@ def f1_process(ref_file_path, sys_file_path, tag, srt=False, line_tag=cst.LINE_T
         f1 = 2 * precision * recall / (precision + recall)
     except ZeroDivisionError:
         precision, recall, f1 = -1, -1, -1
-    print("Scores for", tag)
-    print("Precision: %.3f" % precision)
-    print("Recall: %.3f" % recall)
-    print("F1 score: %.3f" % f1)
+    logger.info("Scores for %s", tag)
+    logger.info("Precision: %.3f", precision)
+    logger.info("Recall: %.3f", recall)
+    logger.info("F1 score: %.3f", f1)
     return precision, recall, f1
 
 
@@ -81,6 +100,9 @@ def parse_args():
                         help="Segmented subtitle file to evaluate.")
     parser.add_argument('--srt', '-srt', action='store_true',
                         help="Whether the subtitle files are in srt format.")
+    parser.add_argument('--profile', '-prof', action='store_true',
+                        help="Whether to profile the evaluation stages (wall time, CPU time and peak memory), and "
+                             "print them.")
 
     args = parser.parse_args()
     return args
@@ -100,4 +122,6 @@ def main(args):
 
 
 if __name__ == '__main__':
-    main(parse_args())
+    cli_logging()
+    args = parse_args()
+    profiled_main(main, args, profile=args.profile)
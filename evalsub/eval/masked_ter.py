@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+TER engine specialized for masked sentences (TER_br).
+
+Once masked, sentences are made of 3 tokens only (`cst.MASK_CHAR`, `cst.LINE_HOLDER` and `cst.CAPTION_HOLDER`), so
+that nearly every hypothesis position matches many reference positions and sacrebleu spends most of its time
+evaluating shift candidates one by one. This engine follows exactly the same heuristics as sacrebleu's TER
+(beam edit distance, Tercom shift ranking, candidate limits), so that it gives the same scores, but:
+    - tokens are encoded as small integers,
+    - matching sub-sequences are found from the run lengths of matches along the diagonals within the maximum shift
+      distance, by blocks of hypothesis positions (enumerated until the candidate limit is reached),
+    - shift candidates are filtered with prefix sums instead of being checked one by one,
+    - all the candidates of a shift step are scored at once, with a banded edit distance computed
+      row by row on a (n_candidates, reference_length) matrix, starting from the first modified row,
+    - sentence pairs that occur several times are only scored once.
+"""
+
+import math
+
+import numpy as np
+
+# Same limits as sacrebleu (and Tercom)
+MAX_SHIFT_SIZE = 10
+MAX_SHIFT_DIST = 50
+BEAM_WIDTH = 25
+MAX_SHIFT_CANDIDATES = 1000
+# Number of hypothesis positions whose matching sub-sequences are enumerated at once
+SHIFT_BLOCK_SIZE = 256
+INF = int(1e16)
+
+OP_NOP = 0
+OP_SUB = 1
+OP_INS = 2
+OP_DEL = 3
+
+
+def encode(sents, vocab):
+    """
+    Tokenize sentences as sacrebleu's default TER (lowercasing, whitespace splitting) and encode the tokens as
+    integers.
+
+    :param sents: sentences
+    :param vocab: token to integer dictionary (updated with new tokens)
+    :return: list of integer arrays
+    """
+    return [np.array([vocab.setdefault(token, len(vocab)) for token in sent.rstrip().lower().split()],
+                     dtype='int64')
+            for sent in sents]
+
+
+def beam_bounds(n_h, n_r):
+    """
+    Column range [min_j, max_j) explored for each row of the beam edit distance matrix.
+    """
+    length_ratio = n_r / n_h if n_h else 1
+    if BEAM_WIDTH < length_ratio / 2:
+        beam_width = math.ceil(length_ratio / 2 + BEAM_WIDTH)
+    else:
+        beam_width = BEAM_WIDTH
+
+    bounds = [(0, n_r + 1)]
+    for i in range(1, n_h + 1):
+        pseudo_diag = math.floor(i * length_ratio)
+        min_j = max(0, pseudo_diag - beam_width)
+        max_j = min(n_r + 1, pseudo_diag + beam_width)
+        if i == n_h:
+            max_j = n_r + 1
+        bounds.append((min_j, max_j))
+
+    return bounds
+
+
+def next_rows(prev_rows, tokens, words_r, min_j, max_j):
+    """
+    Compute the next row of the beam edit distance matrix, for several hypotheses at once.
+
+    :param prev_rows: previous rows, of shape (n_hypotheses, n_r + 1)
+    :param tokens: current token of each hypothesis
+    :param words_r: reference tokens
+    :param min_j: first column within the beam
+    :param max_j: last column within the beam (excluded)
+    :return: next rows
+    """
+    rows = np.full_like(prev_rows, INF)
+    costs = np.full_like(prev_rows, INF)
+    if min_j == 0:
+        costs[:, 0] = prev_rows[:, 0] + 1
+    start_j = max(min_j, 1)
+    if start_j < max_j:
+        sub_costs = prev_rows[:, start_j - 1:max_j - 1] + (tokens[:, None] != words_r[None, start_j - 1:max_j - 1])
+        del_costs = prev_rows[:, start_j:max_j] + 1
+        costs[:, start_j:max_j] = np.minimum(np.minimum(sub_costs, del_costs), INF)
+    # Insertions chain along the row: row[j] = min_k(cost[k] + j - k)
+    offsets = np.arange(min_j, max_j)
+    rows[:, min_j:max_j] = np.minimum.accumulate(costs[:, min_j:max_j] - offsets, axis=1) + offsets
+
+    return rows
+
+
+def edit_distance_matrix(words_h, words_r, bounds):
+    """
+    Full beam edit distance matrix between a hypothesis and the reference.
+    """
+    dist = np.empty((len(words_h) + 1, len(words_r) + 1), dtype='int64')
+    dist[0] = np.arange(len(words_r) + 1)
+    for i in range(1, len(words_h) + 1):
+        min_j, max_j = bounds[i]
+        dist[i] = next_rows(dist[i - 1:i], words_h[i - 1:i], words_r, min_j, max_j)[0]
+
+    return dist
+
+
+def alignment(dist, words_h, words_r):
+    """
+    Alignment between the reference and the hypothesis, following the edit operations preferred by sacrebleu.
+
+    :return: hypothesis position aligned to each reference position, and error flags of hypothesis and reference
+        positions
+    """
+    i, j = len(words_h), len(words_r)
+    ops = list()
+    while i > 0 or j > 0:
+        if i == 0:
+            op = OP_INS
+        elif j == 0:
+            op = OP_DEL
+        else:
+            d = dist[i, j]
+            if d >= INF:
+                raise Exception("no edit operation at (%d, %d)" % (i, j))
+            sub_cost = int(words_h[i - 1] != words_r[j - 1])
+            if dist[i - 1, j - 1] + sub_cost == d:
+                op = OP_SUB if sub_cost else OP_NOP
+            elif dist[i - 1, j] + 1 == d:
+                op = OP_DEL
+            else:
+                op = OP_INS
+        ops.append(op)
+        if op in (OP_NOP, OP_SUB):
+            i -= 1
+            j -= 1
+        elif op == OP_INS:
+            j -= 1
+        else:
+            i -= 1
+
+    align = np.empty(len(words_r), dtype='int64')
+    hyp_err = np.zeros(len(words_h), dtype='int64')
+    ref_err = np.zeros(len(words_r), dtype='int64')
+    pos_h = pos_r = -1
+    for op in reversed(ops):
+        if op == OP_DEL:
+            pos_h += 1
+            hyp_err[pos_h] = 1
+        elif op == OP_INS:
+            pos_r += 1
+            align[pos_r] = pos_h
+            ref_err[pos_r] = 1
+        else:
+            pos_h += 1
+            pos_r += 1
+            align[pos_r] = pos_h
+            if op == OP_SUB:
+                hyp_err[pos_h] = 1
+                ref_err[pos_r] = 1
+
+    return align, hyp_err, ref_err
+
+
+def shifted_pairs(words_h, words_r, block_size=SHIFT_BLOCK_SIZE):
+    """
+    Matching sub-sequences (start_h, start_r, length), in the order sacrebleu enumerates them, by blocks of
+    `block_size` hypothesis start positions. Only the diagonals within `MAX_SHIFT_DIST` are computed, so that memory
+    does not grow with the product of the sentence lengths.
+
+    :return: generator of (starts_h, starts_r, lengths) arrays
+    """
+    n_h, n_r = len(words_h), len(words_r)
+    # Offsets start_r - start_h of the diagonals
+    offsets = np.arange(max(-MAX_SHIFT_DIST, 1 - n_h), min(MAX_SHIFT_DIST, n_r - 1) + 1)
+    if n_h == 0 or n_r == 0 or len(offsets) == 0:
+        return
+
+    # Padding tokens which match no token (the hypothesis and reference ones differ)
+    padded_h = np.full(n_h + MAX_SHIFT_SIZE, -1, dtype='int64')
+    padded_h[:n_h] = words_h
+    pad_r = -offsets[0]
+    padded_r = np.full(pad_r + max(n_r, n_h + MAX_SHIFT_SIZE + offsets[-1]), -2, dtype='int64')
+    padded_r[pad_r:pad_r + n_r] = words_r
+
+    for start in range(0, n_h, block_size):
+        n_block = min(block_size, n_h - start)
+        positions_h = np.arange(start, start + n_block + MAX_SHIFT_SIZE - 1)
+        # matches[h, k] is True iff words_h[start+h] == words_r[start+h+offsets[k]]
+        matches = padded_h[positions_h, None] == padded_r[pad_r + positions_h[:, None] + offsets[None, :]]
+        # run[h, k, l] is True iff the l+1 words from start+h match along the diagonal k
+        runs = np.empty((n_block, len(offsets), MAX_SHIFT_SIZE), dtype=bool)
+        runs[:, :, 0] = matches[:n_block]
+        for length in range(1, MAX_SHIFT_SIZE):
+            runs[:, :, length] = runs[:, :, length - 1] & matches[length:length + n_block]
+
+        starts_h, diagonals, lengths = np.nonzero(runs)
+        starts_h += start
+        yield starts_h, starts_h + offsets[diagonals], lengths + 1
+
+
+def perform_shift(words, start, length, target):
+    if target < start:
+        return np.concatenate((words[:target], words[start:start + length], words[target:start],
+                               words[start + length:]))
+    elif target > start + length:
+        return np.concatenate((words[:start], words[start + length:target], words[start:start + length],
+                               words[target:]))
+    else:
+        return np.concatenate((words[:start], words[start + length:length + target], words[start:start + length],
+                               words[length + target:]))
+
+
+def shift(words_h, words_r, bounds, checked_candidates):
+    """
+    Find the shift that reduces the edit distance the most (see sacrebleu's `_shift`).
+
+    :return: (edit distance before shift, score, shifted words, checked candidates)
+    """
+    dist = edit_distance_matrix(words_h, words_r, bounds)
+    pre_score = int(dist[-1, -1])
+    align, hyp_err, ref_err = alignment(dist, words_h, words_r)
+
+    hyp_err_sums = np.concatenate(([0], np.cumsum(hyp_err)))
+    ref_err_sums = np.concatenate(([0], np.cumsum(ref_err)))
+
+    def kept_pairs():
+        for starts_h, starts_r, lengths in shifted_pairs(words_h, words_r):
+            kept = ((hyp_err_sums[starts_h + lengths] - hyp_err_sums[starts_h]) > 0) \
+                & ((ref_err_sums[starts_r + lengths] - ref_err_sums[starts_r]) > 0)
+            aligned_h = align[starts_r]
+            kept &= ~((starts_h <= aligned_h) & (aligned_h < starts_h + lengths))
+            yield from zip(starts_h[kept].tolist(), starts_r[kept].tolist(), lengths[kept].tolist())
+
+    candidates = list()
+    for start_h, start_r, length in kept_pairs():
+        prev_idx = -1
+        for offset in range(-1, length):
+            if start_r + offset == -1:
+                idx = 0
+            elif start_r + offset < len(words_r):
+                idx = int(align[start_r + offset]) + 1
+            else:
+                break
+            if idx == prev_idx:
+                continue
+            prev_idx = idx
+            candidates.append((start_h, length, idx))
+            checked_candidates += 1
+
+        if checked_candidates >= MAX_SHIFT_CANDIDATES:
+            break
+
+    if not candidates:
+        return pre_score, 0, words_h, checked_candidates
+
+    # Scoring all the distinct shifted hypotheses at once
+    unique = dict()
+    for start_h, length, idx in candidates:
+        key = (start_h, length, idx)
+        if key not in unique:
+            unique[key] = perform_shift(words_h, start_h, length, idx)
+    keys = list(unique)
+    shifted = np.stack([unique[key] for key in keys])
+    first_row = min(min(start_h, idx) for start_h, _, idx in keys)
+    rows = np.repeat(dist[first_row:first_row + 1], len(keys), axis=0)
+    for i in range(first_row + 1, len(words_h) + 1):
+        min_j, max_j = bounds[i]
+        rows = next_rows(rows, shifted[:, i - 1], words_r, min_j, max_j)
+    scores = dict(zip(keys, (pre_score - rows[:, -1]).tolist()))
+
+    # Same ranking as sacrebleu: highest score, longest match, earliest match, earliest target position
+    best = max(keys, key=lambda k: (scores[k], k[1], -k[0], -k[2]))
+    return pre_score, scores[best], unique[best], checked_candidates
+
+
+def translation_edit_rate(words_h, words_r):
+    """
+    Number of edits (shifts included) and reference length, as sacrebleu's `translation_edit_rate`.
+    """
+    n_r = len(words_r)
+    if n_r == 0:
+        return len(words_h), 0
+
+    bounds = beam_bounds(len(words_h), n_r)
+    n_shifts = 0
+    checked_candidates = 0
+    while True:
+        edit_distance, delta, shifted_words, checked_candidates = shift(words_h, words_r, bounds,
+                                                                        checked_candidates)
+        if checked_candidates >= MAX_SHIFT_CANDIDATES or delta <= 0:
+            break
+        n_shifts += 1
+        words_h = shifted_words
+
+    return n_shifts + edit_distance, n_r
+
+
+def masked_ter_stats(sys_sents, ref_sents):
+    """
+    Sentence-level TER statistics [number of edits, reference length], as sacrebleu's
+    `TER._extract_corpus_statistics` with a single reference.
+    """
+    vocab = dict()
+    sys_words = encode(sys_sents, vocab)
+    ref_words = encode(ref_sents, vocab)
+
+    stats = list()
+    cache = dict()
+    for words_h, words_r in zip(sys_words, ref_words):
+        key = (words_h.tobytes(), words_r.tobytes())
+        if key not in cache:
+            n_edits, ref_len = translation_edit_rate(words_h, words_r)
+            cache[key] = [n_edits, ref_len / 1]
+        stats.append(list(cache[key]))
+
+    return stats
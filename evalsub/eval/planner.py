@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Preprocessing planner for the evaluation of a system.
+
+Each metric declares the representations of the reference and system files it consumes (`METRIC_INPUTS`), and each
+representation is computed by a preprocessing stage from other representations (`STAGES`). For a set of metrics,
+`plan` gives the stages they need (dependencies included), in order, and `run_plan` computes each of them once, so
+that metrics sharing representations share their preprocessing.
+
+Stage and metric implementations are imported on demand, so that only the modules of the requested metrics are loaded.
+"""
+
+from importlib import import_module
+import os
+import sys
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+import evalsub.util.constants as cst
+from evalsub.util.profiling import profile_stage
+
+# Representations
+REF_MASSES = 'ref_masses'  # <eob>, <eol> and <eox> segmentation masses
+SYS_MASSES = 'sys_masses'
+REF_SETS = 'ref_sets'  # boundary sets
+SYS_SETS = 'sys_sets'
+REF_TAGGED_STR = 'ref_tagged_str'  # text with 1-char boundary placeholders
+SYS_TAGGED_STR = 'sys_tagged_str'
+SYS_ALIGNED_STR = 'sys_aligned_str'  # system text with placeholders, segmented as the reference sentences
+REF_SENTS = 'ref_sents'  # reference sentences with and without boundaries
+PLACEHOLDER_SENTS = 'placeholder_sents'  # alpha, and sentences with and without boundaries (Sigma, BLEU)
+REF_MASKED_SENTS = 'ref_masked_sents'
+MASKED_SENTS = 'masked_sents'  # masked sentences (TER_br)
+CAPTIONS = 'captions'  # system lines by caption (CPL)
+
+
+def stage_ref_masses(settings):
+    from evalsub.util.util import cached_ref, get_masses
+    return cached_ref(get_masses, settings['ref_file_path'], srt=settings['srt'], line_tag=cst.LINE_TAG,
+                      caption_tag=cst.CAPTION_TAG)
+
+
+def stage_sys_masses(settings):
+    from evalsub.util.util import get_masses
+    return get_masses(settings['sys_file_path'], srt=settings['srt'], line_tag=cst.LINE_TAG,
+                      caption_tag=cst.CAPTION_TAG)
+
+
+def stage_sets(settings, masses):
+    from evalsub.eval.seg_eval import masses_to_sets
+    return masses_to_sets(*masses)
+
+
+def ref_sets(ref_file_path, srt=False):
+    from evalsub.eval.seg_eval import masses_to_sets
+    return masses_to_sets(*stage_ref_masses(dict(ref_file_path=ref_file_path, srt=srt)))
+
+
+def stage_ref_sets(settings):
+    from evalsub.util.util import cached_ref
+    return cached_ref(ref_sets, settings['ref_file_path'], srt=settings['srt'])
+
+
+def stage_ref_tagged_str(settings):
+    from evalsub.util.util import cached_ref, preprocess
+    return cached_ref(preprocess, settings['ref_file_path'], line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
+                      line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER, srt=settings['srt'])
+
+
+def stage_sys_tagged_str(settings):
+    from evalsub.util.util import preprocess
+    return preprocess(settings['sys_file_path'], line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
+                      line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER, srt=settings['srt'])
+
+
+def stage_sys_aligned_str(settings, ref_tagged_str, sys_tagged_str):
+    if not settings['auto_seg']:
+        return sys_tagged_str
+
+    from evalsub.util.util import suber_auto_seg
+    return suber_auto_seg(ref_tagged_str, sys_tagged_str, line_holder=cst.LINE_HOLDER,
+                          caption_holder=cst.CAPTION_HOLDER, sys_file_path=settings['sys_file_path'],
+                          max_chunk_size=settings['auto_seg_chunk_size'], n_jobs=settings['auto_seg_jobs'],
+                          cache_dir_path=settings['auto_seg_cache_dir_path'],
+                          out_dir_path=settings['auto_seg_out_dir_path'])
+
+
+def ref_sents(ref_file_path, srt=False):
+    from evalsub.eval.sigma_eval import sigma_preprocess_aux
+    _, sents, tagged_sents = sigma_preprocess_aux(stage_ref_tagged_str(dict(ref_file_path=ref_file_path, srt=srt)))
+
+    return sents, tagged_sents
+
+
+def stage_ref_sents(settings):
+    from evalsub.util.util import cached_ref
+    return cached_ref(ref_sents, settings['ref_file_path'], srt=settings['srt'])
+
+
+def stage_placeholder_sents(settings, ref_sents, sys_aligned_str):
+    from evalsub.eval.sigma_eval import sigma_preprocess_aux
+    alpha, sys_sents, sys_tagged_sents = sigma_preprocess_aux(sys_aligned_str)
+
+    return (alpha, *ref_sents, sys_sents, sys_tagged_sents)
+
+
+def ref_masked_sents(ref_file_path, srt=False):
+    from evalsub.eval.ter_eval import ter_preprocess_aux
+    return ter_preprocess_aux(stage_ref_tagged_str(dict(ref_file_path=ref_file_path, srt=srt)))
+
+
+def stage_ref_masked_sents(settings):
+    from evalsub.util.util import cached_ref
+    return cached_ref(ref_masked_sents, settings['ref_file_path'], srt=settings['srt'])
+
+
+def stage_masked_sents(settings, ref_masked_sents, sys_aligned_str):
+    from evalsub.eval.ter_eval import ter_preprocess_aux
+    return ref_masked_sents, ter_preprocess_aux(sys_aligned_str)
+
+
+def stage_captions(settings):
+    from evalsub.eval.cpl_eval import read_captions
+    captions, _ = read_captions(settings['sys_file_path'], srt=settings['srt'])
+
+    return captions
+
+
+# Preprocessing stages: representation -> (representations it is computed from, function), in topological order.
+# Stage functions take the evaluation settings (see `run_plan`), then the representations they depend on.
+STAGES = {
+    REF_MASSES: ((), stage_ref_masses),
+    SYS_MASSES: ((), stage_sys_masses),
+    REF_SETS: ((), stage_ref_sets),
+    SYS_SETS: ((SYS_MASSES,), stage_sets),
+    REF_TAGGED_STR: ((), stage_ref_tagged_str),
+    SYS_TAGGED_STR: ((), stage_sys_tagged_str),
+    SYS_ALIGNED_STR: ((REF_TAGGED_STR, SYS_TAGGED_STR), stage_sys_aligned_str),
+    REF_SENTS: ((), stage_ref_sents),
+    PLACEHOLDER_SENTS: ((REF_SENTS, SYS_ALIGNED_STR), stage_placeholder_sents),
+    REF_MASKED_SENTS: ((), stage_ref_masked_sents),
+    MASKED_SENTS: ((REF_MASKED_SENTS, SYS_ALIGNED_STR), stage_masked_sents),
+    CAPTIONS: ((), stage_captions),
+}
+
+# Representations of the reference only, cached per process (see `cached_ref`)
+REF_REPRESENTATIONS = (REF_MASSES, REF_SETS, REF_TAGGED_STR, REF_SENTS, REF_MASKED_SENTS)
+
+SEG_INPUTS = (SYS_MASSES, REF_MASSES, SYS_SETS, REF_SETS)
+SIGMA_INPUTS = (PLACEHOLDER_SENTS,)
+F1_INPUTS = (SYS_MASSES, REF_MASSES)
+
+# Representations consumed by each metric
+METRIC_INPUTS = {
+    cst.PK: SEG_INPUTS,
+    cst.WIN_DIFF: SEG_INPUTS,
+    cst.SEG_SIM: SEG_INPUTS,
+    cst.BOUND_SIM: SEG_INPUTS,
+    cst.CPL_CONF: (CAPTIONS,),
+    cst.BLEU_BR: SIGMA_INPUTS,
+    cst.BLEU_NB: SIGMA_INPUTS,
+    cst.SIGMA: SIGMA_INPUTS,
+    cst.TER_BR: (MASKED_SENTS,),
+    cst.PRECISION: F1_INPUTS,
+    cst.RECALL: F1_INPUTS,
+    cst.F1: F1_INPUTS,
+}
+
+# Metric registry: metric -> (module, function) computing the metric (and the other metrics of its family) from its
+# inputs (see `load_metric`)
+METRIC_REGISTRY = {
+    cst.PK: ('evalsub.eval.seg_eval', 'seg_scores'),
+    cst.WIN_DIFF: ('evalsub.eval.seg_eval', 'seg_scores'),
+    cst.SEG_SIM: ('evalsub.eval.seg_eval', 'seg_scores'),
+    cst.BOUND_SIM: ('evalsub.eval.seg_eval', 'seg_scores'),
+    cst.CPL_CONF: ('evalsub.eval.cpl_eval', 'cpl_scores'),
+    cst.BLEU_BR: ('evalsub.eval.sigma_eval', 'sigma_scores'),
+    cst.BLEU_NB: ('evalsub.eval.sigma_eval', 'sigma_scores'),
+    cst.SIGMA: ('evalsub.eval.sigma_eval', 'sigma_scores'),
+    cst.TER_BR: ('evalsub.eval.ter_eval', 'ter_scores'),
+    cst.PRECISION: ('evalsub.eval.f1_eval', 'f1_scores'),
+    cst.RECALL: ('evalsub.eval.f1_eval', 'f1_scores'),
+    cst.F1: ('evalsub.eval.f1_eval', 'f1_scores'),
+}
+
+
+def load_metric(metric):
+    """
+    Function computing a metric (see `METRIC_REGISTRY`), imported on demand.
+    """
+    module_name, function_name = METRIC_REGISTRY[metric]
+
+    return getattr(import_module(module_name), function_name)
+
+
+def plan(metrics):
+    """
+    Preprocessing stages needed by metrics.
+
+    :param metrics: metric names (names without inputs, e.g. alpha, are ignored)
+    :return: list of representations to compute, in topological order
+    """
+    needed = set()
+    pending = [representation for metric in metrics for representation in METRIC_INPUTS.get(metric, ())]
+    while pending:
+        representation = pending.pop()
+        if representation not in needed:
+            needed.add(representation)
+            pending.extend(STAGES[representation][0])
+
+    return [representation for representation in STAGES if representation in needed]
+
+
+def warm_ref(ref_file_path, metrics, srt=False):
+    """
+    Preprocess a reference for metrics, so that the representations of the reference are cached in the process.
+    """
+    run_plan([representation for representation in plan(metrics) if representation in REF_REPRESENTATIONS],
+             ref_file_path, None, srt=srt)
+
+
+def run_plan(stages, ref_file_path, sys_file_path, srt=False, auto_seg=False, auto_seg_chunk_size=None,
+             auto_seg_jobs=1, auto_seg_cache_dir_path=cst.CACHE_DIR_PATH, auto_seg_out_dir_path=None):
+    """
+    Run preprocessing stages, each one once.
+
+    :param stages: representations to compute, in topological order (see `plan`)
+    :param ref_file_path: reference segmented subtitle file
+    :param sys_file_path: system segmented subtitle file
+    :param srt: whether the subtitle files are in srt format
+    :param auto_seg: whether to use automatic segmentation for system sequences
+    :return: dictionary of representations
+    """
+    settings = dict(ref_file_path=ref_file_path, sys_file_path=sys_file_path, srt=srt, auto_seg=auto_seg,
+                    auto_seg_chunk_size=auto_seg_chunk_size, auto_seg_jobs=auto_seg_jobs,
+                    auto_seg_cache_dir_path=auto_seg_cache_dir_path, auto_seg_out_dir_path=auto_seg_out_dir_path)
+
+    outputs = dict()
+    for representation in stages:
+        dependencies, stage_fn = STAGES[representation]
+        with profile_stage('preprocess:%s' % representation):
+            outputs[representation] = stage_fn(settings, *[outputs[dependency] for dependency in dependencies])
+
+    return outputs
@@ -24,7 +24,11 @@ if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
 import evalsub.util.constants as cst
-from evalsub.util.util import get_masses
+from evalsub.util.logs import cli_logging, get_logger
+from evalsub.util.profiling import profile_stage, profiled_main
+from evalsub.util.util import cached_ref, get_masses
+
+logger = get_logger(__name__)
 
 DESCRIPTION = """
 Script to compute the standard segmentation metrics for a pair of segmented subtitle files.
@@ -60,123 +64,124 @@ def eval_seg(sys_file_path, ref_file_path, metrics=METRICS, srt=False, ttml=Fals
              eob_window_size=None, eox_window_size=None, nt=cst.DEFAULT_NT, line_tag=cst.LINE_TAG,
              caption_tag=cst.CAPTION_TAG):
 
-    sys_eob_masses, sys_eol_masses, sys_eox_masses = get_masses(sys_file_path, srt=srt, ttml=ttml, line_tag=line_tag,
-                                                                caption_tag=caption_tag)
-    ref_eob_masses, ref_eol_masses, ref_eox_masses = get_masses(ref_file_path, srt=srt, ttml=ttml, line_tag=line_tag,
-                                                                caption_tag=caption_tag)
-    sys_eob_sets, sys_eol_sets, sys_eox_sets, sys_eob_eol_sets = masses_to_sets(sys_eob_masses, sys_eol_masses,
-                                                                                sys_eox_masses)
-    ref_eob_sets, ref_eol_sets, ref_eox_sets, ref_eob_eol_sets = masses_to_sets(ref_eob_masses, ref_eol_masses,
-                                                                                ref_eox_masses)
+    with profile_stage('preprocess'):
+        sys_eob_masses, sys_eol_masses, sys_eox_masses = get_masses(sys_file_path, srt=srt, ttml=ttml,
+                                                                    line_tag=line_tag, caption_tag=caption_tag)
+        ref_eob_masses, ref_eol_masses, ref_eox_masses = cached_ref(get_masses, ref_file_path, srt=srt, ttml=ttml,
+                                                                    line_tag=line_tag, caption_tag=caption_tag)
+        sys_eob_sets, sys_eol_sets, sys_eox_sets, sys_eob_eol_sets = masses_to_sets(sys_eob_masses, sys_eol_masses,
+                                                                                    sys_eox_masses)
+        ref_eob_sets, ref_eol_sets, ref_eox_sets, ref_eob_eol_sets = masses_to_sets(ref_eob_masses, ref_eol_masses,
+                                                                                    ref_eox_masses)
 
     results = dict()
 
-    print('<eob> only segmentation:')
+    logger.info('<eob> only segmentation:')
     results[EOB] = dict()
     # Window size is computed only if Pk or WindowDiff is computed
     if cst.PK in metrics or cst.WIN_DIFF in metrics:
         if eob_window_size is None:
             eob_window_size = segeval.compute_window_size(ref_eob_masses)
-        print('  window_size =', eob_window_size)
+        logger.info('  window_size = %s', eob_window_size)
         results[EOB]['window_size'] = eob_window_size
     # Case where Pk is computed
     if cst.PK in metrics:
         eob_pk = segeval.pk(sys_eob_masses, ref_eob_masses, window_size=eob_window_size)
-        print('  Pk = %.3f' % eob_pk)
+        logger.info('  Pk = %.3f', eob_pk)
         results[EOB][cst.PK] = float(eob_pk)
     # Case where WindowDiff is computed
     if cst.WIN_DIFF in metrics:
         eob_window_diff = segeval.window_diff(sys_eob_masses, ref_eob_masses, window_size=eob_window_size)
-        print('  WindowDiff = %.3f' % eob_window_diff)
+        logger.info('  WindowDiff = %.3f', eob_window_diff)
         results[EOB][cst.WIN_DIFF] = float(eob_window_diff)
     # Case where Segmentation Similarity is computed
     if cst.SEG_SIM in metrics:
         eob_seg_sim = segeval.segmentation_similarity(sys_eob_sets, ref_eob_sets,
                                                       boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-        print('  S = %.3f' % eob_seg_sim)
+        logger.info('  S = %.3f', eob_seg_sim)
         results[EOB][cst.SEG_SIM] = float(eob_seg_sim)
     # Case where Boundary Similarity is computed
     if cst.BOUND_SIM in metrics:
         eob_bound_sim = segeval.boundary_similarity(sys_eob_sets, ref_eob_sets,
                                                     boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-        print('  B = %.3f' % eob_bound_sim)
+        logger.info('  B = %.3f', eob_bound_sim)
         results[EOB][cst.BOUND_SIM] = float(eob_bound_sim)
 
-    print('<eol> only segmentation:')
+    logger.info('<eol> only segmentation:')
     results[EOL] = dict()
     # Window size is computed only if Pk or WindowDiff is computed
     if cst.PK in metrics or cst.WIN_DIFF in metrics:
         if eol_window_size is None:
             eol_window_size = segeval.compute_window_size(ref_eol_masses)
-        print('  window_size =', eol_window_size)
+        logger.info('  window_size = %s', eol_window_size)
         results[EOL]['window_size'] = eol_window_size
     # Case where Pk is computed
     if cst.PK in metrics:
         eol_pk = segeval.pk(sys_eol_masses, ref_eol_masses, window_size=eol_window_size)
-        print('  Pk = %.3f' % eol_pk)
+        logger.info('  Pk = %.3f', eol_pk)
         results[EOL][cst.PK] = float(eol_pk)
     # Case where WindowDiff is computed
     if cst.WIN_DIFF in metrics:
         eol_window_diff = segeval.window_diff(sys_eol_masses, ref_eol_masses, window_size=eol_window_size)
-        print('  WindowDiff = %.3f' % eol_window_diff)
+        logger.info('  WindowDiff = %.3f', eol_window_diff)
         results[EOL][cst.WIN_DIFF] = float(eol_window_diff)
     # Case where Segmentation Similarity is computed
     if cst.SEG_SIM in metrics:
         eol_seg_sim = segeval.segmentation_similarity(sys_eol_sets, ref_eol_sets,
                                                       boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-        print('  S = %.3f' % eol_seg_sim)
+        logger.info('  S = %.3f', eol_seg_sim)
         results[EOL][cst.SEG_SIM] = float(eol_seg_sim)
     # Case where Boundary Similarity is computed
     if cst.BOUND_SIM in metrics:
         eol_bound_sim = segeval.boundary_similarity(sys_eol_sets, ref_eol_sets,
                                                     boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-        print('  B = %.3f' % eol_bound_sim)
+        logger.info('  B = %.3f', eol_bound_sim)
         results[EOL][cst.BOUND_SIM] = float(eol_bound_sim)
 
-    print('<eox> segmentation:')
+    logger.info('<eox> segmentation:')
     results[EOX] = dict()
     # Window size is computed only if Pk or WindowDiff is computed
     if cst.PK in metrics or cst.WIN_DIFF in metrics:
         if eox_window_size is None:
             eox_window_size = segeval.compute_window_size(ref_eox_masses)
-        print('  window_size =', eox_window_size)
+        logger.info('  window_size = %s', eox_window_size)
         results[EOX]['window_size'] = eox_window_size
     # Case where Pk is computed
     if cst.PK in metrics:
         eox_pk = segeval.pk(sys_eox_masses, ref_eox_masses, window_size=eox_window_size)
-        print('  Pk = %.3f' % eox_pk)
+        logger.info('  Pk = %.3f', eox_pk)
         results[EOX][cst.PK] = float(eox_pk)
     # Case where WindowDiff is computed
     if cst.WIN_DIFF in metrics:
         eox_window_diff = segeval.window_diff(sys_eox_masses, ref_eox_masses, window_size=eox_window_size)
-        print('  WindowDiff = %.3f' % eox_window_diff)
+        logger.info('  WindowDiff = %.3f', eox_window_diff)
         results[EOX][cst.WIN_DIFF] = float(eox_window_diff)
     # Case where Segmentation Similarity is computed
     if cst.SEG_SIM in metrics:
         eox_seg_sim = segeval.segmentation_similarity(sys_eox_sets, ref_eox_sets,
                                                       boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-        print('  S = %.3f' % eox_seg_sim)
+        logger.info('  S = %.3f', eox_seg_sim)
         results[EOX][cst.SEG_SIM] = float(eox_seg_sim)
     # Case where Boundary Similarity is computed
     if cst.BOUND_SIM in metrics:
         eox_bound_sim = segeval.boundary_similarity(sys_eox_sets, ref_eox_sets,
                                                     boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-        print('  B = %.3f' % eox_bound_sim)
+        logger.info('  B = %.3f', eox_bound_sim)
         results[EOX][cst.BOUND_SIM] = float(eox_bound_sim)
 
-    print('<eob>,<eol> segmentation:')
+    logger.info('<eob>,<eol> segmentation:')
     results[EOB_EOL] = dict()
     # Case where Segmentation Similarity is computed
     if cst.SEG_SIM in metrics:
         eob_eol_seg_sim = segeval.segmentation_similarity(sys_eob_eol_sets, ref_eob_eol_sets,
                                                           boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-        print('  S = %.3f' % eob_eol_seg_sim)
+        logger.info('  S = %.3f', eob_eol_seg_sim)
         results[EOB_EOL][cst.SEG_SIM] = float(eob_eol_seg_sim)
     # Case where Boundary Similarity is computed
     if cst.BOUND_SIM in metrics:
         eob_eol_bound_sim = segeval.boundary_similarity(sys_eob_eol_sets, ref_eob_eol_sets,
                                                         boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-        print('  B = %.3f' % eob_eol_bound_sim)
+        logger.info('  B = %.3f', eob_eol_bound_sim)
         results[EOB_EOL][cst.BOUND_SIM] = float(eob_eol_bound_sim)
 
     return results
@@ -185,40 +190,56 @@ def eval_seg(sys_file_path, ref_file_path, metrics=METRICS, srt=False, ttml=Fals
 def seg_process(sys_file_path, ref_file_path, srt=False, ttml=False, window_size=None, nt=cst.DEFAULT_NT,
                 line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
 
-    sys_eob_masses, sys_eol_masses, sys_eox_masses = get_masses(sys_file_path, srt=srt, ttml=ttml, line_tag=line_tag,
-                                                                caption_tag=caption_tag)
-    ref_eob_masses, ref_eol_masses, ref_eox_masses = get_masses(ref_file_path, srt=srt, ttml=ttml, line_tag=line_tag,
-                                                                caption_tag=caption_tag)
-    sys_eob_sets, sys_eol_sets, sys_eox_sets, sys_eob_eol_sets = masses_to_sets(sys_eob_masses, sys_eol_masses,
-                                                                                sys_eox_masses)
-    ref_eob_sets, ref_eol_sets, ref_eox_sets, ref_eob_eol_sets = masses_to_sets(ref_eob_masses, ref_eol_masses,
-                                                                                ref_eox_masses)
+    sys_masses = get_masses(sys_file_path, srt=srt, ttml=ttml, line_tag=line_tag, caption_tag=caption_tag)
+    ref_masses = cached_ref(get_masses, ref_file_path, srt=srt, ttml=ttml, line_tag=line_tag, caption_tag=caption_tag)
+    sys_sets = masses_to_sets(*sys_masses)
+    ref_sets = masses_to_sets(*ref_masses)
+
+    return seg_scores(sys_masses, ref_masses, sys_sets, ref_sets, window_size=window_size, nt=nt, line_tag=line_tag,
+                      caption_tag=caption_tag)
+
+
+def seg_scores(sys_masses, ref_masses, sys_sets, ref_sets, window_size=None, nt=cst.DEFAULT_NT, line_tag=cst.LINE_TAG,
+               caption_tag=cst.CAPTION_TAG):
+    """
+    Standard segmentation metrics (Pk and WindowDiff on <eox> masses, SegSim and BoundSim on <eob>,<eol> sets).
+
+    :param sys_masses: system <eob>, <eol> and <eox> segmentation masses (see `get_masses`)
+    :param ref_masses: reference <eob>, <eol> and <eox> segmentation masses
+    :param sys_sets: system boundary sets (see `masses_to_sets`)
+    :param ref_sets: reference boundary sets
+    :return: window size, Pk, WindowDiff, SegSim, BoundSim
+    """
+    _, _, sys_eox_masses = sys_masses
+    _, _, ref_eox_masses = ref_masses
+    _, _, _, sys_eob_eol_sets = sys_sets
+    _, _, _, ref_eob_eol_sets = ref_sets
 
-    print('%s=%s segmentation:' % (line_tag, caption_tag))
+    logger.info('%s=%s segmentation:', line_tag, caption_tag)
     eox_window_size = window_size
     # Window size is computed
     if eox_window_size is None:
         eox_window_size = segeval.compute_window_size(ref_eox_masses)
-    print('  %s = %d' % (cst.WIN_SIZE, eox_window_size))
+    logger.info('  %s = %d', cst.WIN_SIZE, eox_window_size)
     # Pk is computed
     eox_pk = segeval.pk(sys_eox_masses, ref_eox_masses, window_size=eox_window_size)
-    print('  %s = %.3f' % (cst.PK, eox_pk))
+    logger.info('  %s = %.3f', cst.PK, eox_pk)
     pk = float(eox_pk)
     # WindowDiff is computed
     eox_window_diff = segeval.window_diff(sys_eox_masses, ref_eox_masses, window_size=eox_window_size)
-    print('  %s = %.3f' % (cst.WIN_DIFF, eox_window_diff))
+    logger.info('  %s = %.3f', cst.WIN_DIFF, eox_window_diff)
     window_diff = float(eox_window_diff)
 
-    print('%s,%s segmentation:' % (line_tag, caption_tag))
+    logger.info('%s,%s segmentation:', line_tag, caption_tag)
     # Segmentation Similarity is computed
     eob_eol_seg_sim = segeval.segmentation_similarity(sys_eob_eol_sets, ref_eob_eol_sets,
                                                       boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-    print('  %s = %.3f' % (cst.SEG_SIM, eob_eol_seg_sim))
+    logger.info('  %s = %.3f', cst.SEG_SIM, eob_eol_seg_sim)
     seg_sim = float(eob_eol_seg_sim)
     # Boundary Similarity is computed
     eob_eol_bound_sim = segeval.boundary_similarity(sys_eob_eol_sets, ref_eob_eol_sets,
                                                     boundary_format=segeval.BoundaryFormat.sets, n_t=nt)
-    print('  %s = %.3f' % (cst.BOUND_SIM, eob_eol_bound_sim))
+    logger.info('  %s = %.3f', cst.BOUND_SIM, eob_eol_bound_sim)
     bound_sim = float(eob_eol_bound_sim)
 
     return eox_window_size, pk, window_diff, seg_sim, bound_sim
@@ -252,6 +273,9 @@ def parse_args():
                         help="window size for the <eol> only segmentation evaluation")
     parser.add_argument('--eox_window_size', '-eoxws', type=int,
                         help="window size for the <eox> (<eol> = <eob>) segmentation evaluation")
+    parser.add_argument('--profile', '-prof', action='store_true',
+                        help="Whether to profile the evaluation stages (wall time, CPU time and peak memory), and "
+                             "print them.")
 
     args = parser.parse_args()
     return args
@@ -286,4 +310,6 @@ def main(args):
 
 
 if __name__ == '__main__':
-    main(parse_args())
+    cli_logging()
+    args = parse_args()
+    profiled_main(main, args, profile=args.profile)
@@ -11,6 +11,8 @@
 # limitations under the License
 
 import argparse
+from functools import partial
+import json
 from math import exp, log
 import os
 import re
@@ -26,14 +28,28 @@ toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
+from evalsub.util.bootstrap import adaptive_bs_sums, bs_sums, ci_bounds
 import evalsub.util.constants as cst
-from evalsub.util.util import preprocess, suber_auto_seg
+from evalsub.util.logs import cli_logging, get_logger
+from evalsub.util.profiling import profile_stage, profiled_main
+from evalsub.util.util import cached_ref, preprocess, suber_auto_seg
 
+logger = get_logger(__name__)
 
-def sigma_preprocess_aux(tagged_str):
+
+def boundary_counts(tagged_str):
+    """
+    Number of boundaries and number of words of a text with boundary placeholders (alpha being their ratio).
+    """
     n_boundaries = len(list(re.finditer(r"%s|%s" % (cst.LINE_HOLDER, cst.CAPTION_HOLDER), tagged_str)))
     n_words = len(list(re.finditer(r"[^ %s%s\r\n]+" % (cst.LINE_HOLDER, cst.CAPTION_HOLDER), tagged_str)))
 
+    return n_boundaries, n_words
+
+
+def sigma_preprocess_aux(tagged_str):
+    n_boundaries, n_words = boundary_counts(tagged_str)
+
     alpha = n_boundaries / n_words
 
     # Removing boundaries
@@ -57,15 +73,18 @@ def sigma_preprocess_aux(tagged_str):
     return alpha, sents, tagged_sents
 
 
-def sigma_preprocess(ref_file_path, sys_file_path, srt=False, auto_seg=False):
-    ref_tagged_str = preprocess(ref_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
+def sigma_preprocess(ref_file_path, sys_file_path, srt=False, auto_seg=False, auto_seg_chunk_size=None,
+                     auto_seg_jobs=1, auto_seg_cache_dir_path=cst.CACHE_DIR_PATH, auto_seg_out_dir_path=None):
+    ref_tagged_str = cached_ref(preprocess, ref_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
                                 line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER, srt=srt)
     sys_tagged_str = preprocess(sys_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
                                 line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER, srt=srt)
 
     if auto_seg:
         sys_tagged_str = suber_auto_seg(ref_tagged_str, sys_tagged_str, line_holder=cst.LINE_HOLDER,
-                                        caption_holder=cst.CAPTION_HOLDER, sys_file_path=sys_file_path)
+                                        caption_holder=cst.CAPTION_HOLDER, sys_file_path=sys_file_path,
+                                        max_chunk_size=auto_seg_chunk_size, n_jobs=auto_seg_jobs,
+                                        cache_dir_path=auto_seg_cache_dir_path, out_dir_path=auto_seg_out_dir_path)
 
     ref_alpha, ref_sents, ref_tagged_sents = sigma_preprocess_aux(ref_tagged_str)
     sys_alpha, sys_sents, sys_tagged_sents = sigma_preprocess_aux(sys_tagged_str)
@@ -88,20 +107,160 @@ def sigma(alpha, bleu_nb_score, bleu_br_score):
     return Score("Sigma", 100 * bleu_br / bleu_br_ub)
 
 
-def __bs_idxs(size, n_samples=1000):
+def bleu_np(stats, smooth_method='exp', smooth_value=None, effective_order=False, max_ngram_order=4):
+    """
+    Vectorized version of sacrebleu's `BLEU.compute_bleu`.
+
+    :param stats: array of BLEU statistics of shape (..., 2 + 2 * max_ngram_order),
+        laid out as [hyp_len, ref_len, correct_1..n, total_1..n]
+    :param smooth_method: smoothing method ('none', 'floor', 'add-k' or 'exp')
+    :param smooth_value: smoothing value for 'floor' and 'add-k' (None falls back to sacrebleu's default)
+    :param effective_order: whether to stop including n-gram orders with no hypothesis n-grams
+    :param max_ngram_order: maximum n-gram order
+    :return: BLEU scores, n-gram precisions (shape (..., max_ngram_order)) and brevity penalties
+    """
+    if smooth_value is None:
+        smooth_value = BLEU.SMOOTH_DEFAULTS[smooth_method]
+
+    stats = np.asarray(stats, dtype='float64')
+    sys_len = stats[..., 0]
+    ref_len = stats[..., 1]
+    correct = stats[..., 2:2 + max_ngram_order].copy()
+    total = stats[..., 2 + max_ngram_order:2 + 2 * max_ngram_order].copy()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Brevity penalty
+        bp = np.where(sys_len < ref_len, np.where(sys_len > 0, np.exp(1 - ref_len / sys_len), 0.), 1.)
+
+        # No match at all means a null score (and null precisions)
+        has_match = correct.any(axis=-1)
+
+        if smooth_method == 'add-k':
+            correct[..., 1:] += smooth_value
+            total[..., 1:] += smooth_value
+
+        # Orders are considered until the first one without any hypothesis n-gram
+        valid = np.cumprod(total > 0, axis=-1).astype(bool)
+        unmatched = valid & (correct == 0)
+
+        precisions = 100. * correct / total
+        if smooth_method == 'exp':
+            smooth_mteval = np.power(2., np.cumsum(unmatched, axis=-1))
+            precisions = np.where(unmatched, 100. / (smooth_mteval * total), precisions)
+        elif smooth_method == 'floor':
+            precisions = np.where(unmatched, 100. * smooth_value / total, precisions)
+        precisions = np.where(valid & has_match[..., None], precisions, 0.)
+
+        if effective_order:
+            eff_order = np.maximum(valid.sum(axis=-1), 1)
+            used = valid
+        else:
+            eff_order = max_ngram_order
+            used = True
+        # Same log flooring as sacrebleu's `my_log`
+        logs = np.where(precisions == 0., -9999999999., np.log(precisions))
+        scores = bp * np.exp(np.where(used, logs, 0.).sum(axis=-1) / eff_order)
+        scores = np.where(has_match, scores, 0.)
+
+    return scores, precisions, bp
+
+
+def effective_orders(stats, max_ngram_order=4):
+    """
+    Effective n-gram orders of BLEU statistics (see `bleu_np`): orders up to the first one without any hypothesis
+    n-gram (at least 1).
+    """
+    total = np.asarray(stats)[..., 2 + max_ngram_order:2 + 2 * max_ngram_order]
+
+    return np.maximum(np.cumprod(total > 0, axis=-1).sum(axis=-1), 1)
+
+
+def sigma_upper_bounds_np(alpha, bleu_nb_precisions, bleu_br_bps, bleu_br_orders=None):
     """
-    Samples `n_samples` sets of size `size` for bootstrap resampling.
+    Vectorized upper bounds of the BLEU_br n-gram precisions and score, given the boundaries to words ratio.
+
+    :param alpha: boundaries to words ratio(s)
+    :param bleu_nb_precisions: BLEU_nb n-gram precisions, of shape (..., 4)
+    :param bleu_br_bps: BLEU_br brevity penalties
+    :param bleu_br_orders: effective n-gram orders of BLEU_br (see `effective_orders`), for an upper bound of BLEU_br
+        with effective order (all the orders if None)
+    :return: upper bounds of the BLEU_br n-gram precisions (shape (..., 4)), and upper bounds of BLEU_br
     """
-    seed = int(os.environ.get('BOOTSTRAP_RESAMPLE_SEED', '12345'))
-    rng = np.random.default_rng(seed)
-    return rng.choice(size, size=(n_samples, size), replace=True)
+    alpha = np.asarray(alpha, dtype='float64')
+    p1, p2, p3, p4 = np.moveaxis(np.asarray(bleu_nb_precisions, dtype='float64'), -1, 0)
 
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pp1_ub = (p1 + alpha * 100) / (1 + alpha)
+        pp2_ub = ((1 - alpha) * p2 + 2 * alpha * p1) / (1 + alpha)
+        pp3_ub = ((1 - 2 * alpha) * p3 + 3 * alpha * p2) / (1 + alpha)
+        pp4_ub = ((1 - 3 * alpha) * p4 + 4 * alpha * p3) / (1 + alpha)
+        if bleu_br_orders is None:
+            bleu_br_ub = bleu_br_bps * np.exp((np.log(pp1_ub) + np.log(pp2_ub) + np.log(pp3_ub) + np.log(pp4_ub)) / 4)
+        else:
+            logs = np.log(np.stack([pp1_ub, pp2_ub, pp3_ub, pp4_ub], axis=-1))
+            used = np.arange(1, 5) <= np.asarray(bleu_br_orders)[..., None]
+            bleu_br_ub = bleu_br_bps * np.exp(np.where(used, logs, 0.).sum(axis=-1) / bleu_br_orders)
 
-def sigma_process(ref_file_path, sys_file_path, srt=False, auto_seg=False, confidence_interval=False):
-    bleu = BLEU()
+    return np.stack([pp1_ub, pp2_ub, pp3_ub, pp4_ub], axis=-1), bleu_br_ub
+
+
+def sigma_np(alpha, bleu_nb_precisions, bleu_br_scores, bleu_br_bps, bleu_br_orders=None):
+    """
+    Vectorized version of `sigma`, returning the raw Sigma values (NaN where undefined).
+
+    :param alpha: boundaries to words ratio(s)
+    :param bleu_nb_precisions: BLEU_nb n-gram precisions, of shape (..., 4)
+    :param bleu_br_scores: BLEU_br scores
+    :param bleu_br_bps: BLEU_br brevity penalties
+    :param bleu_br_orders: effective n-gram orders of BLEU_br, if its scores use effective order
+    :return: Sigma values
+    """
+    _, bleu_br_ub = sigma_upper_bounds_np(alpha, bleu_nb_precisions, bleu_br_bps, bleu_br_orders=bleu_br_orders)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigmas = 100 * bleu_br_scores / bleu_br_ub
+
+    return np.where(np.isfinite(sigmas), sigmas, np.nan)
+
+
+def sigma_ci_bounds(resampled_stats, alpha, n_stats):
+    """
+    CI bounds of BLEU_nb, BLEU_br and Sigma from resampled [BLEU_nb stats, BLEU_br stats] (see `adaptive_bs_sums`).
+    """
+    bleu_nb_scores, bleu_nb_precisions, _ = bleu_np(resampled_stats[:, :n_stats])
+    bleu_br_scores, _, bleu_br_bps = bleu_np(resampled_stats[:, n_stats:])
+    sigmas = sigma_np(alpha, bleu_nb_precisions, bleu_br_scores, bleu_br_bps)
+
+    return np.concatenate(ci_bounds(np.stack([bleu_nb_scores, bleu_br_scores, sigmas])))
+
+
+def sigma_process(ref_file_path, sys_file_path, srt=False, auto_seg=False, confidence_interval=False,
+                  auto_seg_chunk_size=None, auto_seg_jobs=1,
+                  auto_seg_cache_dir_path=cst.CACHE_DIR_PATH, auto_seg_out_dir_path=None,
+                  adaptive_ci=False, ci_min_samples=cst.BS_MIN_SAMPLES, ci_max_samples=cst.BS_MAX_SAMPLES,
+                  ci_tolerance=cst.BS_TOLERANCE, ci_jobs=1):
+    with profile_stage('preprocess'):
+        alpha, ref_sents, ref_tagged_sents, sys_sents, sys_tagged_sents = sigma_preprocess(
+            ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg, auto_seg_chunk_size=auto_seg_chunk_size,
+            auto_seg_jobs=auto_seg_jobs,
+            auto_seg_cache_dir_path=auto_seg_cache_dir_path, auto_seg_out_dir_path=auto_seg_out_dir_path)
+
+    with profile_stage('metric:sigma'):
+        return sigma_scores(alpha, ref_sents, ref_tagged_sents, sys_sents, sys_tagged_sents,
+                            confidence_interval=confidence_interval, adaptive_ci=adaptive_ci,
+                            ci_min_samples=ci_min_samples, ci_max_samples=ci_max_samples, ci_tolerance=ci_tolerance,
+                            ci_jobs=ci_jobs)
+
+
+def sigma_scores(alpha, ref_sents, ref_tagged_sents, sys_sents, sys_tagged_sents, confidence_interval=False,
+                 adaptive_ci=False, ci_min_samples=cst.BS_MIN_SAMPLES, ci_max_samples=cst.BS_MAX_SAMPLES,
+                 ci_tolerance=cst.BS_TOLERANCE, ci_jobs=1):
+    """
+    BLEU_br, BLEU_nb and Sigma of preprocessed sentences (see `sigma_preprocess`).
 
-    alpha, ref_sents, ref_tagged_sents, sys_sents, sys_tagged_sents = sigma_preprocess(
-        ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg)
+    :return: dictionary of scores (and alpha)
+    """
+    bleu = BLEU()
 
     assert len(sys_sents) == len(ref_sents)
 
@@ -111,25 +270,32 @@ def sigma_process(ref_file_path, sys_file_path, srt=False, auto_seg=False, confi
     sigma_score = sigma(alpha, bleu_nb_score, bleu_br_score)
 
     if confidence_interval:
-        bleu_nb_stats = bleu._extract_corpus_statistics(sys_sents, [ref_sents])
-        bleu_br_stats = bleu._extract_corpus_statistics(sys_tagged_sents, [ref_tagged_sents])
-        idxs = __bs_idxs(len(bleu_nb_stats))
-
-        # convert to numpy array. float32 is more efficient
-        bleu_nb_stats_np = np.array(bleu_nb_stats, dtype='float32')
-        bleu_br_stats_np = np.array(bleu_br_stats, dtype='float32')
-
-        # recompute scores for all resamples
-        bleu_nb_scores = [
-            bleu._compute_score_from_stats(_s.sum(0)) for _s in bleu_nb_stats_np[idxs]]
-        bleu_br_scores = [
-            bleu._compute_score_from_stats(_s.sum(0)) for _s in bleu_br_stats_np[idxs]]
-        sigma_scores = [
-            sigma(alpha, _bleu_nb, _bleu_br)
-            for _bleu_nb, _bleu_br in zip(bleu_nb_scores, bleu_br_scores)]
-        bleu_nb_score.estimate_ci(bleu_nb_scores)
-        bleu_br_score.estimate_ci(bleu_br_scores)
-        sigma_score.estimate_ci(sigma_scores)
+        with profile_stage('bootstrap'):
+            bleu_nb_stats = bleu._extract_corpus_statistics(sys_sents, [ref_sents])
+            bleu_br_stats = bleu._extract_corpus_statistics(sys_tagged_sents, [ref_tagged_sents])
+            n_stats = len(bleu_nb_stats[0])
+
+            # resampled corpus statistics, computed by blocks of resamples (bounded memory)
+            stats = np.hstack((bleu_nb_stats, bleu_br_stats))
+            if adaptive_ci:
+                resampled_stats = adaptive_bs_sums(
+                    stats, partial(sigma_ci_bounds, alpha=alpha, n_stats=n_stats), min_samples=ci_min_samples,
+                    max_samples=ci_max_samples, tolerance=ci_tolerance, n_jobs=ci_jobs)
+                logger.info("Bootstrap resamples (BLEU, Sigma): %d", len(resampled_stats))
+            else:
+                resampled_stats = bs_sums(stats, n_jobs=ci_jobs)
+
+            # recompute scores for all resamples
+            bleu_nb_scores = [
+                bleu._compute_score_from_stats(_s) for _s in resampled_stats[:, :n_stats]]
+            bleu_br_scores = [
+                bleu._compute_score_from_stats(_s) for _s in resampled_stats[:, n_stats:]]
+            sigma_scores = [
+                sigma(alpha, _bleu_nb, _bleu_br)
+                for _bleu_nb, _bleu_br in zip(bleu_nb_scores, bleu_br_scores)]
+            bleu_nb_score.estimate_ci(bleu_nb_scores)
+            bleu_br_score.estimate_ci(bleu_br_scores)
+            sigma_score.estimate_ci(sigma_scores)
 
     return {
         cst.SIGMA: sigma_score,
@@ -138,11 +304,133 @@ def sigma_process(ref_file_path, sys_file_path, srt=False, auto_seg=False, confi
         cst.BLEU_BR: bleu_br_score}
 
 
+def sigma_stats(ref_sents, ref_tagged_sents, sys_sents, sys_tagged_sents):
+    """
+    Corpus-level BLEU_nb and BLEU_br statistics of preprocessed sentences (see `sigma_preprocess`), which can be
+    summed over the shards of a corpus.
+
+    :return: BLEU_nb and BLEU_br statistics, laid out as [hyp_len, ref_len, correct_1..4, total_1..4]
+    """
+    bleu = BLEU()
+
+    assert len(sys_sents) == len(ref_sents)
+
+    bleu_nb_stats = np.sum(bleu._extract_corpus_statistics(sys_sents, [ref_sents]), axis=0, dtype='int64')
+    bleu_br_stats = np.sum(bleu._extract_corpus_statistics(sys_tagged_sents, [ref_tagged_sents]), axis=0,
+                           dtype='int64')
+
+    return bleu_nb_stats.tolist(), bleu_br_stats.tolist()
+
+
+def sigma_scores_from_stats(bleu_nb_stats, bleu_br_stats, n_boundaries, n_words):
+    """
+    BLEU_br, BLEU_nb and Sigma of corpus-level statistics (see `sigma_stats` and `boundary_counts`).
+
+    :return: dictionary of scores (and alpha)
+    """
+    bleu = BLEU()
+
+    alpha = n_boundaries / n_words
+    bleu_nb_score = bleu._compute_score_from_stats(list(bleu_nb_stats))
+    bleu_br_score = bleu._compute_score_from_stats(list(bleu_br_stats))
+
+    return {
+        cst.SIGMA: sigma(alpha, bleu_nb_score, bleu_br_score),
+        cst.ALPHA: alpha,
+        cst.BLEU_NB: bleu_nb_score,
+        cst.BLEU_BR: bleu_br_score}
+
+
+def sentence_alphas(tagged_sents):
+    """
+    Boundaries to words ratio of each (space-separated) tagged sentence.
+    """
+    n_boundaries = np.fromiter(
+        (tagged_sent.count(cst.LINE_HOLDER) + tagged_sent.count(cst.CAPTION_HOLDER) for tagged_sent in tagged_sents),
+        dtype='float64', count=len(tagged_sents))
+    n_tokens = np.fromiter((len(tagged_sent.split()) for tagged_sent in tagged_sents),
+                           dtype='float64', count=len(tagged_sents))
+    n_words = n_tokens - n_boundaries
+
+    return np.divide(n_boundaries, n_words, out=np.zeros_like(n_boundaries), where=n_words > 0)
+
+
+def __json_float(x):
+    return float(x) if np.isfinite(x) else None
+
+
+def sentence_sigma_process(ref_file_path, sys_file_path, jsonl_file_path, srt=False, auto_seg=False,
+                           block_size=cst.SENT_BLOCK_SIZE, auto_seg_chunk_size=None, auto_seg_jobs=1,
+                           auto_seg_cache_dir_path=cst.CACHE_DIR_PATH, auto_seg_out_dir_path=None):
+    """
+    Compute sentence-level BLEU_br, BLEU_nb, alpha and Sigma, and stream them to a JSONL file
+    (one JSON object per sentence, in the order of the input sentences).
+
+    Scores are computed by blocks of `block_size` sentences straight from the sentence statistics,
+    so that no score object is kept in memory. Sentence-level BLEU uses effective order, and so does the upper bound
+    of BLEU_br in Sigma, so that sentences shorter than 4 tokens are scored. Sigma is null (NaN) where the upper bound
+    is null (e.g. no matching word).
+
+    :param ref_file_path: reference segmented subtitle file
+    :param sys_file_path: system segmented subtitle file
+    :param jsonl_file_path: JSONL file where to write the sentence-level scores
+    :param srt: whether the subtitle files are in srt format
+    :param auto_seg: whether to use automatic segmentation for system sequences
+    :param block_size: number of sentences scored at once
+    :param auto_seg_chunk_size: if set, maximum span size for the chunked automatic segmentation
+    :param auto_seg_jobs: number of processes for the chunked automatic segmentation
+    :param auto_seg_cache_dir_path: directory of the automatic segmentation cache (no persistent cache if None)
+    :param auto_seg_out_dir_path: directory where to write the automatically segmented system file
+    :return: number of scored sentences
+    """
+    bleu = BLEU()
+
+    _, ref_sents, ref_tagged_sents, sys_sents, sys_tagged_sents = sigma_preprocess(
+        ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg, auto_seg_chunk_size=auto_seg_chunk_size,
+        auto_seg_jobs=auto_seg_jobs,
+        auto_seg_cache_dir_path=auto_seg_cache_dir_path, auto_seg_out_dir_path=auto_seg_out_dir_path)
+
+    assert len(sys_sents) == len(ref_sents)
+
+    bleu_nb_stats = np.array(bleu._extract_corpus_statistics(sys_sents, [ref_sents]), dtype='float64')
+    bleu_br_stats = np.array(bleu._extract_corpus_statistics(sys_tagged_sents, [ref_tagged_sents]), dtype='float64')
+    alphas = sentence_alphas(sys_tagged_sents)
+
+    n_sents = len(sys_sents)
+    with open(jsonl_file_path, 'w') as jsonl_file:
+        for start in range(0, n_sents, block_size):
+            end = min(start + block_size, n_sents)
+            bleu_nb_scores, bleu_nb_precisions, _ = bleu_np(bleu_nb_stats[start:end], effective_order=True)
+            bleu_br_scores, _, bleu_br_bps = bleu_np(bleu_br_stats[start:end], effective_order=True)
+            sigmas = sigma_np(alphas[start:end], bleu_nb_precisions, bleu_br_scores, bleu_br_bps,
+                              bleu_br_orders=effective_orders(bleu_br_stats[start:end]))
+
+            jsonl_file.writelines(
+                json.dumps({'id': i,
+                            cst.BLEU_BR: __json_float(bleu_br),
+                            cst.BLEU_NB: __json_float(bleu_nb),
+                            cst.ALPHA: __json_float(alpha),
+                            cst.SIGMA: __json_float(sigma_)}) + '\n'
+                for i, bleu_br, bleu_nb, alpha, sigma_ in zip(
+                    range(start, end), bleu_br_scores, bleu_nb_scores, alphas[start:end], sigmas))
+
+    return n_sents
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--system_file', '-sf', type=str)
     parser.add_argument('--reference_file', '-rf', type=str)
+    parser.add_argument('--sentence_level_file', '-slf', type=str,
+                        help="If set, JSONL file where to write the sentence-level scores (Sigma is null where undefined).")
+    parser.add_argument('--srt', '-srt', action='store_true',
+                        help="Whether the subtitle files are in srt format.")
+    parser.add_argument('--auto_segmentation', '-as', action='store_true',
+                        help="Whether to use automatic segmentation for system sequences.")
+    parser.add_argument('--profile', '-prof', action='store_true',
+                        help="Whether to profile the evaluation stages (wall time, CPU time and peak memory), and "
+                             "print them.")
 
     args = parser.parse_args()
     return args
@@ -151,11 +439,19 @@ def parse_args():
 def main(args):
     sys_file_path = args.system_file
     ref_file_path = args.reference_file
+    sentence_level_file_path = args.sentence_level_file
+    srt = args.srt
+    auto_seg = args.auto_segmentation
+
+    if sentence_level_file_path is not None:
+        sentence_sigma_process(ref_file_path, sys_file_path, sentence_level_file_path, srt=srt, auto_seg=auto_seg)
 
-    sigma_score = sigma_process(ref_file_path, sys_file_path)
+    sigma_score = sigma_process(ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg)
     print(sigma_score)
     print(cst.SIGMA, "=", sigma_score[cst.SIGMA])
 
 
 if __name__ == '__main__':
-    main(parse_args())
+    cli_logging()
+    args = parse_args()
+    profiled_main(main, args, profile=args.profile)
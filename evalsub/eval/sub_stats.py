@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import glob
+import os
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+import evalsub.eval.cpl_eval as cpl_eval
+import evalsub.util.constants as cst
+from evalsub.util.logs import cli_level, cli_logging, get_logger, init_worker_logging
+from evalsub.util.sub_index import sub_format
+from evalsub.util.ttml import make_sub_stats
+
+logger = get_logger(__name__)
+
+DESCRIPTION = """
+Computes the statistics (conformity to display constraints, and TTML statistics) of a batch of subtitle files,
+with one row per file
+"""
+
+FILE = 'file'
+FORMAT = 'format'
+
+
+def list_sub_files(inputs):
+    """
+    Subtitle files (TTML, SRT, tagged text) of directories (recursively) or glob patterns.
+
+    :param inputs: directories or glob patterns
+    :return: sorted list of absolute file paths
+    """
+    file_paths = set()
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for root, _, file_names in os.walk(input_path):
+                file_paths.update(os.path.join(root, file_name) for file_name in file_names)
+        else:
+            file_paths.update(glob.glob(input_path, recursive=True))
+
+    return sorted(os.path.abspath(file_path) for file_path in file_paths
+                  if os.path.isfile(file_path) and sub_format(file_path) is not None)
+
+
+def file_stats(file_path, max_cpl=cst.MAX_CPL, max_cps=cst.MAX_CPS, max_lines=cst.MAX_LINES,
+               min_duration=cst.MIN_DURATION, max_duration=cst.MAX_DURATION, min_gap=cst.MIN_GAP):
+    """
+    Statistics of a subtitle file, as a flat dictionary: conformity statistics (see `cpl_eval.conformity_stats`),
+    as "<constraint>_<statistic>" columns, and, for TTML files, the statistics of `make_sub_stats`.
+
+    :return: dictionary of statistics (None if the file could not be read)
+    """
+    sub_fmt = sub_format(file_path)
+    try:
+        stats = cpl_eval.conformity_process(file_path, srt=sub_fmt == 'srt', ttml=sub_fmt == 'ttml', max_cpl=max_cpl,
+                                            max_cps=max_cps, max_lines=max_lines, min_duration=min_duration,
+                                            max_duration=max_duration, min_gap=min_gap)
+        row = {FILE: file_path, FORMAT: sub_fmt}
+        for constraint, summary in stats.items():
+            row.update({'%s_%s' % (constraint, key): value for key, value in summary.items()})
+        if sub_fmt == 'ttml':
+            row.update(make_sub_stats(file_path))
+    except (ET.ParseError, UnicodeDecodeError, ValueError, IndexError, KeyError, ZeroDivisionError) as e:
+        logger.warning("Skipping %s (%s: %s)", file_path, type(e).__name__, e)
+        return None
+
+    return row
+
+
+def is_parquet(output_file_path):
+    return output_file_path.endswith('.parquet')
+
+
+def read_stats(output_file_path):
+    if not os.path.exists(output_file_path):
+        return None
+
+    return pd.read_parquet(output_file_path) if is_parquet(output_file_path) else pd.read_csv(output_file_path)
+
+
+def write_stats(df, output_file_path):
+    """
+    Write the statistics (CSV, or Parquet if the file name ends with .parquet) atomically, so that an interrupted run
+    leaves the previous output intact.
+    """
+    output_dir_path = os.path.dirname(os.path.abspath(output_file_path))
+    os.makedirs(output_dir_path, exist_ok=True)
+    tmp_fd, tmp_file_path = tempfile.mkstemp(dir=output_dir_path, suffix='.tmp')
+    os.close(tmp_fd)
+    try:
+        if is_parquet(output_file_path):
+            df.to_parquet(tmp_file_path, index=False)
+        else:
+            df.to_csv(tmp_file_path, index=False, header=True)
+        os.replace(tmp_file_path, output_file_path)
+    except BaseException:
+        os.remove(tmp_file_path)
+        raise
+
+
+def stats_process(inputs, output_file_path, n_jobs=0, resume=False, flush_every=cst.STATS_FLUSH_FILES, **kwargs):
+    """
+    Compute the statistics of subtitle files in a process pool, and write them with one row per file.
+
+    :param inputs: directories or glob patterns
+    :param output_file_path: CSV or Parquet (.parquet) output file
+    :param n_jobs: number of processes (all the CPUs if None or <= 0)
+    :param resume: whether to skip the files already in the output file
+    :param flush_every: number of processed files between two writes of the output file
+    :param kwargs: display constraints (see `file_stats`)
+    :return: data frame of statistics
+    """
+    file_paths = list_sub_files(inputs)
+
+    dfs = list()
+    if resume:
+        df = read_stats(output_file_path)
+        if df is not None:
+            dfs.append(df)
+            done_paths = set(df[FILE])
+            file_paths = [file_path for file_path in file_paths if file_path not in done_paths]
+    logger.info("Files to process: %d", len(file_paths))
+
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count()
+    rows = list()
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker_logging,
+                             initargs=(cli_level(),)) as executor:
+        chunksize = max(1, min(64, len(file_paths) // (cst.CHUNKS_PER_JOB * n_jobs)))
+        for i, row in enumerate(executor.map(partial(file_stats, **kwargs), file_paths, chunksize=chunksize), 1):
+            if row is not None:
+                rows.append(row)
+            if i % flush_every == 0:
+                write_stats(pd.concat(dfs + [pd.DataFrame(rows)], ignore_index=True), output_file_path)
+                logger.info("Processed files: %d/%d", i, len(file_paths))
+
+    df = pd.concat(dfs + [pd.DataFrame(rows)], ignore_index=True)
+    write_stats(df, output_file_path)
+
+    return df
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+
+    parser.add_argument('--inputs', '-i', type=str, nargs='+', required=True,
+                        help="Directories (searched recursively) or glob patterns of subtitle files (.ttml/.xml, .srt,"
+                             " .txt for tagged text).")
+    parser.add_argument('--output_file', '-of', type=str, required=True,
+                        help="CSV file (or Parquet file, if ending with .parquet) where to write the statistics.")
+    parser.add_argument('--resume', '-r', action='store_true',
+                        help="Whether to skip the files already in the output file.")
+    parser.add_argument('--jobs', '-j', type=int, default=0,
+                        help="Number of processes (by default, 0 for all the CPUs).")
+    parser.add_argument('--max_length', '-len', type=int, default=cst.MAX_CPL,
+                        help="Maximum allowed length for subtitles")
+    parser.add_argument('--max_cps', '-cps', type=float, default=cst.MAX_CPS,
+                        help="Maximum allowed reading speed (characters per second).")
+    parser.add_argument('--max_lines', '-lines', type=int, default=cst.MAX_LINES,
+                        help="Maximum allowed number of lines per caption.")
+    parser.add_argument('--min_duration', '-mind', type=float, default=cst.MIN_DURATION,
+                        help="Minimum allowed caption duration (in seconds).")
+    parser.add_argument('--max_duration', '-maxd', type=float, default=cst.MAX_DURATION,
+                        help="Maximum allowed caption duration (in seconds).")
+    parser.add_argument('--min_gap', '-gap', type=float, default=cst.MIN_GAP,
+                        help="Minimum allowed gap between consecutive captions (in seconds).")
+
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    stats_process(args.inputs, args.output_file, n_jobs=args.jobs, resume=args.resume, max_cpl=args.max_length,
+                  max_cps=args.max_cps, max_lines=args.max_lines, min_duration=args.min_duration,
+                  max_duration=args.max_duration, min_gap=args.min_gap)
+
+
+if __name__ == '__main__':
+    cli_logging()
+    main(parse_args())
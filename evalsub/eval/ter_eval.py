@@ -10,10 +10,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License
 
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import os
 import re
 import sys
 
+import numpy as np
 from sacrebleu.metrics import TER
 
 # We include the path of the toplevel package in the system path,
@@ -22,13 +25,23 @@ toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
+from evalsub.eval.masked_ter import masked_ter_stats
+from evalsub.util.bootstrap import adaptive_bs_sums, bs_sums, ci_bounds
 import evalsub.util.constants as cst
-from evalsub.util.util import preprocess, suber_auto_seg
+from evalsub.util.logs import get_logger
+from evalsub.util.profiling import profile_stage
+from evalsub.util.util import cached_ref, preprocess, suber_auto_seg
+
+logger = get_logger(__name__)
 
 DESCRIPTION = """
 Computes TER_br with and without replacement of type of breaks
 """
 
+# TER engines: 'masked' is the engine specialized for masked sentences (same scores, much faster),
+# 'sacrebleu' is sacrebleu's general TER
+ENGINES = ('masked', 'sacrebleu')
+
 
 def ter_preprocess_aux(tagged_str, remove_eol=False, remove_eob=False, replace=False):
     if remove_eol:
@@ -51,15 +64,18 @@ def ter_preprocess_aux(tagged_str, remove_eol=False, remove_eob=False, replace=F
     return masked_sents
 
 
-def ter_preprocess(ref_file_path, sys_file_path, srt=False, auto_seg=False):
-    ref_tagged_str = preprocess(ref_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
+def ter_preprocess(ref_file_path, sys_file_path, srt=False, auto_seg=False, auto_seg_chunk_size=None,
+                   auto_seg_jobs=1, auto_seg_cache_dir_path=cst.CACHE_DIR_PATH, auto_seg_out_dir_path=None):
+    ref_tagged_str = cached_ref(preprocess, ref_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
                                 line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER, srt=srt)
     sys_tagged_str = preprocess(sys_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
                                 line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER, srt=srt)
 
     if auto_seg:
         sys_tagged_str = suber_auto_seg(ref_tagged_str, sys_tagged_str, line_holder=cst.LINE_HOLDER,
-                                        caption_holder=cst.CAPTION_HOLDER, sys_file_path=sys_file_path)
+                                        caption_holder=cst.CAPTION_HOLDER, sys_file_path=sys_file_path,
+                                        max_chunk_size=auto_seg_chunk_size, n_jobs=auto_seg_jobs,
+                                        cache_dir_path=auto_seg_cache_dir_path, out_dir_path=auto_seg_out_dir_path)
 
     ref_sents = ter_preprocess_aux(ref_tagged_str)
     sys_sents = ter_preprocess_aux(sys_tagged_str)
@@ -76,18 +92,149 @@ def calculate_ter(sys, ref):
     return ter_score, signature
 
 
-def ter_process(ref_file_path, sys_file_path, srt=False, auto_seg=False, extra=False):
-    ter = TER()
+def ter_stats(sys_sents, ref_sents, engine='masked'):
+    """
+    Sentence-level TER statistics [number of edits, reference length].
+    """
+    if engine == 'masked':
+        return masked_ter_stats(sys_sents, ref_sents)
+    else:
+        return TER()._extract_corpus_statistics(sys_sents, [ref_sents])
+
+
+def balanced_chunks(sys_sents, ref_sents, n_chunks):
+    """
+    Split the sentence pairs in `n_chunks` contiguous chunks of similar cost,
+    the cost of a pair being estimated from the size of its edit distance matrix.
+
+    :return: list of (start, end) sentence indices
+    """
+    costs = np.array([(len(sys_sent.split()) + 1) * (len(ref_sent.split()) + 1)
+                      for sys_sent, ref_sent in zip(sys_sents, ref_sents)], dtype='float64')
+    cum_costs = np.cumsum(costs)
+    cuts = np.searchsorted(cum_costs, cum_costs[-1] * np.arange(1, n_chunks) / n_chunks, side='right')
+    bounds = [0] + sorted(set(cuts.tolist())) + [len(costs)]
+
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+
+
+def parallel_ter_stats(sys_sents, ref_sents, engine='masked', n_jobs=1, chunks_per_job=cst.CHUNKS_PER_JOB):
+    """
+    Sentence-level TER statistics, computed over a pool of `n_jobs` processes.
 
-    ref_sents, sys_sents = ter_preprocess(ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg)
+    Statistics are returned in the order of the sentences, so that the corpus score, which sums them in that order,
+    is identical to the one computed in a single process.
 
+    :param sys_sents: system sentences
+    :param ref_sents: reference sentences
+    :param engine: TER engine (see `ENGINES`)
+    :param n_jobs: number of processes (all the CPUs if None or <= 0)
+    :param chunks_per_job: number of chunks per process (for load balancing)
+    :return: list of sentence-level statistics
+    """
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count()
+    if n_jobs == 1 or len(sys_sents) < 2:
+        return ter_stats(sys_sents, ref_sents, engine=engine)
+
+    chunks = balanced_chunks(sys_sents, ref_sents, n_jobs * chunks_per_job)
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        chunk_stats = executor.map(ter_stats, [sys_sents[start:end] for start, end in chunks],
+                                   [ref_sents[start:end] for start, end in chunks], repeat(engine))
+        stats = [sent_stats for stats in chunk_stats for sent_stats in stats]
+
+    return stats
+
+
+def ter_corpus_stats(ref_sents, sys_sents, engine='masked', n_jobs=1):
+    """
+    Corpus-level TER statistics of masked sentences (see `ter_preprocess`), which can be summed over the shards of a
+    corpus.
+
+    :return: TER statistics [number of edits, reference length]
+    """
     assert len(sys_sents) == len(ref_sents)
 
-    ter_score = ter.corpus_score(sys_sents, [ref_sents])
+    stats = parallel_ter_stats(sys_sents, ref_sents, engine=engine, n_jobs=n_jobs)
+
+    return [float(sum(sent_stats[0] for sent_stats in stats)), float(sum(sent_stats[1] for sent_stats in stats))]
+
+
+def ter_score_from_stats(stats):
+    """
+    TER_br of corpus-level statistics (see `ter_corpus_stats`).
+    """
+    return TER()._compute_score_from_stats(list(stats))
+
+
+def ter_np(stats):
+    """
+    Vectorized version of sacrebleu's `TER._compute_score_from_stats`.
+
+    :param stats: array of TER statistics of shape (..., 2), laid out as [edits, ref_len]
+    :return: TER scores
+    """
+    stats = np.asarray(stats, dtype='float64')
+    edits, ref_lens = stats[..., 0], stats[..., 1]
+
+    return 100 * np.where(ref_lens > 0, edits / np.where(ref_lens > 0, ref_lens, 1), 1)
+
+
+def ter_ci_bounds(resampled_stats):
+    """
+    CI bounds of TER from resampled statistics (see `adaptive_bs_sums`).
+    """
+    return np.array(ci_bounds(ter_np(resampled_stats)))
+
+
+def ter_process(ref_file_path, sys_file_path, srt=False, auto_seg=False, extra=False, engine='masked', n_jobs=1,
+                auto_seg_chunk_size=None, auto_seg_jobs=1,
+                auto_seg_cache_dir_path=cst.CACHE_DIR_PATH, auto_seg_out_dir_path=None, confidence_interval=False,
+                adaptive_ci=False, ci_min_samples=cst.BS_MIN_SAMPLES, ci_max_samples=cst.BS_MAX_SAMPLES,
+                ci_tolerance=cst.BS_TOLERANCE, ci_jobs=1):
+    ref_sents, sys_sents = ter_preprocess(ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg,
+                                          auto_seg_chunk_size=auto_seg_chunk_size, auto_seg_jobs=auto_seg_jobs,
+                                          auto_seg_cache_dir_path=auto_seg_cache_dir_path,
+                                          auto_seg_out_dir_path=auto_seg_out_dir_path)
+
+    return ter_scores(ref_sents, sys_sents, extra=extra, engine=engine, n_jobs=n_jobs,
+                      confidence_interval=confidence_interval, adaptive_ci=adaptive_ci, ci_min_samples=ci_min_samples,
+                      ci_max_samples=ci_max_samples, ci_tolerance=ci_tolerance, ci_jobs=ci_jobs)
+
+
+def ter_scores(ref_sents, sys_sents, extra=False, engine='masked', n_jobs=1, confidence_interval=False,
+               adaptive_ci=False, ci_min_samples=cst.BS_MIN_SAMPLES, ci_max_samples=cst.BS_MAX_SAMPLES,
+               ci_tolerance=cst.BS_TOLERANCE, ci_jobs=1):
+    """
+    TER_br of masked sentences (see `ter_preprocess`).
+    """
+    ter = TER()
+
+    assert len(sys_sents) == len(ref_sents)
+
+    if engine == 'masked' or n_jobs != 1 or confidence_interval:
+        ter_stats_list = parallel_ter_stats(sys_sents, ref_sents, engine=engine, n_jobs=n_jobs)
+        ter_score = ter._aggregate_and_compute(ter_stats_list)
+        # Set by sacrebleu when caching the references, required for the signature
+        ter.num_refs = 1
+    else:
+        ter_score = ter.corpus_score(sys_sents, [ref_sents])
     signature = ter.get_signature()
 
+    if confidence_interval:
+        # Same resamples as BLEU and Sigma, summing the sentence-level statistics (no extra TER computation)
+        with profile_stage('bootstrap'):
+            if adaptive_ci:
+                resampled_stats = adaptive_bs_sums(ter_stats_list, ter_ci_bounds, min_samples=ci_min_samples,
+                                                   max_samples=ci_max_samples, tolerance=ci_tolerance,
+                                                   n_jobs=ci_jobs)
+                logger.info("Bootstrap resamples (TER_br): %d", len(resampled_stats))
+            else:
+                resampled_stats = bs_sums(ter_stats_list, n_jobs=ci_jobs)
+            ter_score.estimate_ci([ter._compute_score_from_stats(_s) for _s in resampled_stats])
+
     if extra:
-        print('TER score on masked text:', ter_score)
+        logger.info('TER score on masked text: %s', ter_score)
 
-    print(signature)
+    logger.info('%s', signature)
     return ter_score
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+import os
+import sys
+
+import numpy as np
+from sacrebleu.metrics import BLEU
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+from evalsub.eval.bleu_eval import bleu_preprocess_str
+from evalsub.eval.sigma_eval import bleu_np, sigma_upper_bounds_np
+import evalsub.util.constants as cst
+from evalsub.util.degrade_tags import mixed_str as mixed_tags_str
+from evalsub.util.degrade_txt import mixed_str as mixed_txt_str
+from evalsub.util.util import postprocess, preprocess, renormalize
+
+DESCRIPTION = """
+Computes BLEU_nb, BLEU_br and the BLEU_br upper bounds over a grid of text and segmentation degradations
+"""
+
+GRID = range(0, 100, 10)
+
+
+def degrade_grid(ref_tagged_txt, p_txts=GRID, p_tags=GRID, out_dir_path=None):
+    """
+    Generate the degraded documents of the grid in memory.
+
+    For each text degradation level `p_txt`, words are added, deleted and replaced (p_txt / 3 % each),
+    then, for each segmentation degradation level `p_tags`, boundaries are added, deleted and replaced
+    (p_tags / 3 % each).
+
+    :param ref_tagged_txt: preprocessed reference string (see `preprocess`)
+    :param p_txts: text degradation levels (in %)
+    :param p_tags: segmentation degradation levels (in %)
+    :param out_dir_path: if set, directory where to also write the degraded files
+    :return: generator of (p_txt, p_tags, n_words, n_boundaries, degraded preprocessed string)
+    """
+    for p_txt in p_txts:
+        p_add = p_del = p_rep = p_txt / 300
+        mixed_txt, n_words = mixed_txt_str(ref_tagged_txt, p_add, p_del, p_rep)
+        if out_dir_path is not None:
+            postprocess(mixed_txt, os.path.join(out_dir_path, "amara.mixed_txt.%d.txt" % p_txt))
+        mixed_txt = renormalize(mixed_txt)
+
+        for p_tag in p_tags:
+            p_eol_add = p_eol_del = p_eol_rep = p_tag / 300
+            p_eob_add = p_eob_del = p_eob_rep = p_tag / 300
+            mixed_tags, n_eol, n_eob = mixed_tags_str(mixed_txt, p_eol_add, p_eob_add, p_eol_del, p_eob_del,
+                                                      p_eol_rep, p_eob_rep)
+            if out_dir_path is not None:
+                postprocess(mixed_tags, os.path.join(out_dir_path, "amara.mixed.%d.%d.txt" % (p_txt, p_tag)))
+            mixed_tags = renormalize(mixed_tags)
+
+            yield p_txt, p_tag, n_words, n_eol + n_eob, mixed_tags
+
+
+def upper_bound_process(ref_file_path, p_txts=GRID, p_tags=GRID, out_dir_path=None):
+    """
+    Compute BLEU_nb, BLEU_br and the BLEU_br upper bounds for every cell of the degradation grid.
+
+    The reference is read and its n-grams extracted only once, the degraded documents are never read back
+    from disk, and the upper bounds are computed for all cells at once.
+
+    :param ref_file_path: reference tagged txt file
+    :param p_txts: text degradation levels (in %)
+    :param p_tags: segmentation degradation levels (in %)
+    :param out_dir_path: if set, directory where to also write the degraded files
+    :return: dictionary of result columns (Sigma is given as a ratio)
+    """
+    ref_tagged_txt = preprocess(ref_file_path)
+    bleu_nb = BLEU(references=[bleu_preprocess_str(ref_tagged_txt, remove_eol=True, remove_eob=True)])
+    bleu_br = BLEU(references=[bleu_preprocess_str(ref_tagged_txt)])
+
+    if out_dir_path is not None:
+        os.makedirs(out_dir_path, exist_ok=True)
+
+    systems = list()
+    cells = list()
+    alphas = list()
+    bleu_nb_stats = list()
+    bleu_br_stats = list()
+    for p_txt, p_tag, n_words, n_boundaries, tagged_txt in degrade_grid(ref_tagged_txt, p_txts=p_txts,
+                                                                        p_tags=p_tags, out_dir_path=out_dir_path):
+        systems.append("mixed.%d.%d" % (p_txt, p_tag))
+        cells.append((p_txt, p_tag))
+        alphas.append(n_boundaries / n_words)
+        sys_nb = bleu_preprocess_str(tagged_txt, remove_eol=True, remove_eob=True)
+        sys_br = bleu_preprocess_str(tagged_txt)
+        bleu_nb_stats.append(np.sum(bleu_nb._extract_corpus_statistics(sys_nb, None), axis=0))
+        bleu_br_stats.append(np.sum(bleu_br._extract_corpus_statistics(sys_br, None), axis=0))
+
+    alphas = np.array(alphas)
+    bleu_nb_scores, bleu_nb_precisions, bleu_nb_bps = bleu_np(bleu_nb_stats)
+    bleu_br_scores, bleu_br_precisions, bleu_br_bps = bleu_np(bleu_br_stats)
+    pp_ubs, bleu_br_ubs = sigma_upper_bounds_np(alphas, bleu_nb_precisions, bleu_br_bps)
+
+    return {cst.SYSTEM: systems,
+            cst.P_TXT: [p_txt for p_txt, _ in cells], cst.P_TAGS: [p_tag for _, p_tag in cells],
+            cst.ALPHA: alphas.tolist(),
+            cst.BLEU_NB: bleu_nb_scores.tolist(),
+            cst.P1: bleu_nb_precisions[:, 0].tolist(), cst.P2: bleu_nb_precisions[:, 1].tolist(),
+            cst.P3: bleu_nb_precisions[:, 2].tolist(), cst.P4: bleu_nb_precisions[:, 3].tolist(),
+            cst.BP: bleu_nb_bps.tolist(),
+            cst.BLEU_BR: bleu_br_scores.tolist(),
+            cst.PP1: bleu_br_precisions[:, 0].tolist(), cst.PP2: bleu_br_precisions[:, 1].tolist(),
+            cst.PP3: bleu_br_precisions[:, 2].tolist(), cst.PP4: bleu_br_precisions[:, 3].tolist(),
+            cst.BPP: bleu_br_bps.tolist(),
+            cst.BLEU_BR_UB: bleu_br_ubs.tolist(),
+            cst.PP1_UB: pp_ubs[:, 0].tolist(), cst.PP2_UB: pp_ubs[:, 1].tolist(),
+            cst.PP3_UB: pp_ubs[:, 2].tolist(), cst.PP4_UB: pp_ubs[:, 3].tolist(),
+            cst.SIGMA: (bleu_br_scores / bleu_br_ubs).tolist()}
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Evaluation server: a long-running process which keeps the metric implementations imported and registered references
+preprocessed in memory, and evaluates system outputs sent in requests, on a local HTTP port or Unix socket.
+
+JSON API:
+
+    GET    /references         registered references
+    PUT    /references/<name>  register a reference: {"path": <file>} or {"text": <content>}, and "srt" (optional)
+    DELETE /references/<name>  unregister a reference
+    POST   /evaluate           evaluate a system: {"reference": <name>, "system": <content>} (or "system_path"),
+                               "metrics" (optional), and evaluation settings (see `EVAL_SETTINGS`)
+
+Evaluations return {"system", "scores", "confidence_intervals"} (see `EvalResult`), with "profile" if requested, and
+errors {"error"}. Requests are handled one at a time.
+"""
+
+import argparse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import math
+import os
+import signal
+import socketserver
+import sys
+import tempfile
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+from evalsub.api import evaluate
+import evalsub.eval.planner as planner
+import evalsub.util.constants as cst
+from evalsub.util.logs import cli_logging, get_logger
+from evalsub.util.util import evict_ref, set_ref_cache_max_refs
+
+logger = get_logger(__name__)
+
+# Evaluation settings which can be set by requests (see `evaluate`)
+EVAL_SETTINGS = frozenset(['window_size', 'nt', 'max_cpl', 'auto_seg', 'confidence_interval', 'ter_jobs',
+                           'auto_seg_chunk_size', 'auto_seg_jobs', 'adaptive_ci', 'ci_min_samples', 'ci_max_samples',
+                           'ci_tolerance', 'ci_jobs', 'metric_jobs', 'profile'])
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# REFERENCES  ##########################################################################################################
+
+class ReferenceRegistry:
+    """
+    Registered references, preprocessed for all the metrics when registered. When more than `max_refs` references
+    are registered, the least recently used one is evicted (unregistered, and its preprocessing freed).
+    """
+    def __init__(self, work_dir_path, max_refs=cst.SERVER_MAX_REFS):
+        self.work_dir_path = work_dir_path
+        self.max_refs = max_refs
+        # The preprocessing of every registered reference stays cached
+        set_ref_cache_max_refs(max_refs)
+        self.refs = OrderedDict()  # name -> (file path, srt, whether the file was written by the server)
+        self.n_written_files = 0
+
+    def register(self, name, path=None, text=None, srt=False):
+        if self.refs.get(name) is not None:
+            self.unregister(name)
+
+        written = path is None
+        if written:
+            if text is None:
+                raise RequestError(400, "A reference needs a path or a text")
+            self.n_written_files += 1
+            path = os.path.join(self.work_dir_path, 'ref_%d.txt' % self.n_written_files)
+            with open(path, 'w') as f:
+                f.write(text)
+        elif not os.path.isfile(path):
+            raise RequestError(400, "No such reference file: %s" % path)
+
+        planner.warm_ref(path, cst.VALID_METRICS, srt=srt)
+        self.refs[name] = (os.path.abspath(path), srt, written)
+        logger.info("Registered reference %s (%s)", name, path)
+
+        while len(self.refs) > self.max_refs:
+            evicted_name = next(iter(self.refs))
+            self.unregister(evicted_name)
+            logger.info("Evicted reference %s", evicted_name)
+
+    def unregister(self, name):
+        if name not in self.refs:
+            raise RequestError(404, "Unknown reference: %s" % name)
+
+        path, _, written = self.refs.pop(name)
+        evict_ref(path)
+        if written:
+            os.remove(path)
+
+    def get(self, name):
+        """
+        File path and format of a reference (marked as the most recently used).
+        """
+        if name not in self.refs:
+            raise RequestError(404, "Unknown reference: %s" % name)
+        self.refs.move_to_end(name)
+        path, srt, _ = self.refs[name]
+
+        return path, srt
+
+    def names(self):
+        return list(self.refs)
+
+
+# EVALUATION  ##########################################################################################################
+
+def json_scores(scores):
+    # NaN written as null
+    return {metric: None if isinstance(score, float) and math.isnan(score) else score
+            for metric, score in scores.items()}
+
+
+def handle_evaluation(registry, request):
+    """
+    Evaluate a system against a registered reference.
+
+    :param registry: reference registry
+    :param request: evaluation request (see the module documentation)
+    :return: results, as a dictionary
+    """
+    if 'reference' not in request:
+        raise RequestError(400, "Missing reference")
+    ref_file_path, srt = registry.get(request['reference'])
+
+    metrics = request.get('metrics', cst.DEFAULT_METRICS)
+    if not isinstance(metrics, list) or not all(isinstance(metric, str) for metric in metrics):
+        raise RequestError(400, "Metrics must be a list of metric names")
+    unknown_metrics = set(metrics).difference(cst.VALID_METRICS)
+    if unknown_metrics:
+        raise RequestError(400, "Unknown metrics: %s" % ', '.join(sorted(unknown_metrics)))
+    unknown_settings = set(request).difference(EVAL_SETTINGS, ['reference', 'metrics', 'system', 'system_path'])
+    if unknown_settings:
+        raise RequestError(400, "Unknown settings: %s" % ', '.join(sorted(unknown_settings)))
+    settings = {key: value for key, value in request.items() if key in EVAL_SETTINGS}
+
+    sys_file_path = request.get('system_path')
+    tmp_file_path = None
+    if sys_file_path is not None:
+        if not os.path.isfile(sys_file_path):
+            raise RequestError(400, "No such system file: %s" % sys_file_path)
+        if os.path.getsize(sys_file_path) == 0:
+            raise RequestError(400, "Empty system file: %s" % sys_file_path)
+    else:
+        if 'system' not in request:
+            raise RequestError(400, "Missing system")
+        if not isinstance(request['system'], str) or not request['system'].strip():
+            raise RequestError(400, "Empty system")
+        tmp_fd, tmp_file_path = tempfile.mkstemp(dir=registry.work_dir_path, suffix='.srt' if srt else '.txt')
+        with os.fdopen(tmp_fd, 'w') as f:
+            f.write(request['system'])
+        sys_file_path = tmp_file_path
+
+    # Automatically segmented system files are written in the work directory (and removed), not next to the system
+    auto_seg_file_path = os.path.join(registry.work_dir_path,
+                                      os.path.splitext(os.path.basename(sys_file_path))[0] + '_AS.txt')
+    try:
+        # Automatic segmentations are not cached on disk (every checkpoint output is different)
+        result = evaluate(ref_file_path, sys_file_path, metrics=metrics, srt=srt, auto_seg_cache_dir_path=None,
+                          auto_seg_out_dir_path=registry.work_dir_path, **settings)
+    finally:
+        if tmp_file_path is not None:
+            os.remove(tmp_file_path)
+        if os.path.exists(auto_seg_file_path):
+            os.remove(auto_seg_file_path)
+
+    response = {'system': result.system if tmp_file_path is None else None, 'scores': json_scores(result.scores),
+                'confidence_intervals': result.confidence_intervals}
+    if result.profile is not None:
+        response['profile'] = result.profile
+
+    return response
+
+
+# SERVER  ##############################################################################################################
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the JSON API (see the module documentation); the server has a `registry` attribute.
+    """
+    def send_json(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length == 0:
+            return dict()
+        try:
+            content = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            raise RequestError(400, "Invalid JSON: %s" % e)
+        if not isinstance(content, dict):
+            raise RequestError(400, "Expected a JSON object")
+
+        return content
+
+    def reference_name(self):
+        name = self.path[len('/references/'):]
+        if not self.path.startswith('/references/') or not name:
+            raise RequestError(404, "Unknown path: %s" % self.path)
+
+        return name
+
+    def handle_request(self, fn):
+        try:
+            status, content = fn()
+        except RequestError as e:
+            status, content = e.status, {'error': str(e)}
+        except Exception as e:
+            logger.exception("Failed request %s %s", self.command, self.path)
+            status, content = 500, {'error': '%s: %s' % (type(e).__name__, e)}
+        self.send_json(status, content)
+
+    def do_GET(self):
+        def get():
+            if self.path != '/references':
+                raise RequestError(404, "Unknown path: %s" % self.path)
+            return 200, {'references': self.server.registry.names()}
+        self.handle_request(get)
+
+    def do_PUT(self):
+        def put():
+            name = self.reference_name()
+            request = self.read_json()
+            self.server.registry.register(name, path=request.get('path'), text=request.get('text'),
+                                          srt=request.get('srt', False))
+            return 200, {'reference': name}
+        self.handle_request(put)
+
+    def do_DELETE(self):
+        def delete():
+            name = self.reference_name()
+            self.server.registry.unregister(name)
+            return 200, {'reference': name}
+        self.handle_request(delete)
+
+    def do_POST(self):
+        def post():
+            if self.path != '/evaluate':
+                raise RequestError(404, "Unknown path: %s" % self.path)
+            return 200, handle_evaluation(self.server.registry, self.read_json())
+        self.handle_request(post)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+def serve(registry, host='127.0.0.1', port=cst.SERVER_PORT, socket_path=None):
+    """
+    Serve evaluations until interrupted.
+
+    :param registry: reference registry
+    :param host: host of the HTTP server
+    :param port: port of the HTTP server
+    :param socket_path: Unix socket where to listen instead of the HTTP port
+    """
+    # Importing the metric implementations once
+    for metric in cst.VALID_METRICS:
+        planner.load_metric(metric)
+
+    if socket_path is not None:
+        server = UnixHTTPServer(socket_path, RequestHandler)
+        logger.info("Listening on %s", socket_path)
+    else:
+        server = HTTPServer((host, port), RequestHandler)
+        logger.info("Listening on http://%s:%d", host, port)
+    server.registry = registry
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# MAIN  ################################################################################################################
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serves evaluations against references kept preprocessed in memory.")
+
+    parser.add_argument('--host', '-H', type=str, default='127.0.0.1',
+                        help="Host of the HTTP server (by default, 127.0.0.1).")
+    parser.add_argument('--port', '-p', type=int, default=cst.SERVER_PORT,
+                        help="Port of the HTTP server.")
+    parser.add_argument('--socket', '-s', type=str,
+                        help="Unix socket where to listen instead of the HTTP port.")
+    parser.add_argument('--references', '-ref', type=str, nargs='+', default=list(),
+                        help="Reference files to register at startup, as name=path (or path, named after the file).")
+    parser.add_argument('--srt', '-srt', action='store_true',
+                        help="Whether the reference files registered at startup are in srt format.")
+    parser.add_argument('--max_refs', '-mr', type=int, default=cst.SERVER_MAX_REFS,
+                        help="Maximum number of references kept in memory (least recently used ones are evicted).")
+
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    # Stopping as when interrupted, so that the files of the server are removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with tempfile.TemporaryDirectory(prefix='evalsub_server_') as work_dir_path:
+        registry = ReferenceRegistry(work_dir_path, max_refs=args.max_refs)
+        for reference in args.references:
+            name, sep, path = reference.partition('=')
+            if not sep:
+                name, path = os.path.basename(reference), reference
+            registry.register(name, path=path, srt=args.srt)
+
+        serve(registry, host=args.host, port=args.port, socket_path=args.socket)
+
+
+if __name__ == '__main__':
+    cli_logging()
+    main(parse_args())
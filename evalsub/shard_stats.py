@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Sufficient statistics of shards, for the evaluation of a corpus split across processes or machines.
+
+The corpus-level BLEU_br, BLEU_nb, Sigma, TER_br and CPL conformity (`cst.MERGEABLE_METRICS`) are computed from
+statistics summed over the sentences or lines of the corpus: BLEU n-gram matches and totals and lengths, boundary and
+word counts (alpha), TER edit counts and reference lengths, and conforming/total line counts. Each shard
+(reference/system pair) is evaluated into a statistics file (`evaluate_stats`, `evalsub_main.py --emit_stats`), and
+any number of statistics files are summed (`merge_stats`) into the scores of the concatenation of the shards.
+
+Precision/Recall/F1 are not mergeable: system and reference boundaries are matched at their word positions in the
+whole document, which shift differently within each shard when the system text differs from the reference.
+
+Merging statistics files:
+
+    python evalsub/shard_stats.py -sf stats/*.stats.json -n system -res results.csv
+"""
+
+import argparse
+from collections import OrderedDict
+import json
+import os
+import sys
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+from evalsub.api import EvalResult, init_eval_worker, result_columns
+import evalsub.eval.planner as planner
+import evalsub.util.constants as cst
+from evalsub.util.logs import cli_level, cli_logging, get_logger
+from evalsub.util.results import ResultsWriter
+from evalsub.util.util import write_lines
+
+logger = get_logger(__name__)
+
+# Statistics of the metric families
+BLEU_NB_STATS = 'bleu_nb'  # [hyp_len, ref_len, correct_1..4, total_1..4]
+BLEU_BR_STATS = 'bleu_br'
+BOUNDARY_STATS = 'boundaries'  # [boundaries, words] of the system
+TER_STATS = 'ter'  # [edits, ref_len]
+CPL_STATS = 'cpl'  # [conforming lines, lines]
+
+
+# STATISTICS  ##########################################################################################################
+
+def evaluate_stats(ref_file_path, sys_file_path, metrics=cst.DEFAULT_METRICS, max_cpl=cst.MAX_CPL, srt=False,
+                   auto_seg=False, ter_jobs=1, auto_seg_chunk_size=None, auto_seg_jobs=1,
+                   auto_seg_cache_dir_path=cst.CACHE_DIR_PATH, auto_seg_out_dir_path=None):
+    """
+    Sufficient statistics of a shard (system against a reference) for metrics.
+
+    :param ref_file_path: reference segmented subtitle file
+    :param sys_file_path: system segmented subtitle file
+    :param metrics: metrics to compute the statistics of (see `cst.MERGEABLE_METRICS`)
+    :return: statistics of the shard, as a dictionary (see `write_stats`)
+    """
+    unmergeable_metrics = set(metrics).difference(cst.MERGEABLE_METRICS, [cst.ALPHA])
+    if unmergeable_metrics:
+        raise ValueError("Metrics without sufficient statistics: %s" % ', '.join(sorted(unmergeable_metrics)))
+    # In a fixed order, so that the statistics files of the shards can be compared
+    metrics = [metric for metric in cst.MERGEABLE_METRICS if metric in metrics]
+
+    logger.info("Computing the statistics of %s", sys_file_path)
+
+    inputs = planner.run_plan(planner.plan(metrics), ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg,
+                              auto_seg_chunk_size=auto_seg_chunk_size, auto_seg_jobs=auto_seg_jobs,
+                              auto_seg_cache_dir_path=auto_seg_cache_dir_path,
+                              auto_seg_out_dir_path=auto_seg_out_dir_path)
+
+    stats = dict()
+    if cst.BLEU_BR in metrics or cst.BLEU_NB in metrics or cst.SIGMA in metrics:
+        from evalsub.eval.sigma_eval import boundary_counts, sigma_stats
+
+        _, *sents = inputs[planner.PLACEHOLDER_SENTS]
+        stats[BLEU_NB_STATS], stats[BLEU_BR_STATS] = sigma_stats(*sents)
+        stats[BOUNDARY_STATS] = list(boundary_counts(inputs[planner.SYS_ALIGNED_STR]))
+    if cst.TER_BR in metrics:
+        from evalsub.eval.ter_eval import ter_corpus_stats
+
+        stats[TER_STATS] = ter_corpus_stats(*inputs[planner.MASKED_SENTS], n_jobs=ter_jobs)
+    if cst.CPL_CONF in metrics:
+        from evalsub.eval.cpl_eval import cpl_counts
+
+        stats[CPL_STATS] = list(cpl_counts(inputs[planner.CAPTIONS], max_cpl=max_cpl))
+
+    # Settings the statistics depend on, which have to be the same for all the shards of a corpus
+    settings = {'max_cpl': max_cpl, 'auto_seg': auto_seg}
+
+    return {'version': cst.STATS_VERSION, 'system': os.path.basename(sys_file_path), 'metrics': metrics,
+            'settings': settings, 'shards': 1, 'stats': stats}
+
+
+def stats_worker(sys_file_path, ref_file_path, **kwargs):
+    return evaluate_stats(ref_file_path, sys_file_path, **kwargs)
+
+
+def evaluate_systems_stats(ref_file_path, sys_file_paths, metrics=cst.DEFAULT_METRICS, n_jobs=1, **kwargs):
+    """
+    Sufficient statistics of systems against a reference (see `evaluate_stats`).
+
+    :param n_jobs: number of processes (all the CPUs if None or <= 0), each one preprocessing the reference once
+    :return: generator of the statistics of the systems, in the order of `sys_file_paths`
+    """
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count()
+    n_jobs = min(n_jobs, len(sys_file_paths))
+
+    if n_jobs <= 1:
+        for sys_file_path in sys_file_paths:
+            yield evaluate_stats(ref_file_path, sys_file_path, metrics=metrics, **kwargs)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    metrics = list(metrics)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_eval_worker,
+                             initargs=(ref_file_path, metrics, kwargs.get('srt', False), cli_level())) as executor:
+        yield from executor.map(partial(stats_worker, ref_file_path=ref_file_path, metrics=metrics, **kwargs),
+                                sys_file_paths)
+
+
+def write_stats(stats, stats_file_path):
+    """
+    Write the statistics of a shard (or of merged shards) as a single-line JSON file, atomically.
+    """
+    write_lines([json.dumps(stats, separators=(',', ':'))], stats_file_path, atomic=True)
+
+
+def read_stats(stats_file_path):
+    with open(stats_file_path, 'r') as f:
+        stats = json.load(f)
+    if stats.get('version') != cst.STATS_VERSION:
+        raise ValueError("Unsupported statistics file version in %s: %s" % (stats_file_path, stats.get('version')))
+
+    return stats
+
+
+# MERGING  #############################################################################################################
+
+def merge_stats(shards_stats):
+    """
+    Sum the statistics of shards, evaluated with the same metrics and settings.
+
+    :param shards_stats: list of statistics of shards (or of merged shards)
+    :return: statistics of the concatenation of the shards
+    """
+    if not shards_stats:
+        raise ValueError("No statistics to merge")
+
+    first_stats = shards_stats[0]
+    merged = {name: list(values) for name, values in first_stats['stats'].items()}
+    for stats in shards_stats[1:]:
+        for key in ('metrics', 'settings'):
+            if stats[key] != first_stats[key]:
+                raise ValueError("Statistics of shards evaluated with different %s: %s and %s"
+                                 % (key, first_stats[key], stats[key]))
+        for name, values in stats['stats'].items():
+            merged[name] = [total + value for total, value in zip(merged[name], values)]
+
+    systems = set(stats['system'] for stats in shards_stats)
+
+    return {'version': cst.STATS_VERSION, 'system': systems.pop() if len(systems) == 1 else None,
+            'metrics': first_stats['metrics'], 'settings': first_stats['settings'],
+            'shards': sum(stats['shards'] for stats in shards_stats), 'stats': merged}
+
+
+def stats_scores(stats, system=None):
+    """
+    Scores of statistics (see `evaluate_stats`, `merge_stats`).
+
+    :param stats: statistics of a shard or of merged shards
+    :param system: name of the system (by default, the name of the system of the statistics)
+    :return: results of the system (see `EvalResult`), without confidence intervals
+    """
+    metrics = result_columns(stats['metrics'])[1:]
+    values = stats['stats']
+
+    scores = OrderedDict()
+    if BLEU_NB_STATS in values:
+        from evalsub.eval.sigma_eval import sigma_scores_from_stats
+
+        sigma_score = sigma_scores_from_stats(values[BLEU_NB_STATS], values[BLEU_BR_STATS], *values[BOUNDARY_STATS])
+        for metric in (cst.BLEU_BR, cst.BLEU_NB, cst.SIGMA):
+            if metric in metrics:
+                scores[metric] = sigma_score[metric].score
+                logger.info('%s: %s', metric, sigma_score[metric].format(score_only=True))
+        if cst.ALPHA in metrics:
+            scores[cst.ALPHA] = sigma_score[cst.ALPHA]
+    if TER_STATS in values:
+        from evalsub.eval.ter_eval import ter_score_from_stats
+
+        ter_br = ter_score_from_stats(values[TER_STATS])
+        scores[cst.TER_BR] = ter_br.score
+        logger.info('TER_br: %s', ter_br.format(score_only=True))
+    if CPL_STATS in values:
+        from evalsub.eval.cpl_eval import cpl_from_counts
+
+        scores[cst.CPL_CONF] = cpl_from_counts(*values[CPL_STATS])
+        logger.info("CPL conformity: %s%%", round(scores[cst.CPL_CONF], 2))
+
+    return EvalResult(system if system is not None else stats['system'], scores, dict())
+
+
+# MAIN  ################################################################################################################
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Merges statistics files of shards (see evalsub_main.py "
+                                                 "--emit_stats) into the scores of the whole corpus.")
+
+    parser.add_argument('--stats_files', '-sf', type=str, nargs='+', required=True,
+                        help="Statistics files of the shards.")
+    parser.add_argument('--system_name', '-n', type=str,
+                        help="Name of the system in the results (by default, the name of the system files of the "
+                             "shards, if they all have the same).")
+    parser.add_argument('--results_file', '-res', type=str,
+                        help="CSV file (or JSONL file, if ending with .jsonl) where to append the scores.")
+    parser.add_argument('--merged_stats_file', '-msf', type=str,
+                        help="File where to write the merged statistics (which can be merged again).")
+
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    shards_stats = [read_stats(stats_file_path) for stats_file_path in args.stats_files]
+    merged = merge_stats(shards_stats)
+    logger.info("Merged shards: %d", merged['shards'])
+
+    if args.merged_stats_file is not None:
+        write_stats(merged, args.merged_stats_file)
+
+    system = args.system_name if args.system_name is not None else merged['system']
+    if system is None:
+        raise ValueError("Shards of differently named system files, --system_name is required")
+    result = stats_scores(merged, system=system)
+
+    if args.results_file is not None:
+        with ResultsWriter(args.results_file, result_columns(merged['metrics']), resume=True) as writer:
+            writer.write_row(result.row())
+
+
+if __name__ == '__main__':
+    cli_logging()
+    main(parse_args())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Chunked variant of SubER's Levenshtein alignment of hypothesis words to reference segments.
+
+SubER aligns the full hypothesis and reference word sequences at once, which needs a matrix whose size is the product
+of both lengths. Here, the sequences are recursively split in two at an anchor close to the middle of the span, i.e. a
+word occurring exactly once on both sides (in the same order as the other anchors, and next to another matching word),
+until every span is at most `max_chunk_size` words long on both sides (spans without any anchor are cut
+proportionally). Each span is then aligned on its own, so that memory grows with document length times chunk size,
+and spans can be aligned in parallel.
+
+The alignment is approximate: forcing the anchors to match can give an alignment of higher edit cost than the optimal
+one over the whole document (not only a different alignment of equal cost), and hence different Sigma and TER_br
+scores. Larger chunks give alignments closer to the optimal one.
+"""
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import zip_longest
+import bisect
+import os
+import string
+import sys
+
+import Levenshtein
+import numpy as np
+import suber.data_types as subertyp
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+REMOVE_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+
+def normalize_word(word):
+    """
+    Lower-cases and removes punctuation (as SubER does before aligning).
+    """
+    word = word.lower()
+    word_without_punctuation = word.translate(REMOVE_PUNCTUATION_TABLE)
+
+    return word_without_punctuation if word_without_punctuation else word
+
+
+def words_to_chars(ref_words, hyp_words):
+    """
+    Map words to characters, Levenshtein operating on strings.
+    """
+    vocabulary = dict()
+    ref_str = ''.join(chr(vocabulary.setdefault(word, len(vocabulary)) + 32) for word in ref_words)
+    hyp_str = ''.join(chr(vocabulary.setdefault(word, len(vocabulary)) + 32) for word in hyp_words)
+
+    return ref_str, hyp_str
+
+
+def unique_anchors(ref_str, hyp_str, ref_start, ref_end, hyp_start, hyp_end):
+    """
+    Positions of the characters occurring exactly once in both spans, restricted to the longest sequence of them
+    appearing in the same order in both spans.
+
+    :return: list of (reference position, hypothesis position)
+    """
+    ref_counts = Counter(ref_str[ref_start:ref_end])
+    hyp_counts = Counter(hyp_str[hyp_start:hyp_end])
+    hyp_positions = {c: hyp_start + i for i, c in enumerate(hyp_str[hyp_start:hyp_end]) if hyp_counts[c] == 1}
+    pairs = [(ref_start + i, hyp_positions[c]) for i, c in enumerate(ref_str[ref_start:ref_end])
+             if ref_counts[c] == 1 and c in hyp_positions]
+    # Confident anchors only: a neighbouring word should match as well
+    pairs = [(ref_pos, hyp_pos) for ref_pos, hyp_pos in pairs
+             if (ref_pos > ref_start and hyp_pos > hyp_start and ref_str[ref_pos - 1] == hyp_str[hyp_pos - 1])
+             or (ref_pos + 1 < ref_end and hyp_pos + 1 < hyp_end and ref_str[ref_pos + 1] == hyp_str[hyp_pos + 1])]
+
+    # Longest increasing subsequence of hypothesis positions (patience sorting)
+    tails = list()
+    tail_indices = list()
+    previous = [-1] * len(pairs)
+    for k, (_, hyp_pos) in enumerate(pairs):
+        t = bisect.bisect_left(tails, hyp_pos)
+        if t == len(tails):
+            tails.append(hyp_pos)
+            tail_indices.append(k)
+        else:
+            tails[t] = hyp_pos
+            tail_indices[t] = k
+        previous[k] = tail_indices[t - 1] if t > 0 else -1
+
+    anchors = list()
+    k = tail_indices[-1] if tail_indices else -1
+    while k >= 0:
+        anchors.append(pairs[k])
+        k = previous[k]
+    anchors.reverse()
+
+    return anchors
+
+
+def split_spans(ref_str, hyp_str, max_chunk_size):
+    """
+    Split the sequences into spans to align independently, and anchor positions.
+
+    :return: ordered list of ('chunk', ref_start, ref_end, hyp_start, hyp_end)
+        and ('equal', ref_pos, ref_pos + 1, hyp_pos, hyp_pos + 1) items
+    """
+    items = list()
+    # Depth-first, left-to-right processing of spans
+    stack = [(0, len(ref_str), 0, len(hyp_str))]
+    while stack:
+        item = stack.pop()
+        if item[0] == 'equal':
+            items.append(item)
+            continue
+
+        ref_start, ref_end, hyp_start, hyp_end = item
+        if ref_end - ref_start <= max_chunk_size and hyp_end - hyp_start <= max_chunk_size:
+            items.append(('chunk', ref_start, ref_end, hyp_start, hyp_end))
+            continue
+
+        anchors = unique_anchors(ref_str, hyp_str, ref_start, ref_end, hyp_start, hyp_end)
+        sub_items = list()
+        if anchors:
+            # The span is split once, at the anchor closest to its middle
+            ref_mid = (ref_start + ref_end) / 2
+            ref_pos, hyp_pos = min(anchors, key=lambda anchor: abs(anchor[0] - ref_mid))
+            sub_items.append((ref_start, ref_pos, hyp_start, hyp_pos))
+            sub_items.append(('equal', ref_pos, ref_pos + 1, hyp_pos, hyp_pos + 1))
+            sub_items.append((ref_pos + 1, ref_end, hyp_pos + 1, hyp_end))
+        else:
+            # No anchor: the span is cut in the middle, along its diagonal
+            ref_mid = (ref_start + ref_end) // 2
+            hyp_mid = hyp_start + round((ref_mid - ref_start) * (hyp_end - hyp_start) / max(ref_end - ref_start, 1))
+            if ref_mid == ref_start and hyp_mid in (hyp_start, hyp_end):
+                hyp_mid = (hyp_start + hyp_end) // 2
+            sub_items.append((ref_start, ref_mid, hyp_start, hyp_mid))
+            sub_items.append((ref_mid, ref_end, hyp_mid, hyp_end))
+
+        # Pushed in reverse order so that they are processed from left to right
+        for sub_item in reversed(sub_items):
+            if sub_item[0] == 'equal' or sub_item[1] > sub_item[0] or sub_item[3] > sub_item[2]:
+                stack.append(sub_item)
+
+    return items
+
+
+def chunk_opcodes(ref_chunk, hyp_chunk):
+    return Levenshtein.opcodes(ref_chunk, hyp_chunk)
+
+
+def chunked_opcodes(ref_str, hyp_str, max_chunk_size, n_jobs=1):
+    """
+    Levenshtein edit operations (as `Levenshtein.opcodes`) computed span by span.
+
+    :param ref_str: reference (words mapped to characters)
+    :param hyp_str: hypothesis (words mapped to characters)
+    :param max_chunk_size: maximum number of words in a span (on each side)
+    :param n_jobs: number of processes used to align the spans (all the CPUs if None or <= 0)
+    :return: list of (operation, ref_start, ref_end, hyp_start, hyp_end)
+    """
+    items = split_spans(ref_str, hyp_str, max_chunk_size)
+    chunks = [item for item in items if item[0] == 'chunk']
+    ref_chunks = [ref_str[ref_start:ref_end] for _, ref_start, ref_end, _, _ in chunks]
+    hyp_chunks = [hyp_str[hyp_start:hyp_end] for _, _, _, hyp_start, hyp_end in chunks]
+
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count()
+    if n_jobs == 1 or len(chunks) < 2:
+        all_chunk_opcodes = map(chunk_opcodes, ref_chunks, hyp_chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            all_chunk_opcodes = list(executor.map(chunk_opcodes, ref_chunks, hyp_chunks,
+                                                  chunksize=max(1, len(chunks) // (4 * n_jobs))))
+    all_chunk_opcodes = iter(all_chunk_opcodes)
+
+    opcodes = list()
+    for item in items:
+        if item[0] == 'equal':
+            opcodes.append(item)
+        else:
+            _, ref_start, _, hyp_start, _ = item
+            for op, ref_i, ref_j, hyp_i, hyp_j in next(all_chunk_opcodes):
+                opcodes.append((op, ref_start + ref_i, ref_start + ref_j, hyp_start + hyp_i, hyp_start + hyp_j))
+
+    return opcodes
+
+
+def chunked_align_hypothesis_to_reference(hypothesis, reference, max_chunk_size, n_jobs=1):
+    """
+    Re-segment the hypothesis words according to the reference segments (as SubER's
+    `levenshtein_align_hypothesis_to_reference`), aligning the words span by span. The alignment is approximate: its
+    edit cost can be higher than that of SubER's alignment, which changes the scores computed on the segmentation.
+
+    :param hypothesis: hypothesis SubER segments
+    :param reference: reference SubER segments
+    :param max_chunk_size: maximum number of words in a span aligned at once (on each side)
+    :param n_jobs: number of processes used to align the spans
+    :return: hypothesis SubER segments, one per reference segment
+    """
+    if max_chunk_size < 1:
+        raise ValueError("Maximum chunk size must be at least 1: %s" % max_chunk_size)
+
+    ref_words = [normalize_word(word.string) for segment in reference for word in segment.word_list]
+    hyp_words = [normalize_word(word.string) for segment in hypothesis for word in segment.word_list]
+    all_hyp_words = [word for segment in hypothesis for word in segment.word_list]
+
+    ref_str, hyp_str = words_to_chars(ref_words, hyp_words)
+    opcodes = chunked_opcodes(ref_str, hyp_str, max_chunk_size, n_jobs=n_jobs)
+
+    # Same assignment of hypothesis words to reference segments as SubER
+    ref_boundaries = np.cumsum([len(segment.word_list) for segment in reference])
+    segment_index = 0
+    aligned_word_lists = [[] for _ in reference]
+    for _, ref_i, ref_j, hyp_i, hyp_j in opcodes:
+        for hyp_pos, ref_pos in zip_longest(range(hyp_i, hyp_j), range(ref_i, ref_j)):
+            if ref_pos is not None and ref_pos >= ref_boundaries[segment_index]:
+                segment_index += 1
+                # Empty reference segments are skipped
+                while (segment_index < len(ref_boundaries)
+                       and ref_boundaries[segment_index] == ref_boundaries[segment_index - 1]):
+                    segment_index += 1
+
+            if hyp_pos is not None:
+                aligned_word_lists[segment_index].append(all_hyp_words[hyp_pos])
+
+    return [subertyp.Segment(word_list=word_list) for word_list in aligned_word_lists]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Bootstrap resampling of sentence-level statistics.
+
+Resamples are drawn by blocks of `cst.BS_BATCH_SAMPLES` resamples, block k being drawn with its own generator, seeded
+with the k-th child of `np.random.SeedSequence(BOOTSTRAP_RESAMPLE_SEED)`. The resamples thus only depend on the corpus
+size and the seed, whatever the number of processes drawing them, and metrics computed on the same sentences share the
+same resamples.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+import sys
+
+import numpy as np
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+import evalsub.util.constants as cst
+
+# Sentence-level statistics of a bootstrap worker process (sent once per process, see `bs_init_worker`)
+WORKER_STATS = None
+
+
+def bs_seed():
+    return int(os.environ.get('BOOTSTRAP_RESAMPLE_SEED', '12345'))
+
+
+def bs_block_sizes(n_samples):
+    """
+    Number of resamples of each block.
+    """
+    return [min(cst.BS_BATCH_SAMPLES, n_samples - start) for start in range(0, n_samples, cst.BS_BATCH_SAMPLES)]
+
+
+def bs_block_sums(stats, seed_seq, n_samples, max_block_elements=cst.BS_BLOCK_ELEMENTS):
+    """
+    Sums of the sentence-level statistics over a block of bootstrap resamples.
+
+    Resamples are drawn by sub-blocks of at most `max_block_elements` indices (at least one resample per sub-block),
+    each sub-block being turned into a matrix of sentence counts (multinomial weights) multiplied by the statistics,
+    so that peak memory depends on `max_block_elements` rather than on `n_samples` times the corpus size. Sub-blocks
+    are consecutive draws of the same generator, so that the resamples do not depend on `max_block_elements`.
+
+    :param stats: sentence-level statistics of shape (n_sentences, n_stats)
+    :param seed_seq: seed sequence of the block
+    :param n_samples: number of resamples of the block
+    :param max_block_elements: maximum number of indices drawn at once
+    :return: corpus-level statistics of shape (n_samples, n_stats)
+    """
+    rng = np.random.default_rng(seed_seq)
+    size = len(stats)
+    sub_block_samples = max(1, max_block_elements // max(size, 1))
+    sums = np.empty((n_samples, stats.shape[1]), dtype='float64')
+
+    for start in range(0, n_samples, sub_block_samples):
+        n_sub_block_samples = min(sub_block_samples, n_samples - start)
+        idxs = rng.choice(size, size=(n_sub_block_samples, size), replace=True)
+        # Offsetting indices by resample, so that a single bincount gives the counts of all resamples
+        idxs += np.arange(n_sub_block_samples)[:, None] * size
+        counts = np.bincount(idxs.ravel(), minlength=n_sub_block_samples * size).reshape(n_sub_block_samples, size)
+        sums[start:start + n_sub_block_samples] = counts @ stats
+
+    return sums
+
+
+def bs_init_worker(stats):
+    global WORKER_STATS
+    WORKER_STATS = stats
+
+
+def bs_worker_block_sums(seed_seq, n_samples, max_block_elements):
+    return bs_block_sums(WORKER_STATS, seed_seq, n_samples, max_block_elements=max_block_elements)
+
+
+def bs_sum_blocks(stats, n_samples=cst.BS_SAMPLES, max_block_elements=cst.BS_BLOCK_ELEMENTS, n_jobs=1):
+    """
+    Sums of the sentence-level statistics over each bootstrap resample, block by block (see the module docstring).
+
+    With several processes, the statistics are sent once to each process, and only a few blocks are computed ahead,
+    so that stopping the iteration early does not compute all the blocks.
+
+    :param stats: sentence-level statistics of shape (n_sentences, n_stats)
+    :param n_samples: number of resamples
+    :param max_block_elements: maximum number of indices drawn at once (by each process)
+    :param n_jobs: number of processes (all the CPUs if None or <= 0)
+    :return: generator of corpus-level statistics of shape (n_block_samples, n_stats), in the order of the blocks
+    """
+    stats = np.asarray(stats, dtype='float64')
+    block_sizes = bs_block_sizes(n_samples)
+    seed_seqs = np.random.SeedSequence(bs_seed()).spawn(len(block_sizes))
+
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count()
+    if n_jobs == 1 or len(block_sizes) < 2:
+        for seed_seq, n_block_samples in zip(seed_seqs, block_sizes):
+            yield bs_block_sums(stats, seed_seq, n_block_samples, max_block_elements=max_block_elements)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=bs_init_worker, initargs=(stats,)) as executor:
+        tasks = zip(seed_seqs, block_sizes)
+        futures = deque(executor.submit(bs_worker_block_sums, seed_seq, n_block_samples, max_block_elements)
+                        for seed_seq, n_block_samples in islice(tasks, 2 * n_jobs))
+        try:
+            while futures:
+                block_sums = futures.popleft().result()
+                for seed_seq, n_block_samples in islice(tasks, 1):
+                    futures.append(executor.submit(bs_worker_block_sums, seed_seq, n_block_samples,
+                                                   max_block_elements))
+                yield block_sums
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def bs_sums(stats, n_samples=cst.BS_SAMPLES, max_block_elements=cst.BS_BLOCK_ELEMENTS, n_jobs=1):
+    """
+    Sums of the sentence-level statistics over each bootstrap resample (see `bs_sum_blocks`).
+
+    :return: corpus-level statistics of shape (n_samples, n_stats)
+    """
+    return np.concatenate(list(bs_sum_blocks(stats, n_samples=n_samples, max_block_elements=max_block_elements,
+                                             n_jobs=n_jobs)))
+
+
+def ci_bounds(scores):
+    """
+    Bounds of the 95% confidence interval (as sacrebleu's `Score.estimate_ci`), along the last axis.
+    """
+    scores = np.sort(scores, axis=-1)
+    n = scores.shape[-1]
+    lower_idx = n // 40
+    upper_idx = n - lower_idx - 1
+
+    return scores[..., lower_idx], scores[..., upper_idx]
+
+
+def adaptive_bs_sums(stats, bounds_fn, min_samples=cst.BS_MIN_SAMPLES, max_samples=cst.BS_MAX_SAMPLES,
+                     tolerance=cst.BS_TOLERANCE, max_block_elements=cst.BS_BLOCK_ELEMENTS, n_jobs=1):
+    """
+    Sums of the sentence-level statistics over bootstrap resamples drawn block by block, until the confidence
+    interval bounds converge.
+
+    After each block (once `min_samples` resamples are drawn), the bounds returned by `bounds_fn` are compared to the
+    ones of the previous block; resampling stops as soon as none of them moved by `tolerance` or more, or when
+    `max_samples` resamples are drawn. The resamples are the first ones of `bs_sums` (same seed).
+
+    :param stats: sentence-level statistics of shape (n_sentences, n_stats)
+    :param bounds_fn: function returning the CI bounds to monitor (array) from resampled statistics
+        of shape (n_samples, n_stats)
+    :param min_samples: minimum number of resamples
+    :param max_samples: maximum number of resamples
+    :param tolerance: maximum move of the CI bounds between two blocks, for convergence
+    :param max_block_elements: maximum number of indices drawn at once (by each process)
+    :param n_jobs: number of processes (all the CPUs if None or <= 0)
+    :return: corpus-level statistics of shape (n_samples, n_stats), n_samples being the number of resamples drawn
+    """
+    sums = np.empty((max_samples, np.shape(stats)[1]), dtype='float64')
+
+    n_samples = 0
+    prev_bounds = None
+    for block_sums in bs_sum_blocks(stats, n_samples=max_samples, max_block_elements=max_block_elements,
+                                    n_jobs=n_jobs):
+        sums[n_samples:n_samples + len(block_sums)] = block_sums
+        n_samples += len(block_sums)
+        if n_samples < min_samples:
+            continue
+
+        bounds = np.asarray(bounds_fn(sums[:n_samples]), dtype='float64')
+        if prev_bounds is not None and np.all(np.abs(bounds - prev_bounds) < tolerance):
+            break
+        prev_bounds = bounds
+
+    return sums[:n_samples]
@@ -20,6 +20,8 @@ CASCADE_FR = os.path.join(DATA_DIR_PATH, 'cascade.fr')
 E2E_BASE_FR = os.path.join(DATA_DIR_PATH, 'e2e_base.fr')
 E2E_PT_FR = os.path.join(DATA_DIR_PATH, 'e2e_pt.fr')
 NMT_FR = os.path.join(DATA_DIR_PATH, 'nmt.fr')
+CACHE_DIR_PATH = os.environ.get('EVALSUB_CACHE_DIR',
+                                os.path.join(os.path.expanduser('~'), '.cache', 'evalsub'))
 
 CAPTION_TAG = '<eob>'
 LINE_TAG = '<eol>'
@@ -59,7 +61,13 @@ E2E_METRICS = [BLEU_BR, BLEU_NB, TER_BR,
 DEFAULT_METRICS = [BLEU_BR, BLEU_NB,
                    SIGMA]
 
+# Metrics computed exactly from statistics summed over the shards of a corpus
+MERGEABLE_METRICS = [BLEU_BR, BLEU_NB, TER_BR,
+                     CPL_CONF,
+                     SIGMA]
+
 SYSTEM = 'System'
+REFERENCE = 'Reference'
 WIN_SIZE = 'k'
 NT = 'n_t'
 ALPHA = 'alpha'
@@ -83,4 +91,39 @@ PP4_UB = "p'4+"
 
 DEFAULT_NT = 2
 MAX_CPL = 42
-PROBA = 0.5
\ No newline at end of file
+MAX_CPS = 21
+MAX_LINES = 2
+MIN_DURATION = 5 / 6
+MAX_DURATION = 7
+MIN_GAP = 0.08
+PROBA = 0.5
+SENT_BLOCK_SIZE = 10000
+CHUNKS_PER_JOB = 4
+# Number of results rows (systems) between two syncs of the results file to disk
+RESULTS_SYNC_ROWS = 10
+# Number of processed files between two writes of the batch statistics output
+STATS_FLUSH_FILES = 1000
+# Reference and system columns of evaluation manifests
+MANIFEST_REFERENCE = 'reference'
+MANIFEST_SYSTEM = 'system'
+# Shard statistics files: format version, and suffix of the files written for each system
+STATS_VERSION = 1
+STATS_SUFFIX = '.stats.json'
+# Maximum number of reference files whose preprocessing is kept in memory by an evaluation process
+REF_CACHE_MAX_REFS = 8
+# Evaluation server: default port, and maximum number of references kept preprocessed in memory
+SERVER_PORT = 8737
+SERVER_MAX_REFS = 8
+# Maximum number of sentence indices drawn at once for bootstrap resampling
+BS_BLOCK_ELEMENTS = 2 ** 22
+# Number of resamples per independently seeded block (changing it changes the resamples)
+BS_BATCH_SAMPLES = 100
+# Bootstrap resampling: resample counts, and convergence tolerance of the CI bounds for adaptive resampling
+BS_SAMPLES = 1000
+BS_MIN_SAMPLES = 200
+BS_MAX_SAMPLES = 10000
+BS_TOLERANCE = 0.05
+# Number of automatic segmentations memoized in an evaluation process
+AUTO_SEG_MEMO_SIZE = 4
+# To increase whenever the automatic segmentation output changes (invalidates cached segmentations)
+AUTO_SEG_VERSION = 1
\ No newline at end of file
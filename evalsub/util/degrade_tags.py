@@ -23,8 +23,11 @@ if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
 import evalsub.util.constants as cst
+from evalsub.util.logs import cli_logging, get_logger
 from evalsub.util.util import postprocess, preprocess, replace_char
 
+logger = get_logger(__name__)
+
 DESCRIPTION = """
 A script to degrade subtitle segmentation (in lines and captions) in a tagged txt file.
 The degradation can be achieved by shifting boundaries, adding new boundaries, deleting boundaries, or replacing
@@ -66,7 +69,7 @@ def shift(input_file_path, output_file_path, n, p_eol, p_eob, line_tag=cst.LINE_
     :param line_tag: tag which represents an end-of-line in a caption (default '<eol>')
     :param caption_tag: tag which represents an end-of-caption (default '<eob>')
     """
-    print('Initializing...')
+    logger.info('Initializing...')
     tagged_txt = preprocess(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
 
     eol_positions = [m.start() for m in re.finditer(cst.LINE_HOLDER, tagged_txt)]
@@ -77,8 +80,8 @@ def shift(input_file_path, output_file_path, n, p_eol, p_eob, line_tag=cst.LINE_
     n_eob = len(eob_positions)
     n_eol_shifts = round(p_eol * n_eol)
     n_eob_shifts = round(p_eob * n_eob)
-    print('n eol shifts:\n  %d (%.2f%%)' % (n_eol_shifts, 100 * n_eol_shifts / n_eol))
-    print('n eob shifts:\n  %d (%.2f%%)' % (n_eob_shifts, 100 * n_eob_shifts / n_eob))
+    logger.info('n eol shifts:\n  %d (%.2f%%)', n_eol_shifts, 100 * n_eol_shifts / n_eol)
+    logger.info('n eob shifts:\n  %d (%.2f%%)', n_eob_shifts, 100 * n_eob_shifts / n_eob)
     eol_to_shift = random.sample(eol_positions, n_eol_shifts)
     eob_to_shift = random.sample(eob_positions, n_eob_shifts)
     boundaries_to_shift = frozenset(eol_to_shift + eob_to_shift)
@@ -89,7 +92,7 @@ def shift(input_file_path, output_file_path, n, p_eol, p_eob, line_tag=cst.LINE_
         if slot_pos in boundaries_to_shift:
             tagged_txt = shift_boundary(tagged_txt, n, slot_positions, i)
 
-    print('Writing...')
+    logger.info('Writing...')
     postprocess(tagged_txt, output_file_path, line_tag=line_tag, caption_tag=caption_tag)
 
     stats = [n_eol, n_eob, n_eol_shifts, n_eob_shifts]
@@ -113,7 +116,7 @@ def add(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_TAG,
         wether proportions are relative to the number of boundaries (True),
         or to the number of free slots (False, default)
     """
-    print('Initializing...')
+    logger.info('Initializing...')
     tagged_txt = preprocess(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
 
     eol_positions = [m.start() for m in re.finditer(cst.LINE_HOLDER, tagged_txt)]
@@ -131,8 +134,8 @@ def add(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_TAG,
         n_eob_additions = round(p_eob * n_spaces)
     n_eol_additions = min(n_eol_additions, n_spaces)
     n_eob_additions = min(n_eob_additions, n_spaces)
-    print('n eol additions:\n  %d (%.2f%%)' % (n_eol_additions, 100 * n_eol_additions / n_eol))
-    print('n eob additions:\n  %d (%.2f%%)' % (n_eob_additions, 100 * n_eob_additions / n_eob))
+    logger.info('n eol additions:\n  %d (%.2f%%)', n_eol_additions, 100 * n_eol_additions / n_eol)
+    logger.info('n eob additions:\n  %d (%.2f%%)', n_eob_additions, 100 * n_eob_additions / n_eob)
     boundaries_to_add = random.sample(space_positions, n_eol_additions + n_eob_additions)
     eol_to_add = random.sample(boundaries_to_add, n_eol_additions)
     eob_to_add = set(boundaries_to_add)
@@ -144,7 +147,7 @@ def add(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_TAG,
     for eob_pos in eob_to_add:
         tagged_txt = replace_char(tagged_txt, eob_pos, cst.CAPTION_HOLDER)
 
-    print('Writing...')
+    logger.info('Writing...')
     postprocess(tagged_txt, output_file_path, line_tag=line_tag, caption_tag=caption_tag)
 
     stats = [n_eol, n_eob, n_eol_additions, n_eob_additions]
@@ -164,7 +167,7 @@ def delete(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_TA
     :param line_tag: tag which represents an end-of-line in a caption (default '<eol>')
     :param caption_tag: tag which represents an end-of-caption (default '<eob>')
     """
-    print('Initializing...')
+    logger.info('Initializing...')
     tagged_txt = preprocess(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
 
     eol_positions = [m.start() for m in re.finditer(cst.LINE_HOLDER, tagged_txt)]
@@ -174,8 +177,8 @@ def delete(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_TA
     n_eob = len(eob_positions)
     n_eol_deletions = round(p_eol * n_eol)
     n_eob_deletions = round(p_eob * n_eob)
-    print('n eol deletions:\n  %d (%.2f%%)' % (n_eol_deletions, 100 * n_eol_deletions / n_eol))
-    print('n eob deletions:\n  %d (%.2f%%)' % (n_eob_deletions, 100 * n_eob_deletions / n_eob))
+    logger.info('n eol deletions:\n  %d (%.2f%%)', n_eol_deletions, 100 * n_eol_deletions / n_eol)
+    logger.info('n eob deletions:\n  %d (%.2f%%)', n_eob_deletions, 100 * n_eob_deletions / n_eob)
     eol_to_delete = random.sample(eol_positions, n_eol_deletions)
     eob_to_delete = random.sample(eob_positions, n_eob_deletions)
     boundaries_to_delete = eol_to_delete + eob_to_delete
@@ -183,7 +186,7 @@ def delete(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_TA
     for boundary_pos in boundaries_to_delete:
         tagged_txt = replace_char(tagged_txt, boundary_pos, ' ')
 
-    print('Writing...')
+    logger.info('Writing...')
     postprocess(tagged_txt, output_file_path, line_tag=line_tag, caption_tag=caption_tag)
 
     stats = [n_eol, n_eob, n_eol_deletions, n_eob_deletions]
@@ -204,7 +207,7 @@ def replace(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_T
     :param line_tag: tag which represents an end-of-line in a caption (default '<eol>')
     :param caption_tag: tag which represents an end-of-caption (default '<eob>')
     """
-    print('Initializing...')
+    logger.info('Initializing...')
     tagged_txt = preprocess(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
 
     eol_positions = [m.start() for m in re.finditer(cst.LINE_HOLDER, tagged_txt)]
@@ -214,8 +217,8 @@ def replace(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_T
     n_eob = len(eob_positions)
     n_eol_replacements = round(p_eol * n_eol)
     n_eob_replacements = round(p_eob * n_eob)
-    print('n eol replacements:\n  %d (%.2f%%)' % (n_eol_replacements, 100 * n_eol_replacements / n_eol))
-    print('n eob replacements:\n  %d (%.2f%%)' % (n_eob_replacements, 100 * n_eob_replacements / n_eob))
+    logger.info('n eol replacements:\n  %d (%.2f%%)', n_eol_replacements, 100 * n_eol_replacements / n_eol)
+    logger.info('n eob replacements:\n  %d (%.2f%%)', n_eob_replacements, 100 * n_eob_replacements / n_eob)
     eol_to_replace = random.sample(eol_positions, n_eol_replacements)
     eob_to_replace = random.sample(eob_positions, n_eob_replacements)
 
@@ -225,7 +228,7 @@ def replace(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_T
     for eob_pos in eob_to_replace:
         tagged_txt = replace_char(tagged_txt, eob_pos, cst.LINE_HOLDER)
 
-    print('Writing...')
+    logger.info('Writing...')
     postprocess(tagged_txt, output_file_path, line_tag=line_tag, caption_tag=caption_tag)
 
     stats = [n_eol, n_eob, n_eol_replacements, n_eob_replacements]
@@ -234,11 +237,19 @@ def replace(input_file_path, output_file_path, p_eol, p_eob, line_tag=cst.LINE_T
 
 # MIXED  ###############################################################################################################
 
-def mixed(input_file_path, output_file_path, p_eol_add, p_eob_add, p_eol_del, p_eob_del,
-          p_eol_rep, p_eob_rep, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
-    print('Initializing...')
-    tagged_txt = preprocess(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
-
+def mixed_str(tagged_txt, p_eol_add, p_eob_add, p_eol_del, p_eob_del, p_eol_rep, p_eob_rep):
+    """
+    Degrade the segmentation of a preprocessed string by adding, deleting and replacing boundaries.
+
+    :param tagged_txt: preprocessed tagged string (see `preprocess`)
+    :param p_eol_add: proportion of eol boundaries to be added
+    :param p_eob_add: proportion of eob boundaries to be added
+    :param p_eol_del: proportion of eol boundaries to be deleted
+    :param p_eob_del: proportion of eob boundaries to be deleted
+    :param p_eol_rep: proportion of eol boundaries to be replaced
+    :param p_eob_rep: proportion of eob boundaries to be replaced
+    :return: degraded string (to be postprocessed), and numbers of eol and eob boundaries after degradation
+    """
     eol_positions = set([m.start() for m in re.finditer(cst.LINE_HOLDER, tagged_txt)])
     eob_positions = set([m.start() for m in re.finditer(cst.CAPTION_HOLDER, tagged_txt)])
     space_positions = [m.start() for m in re.finditer(r" ", tagged_txt)]
@@ -263,14 +274,14 @@ def mixed(input_file_path, output_file_path, p_eol_add, p_eob_add, p_eol_del, p_
     # eob_positions.difference_update(eob_to_shift)
 
     # Sampling the boundaries to delete
-    eol_to_delete = random.sample(eol_positions, n_eol_deletions)
-    eob_to_delete = random.sample(eob_positions, n_eob_deletions)
+    eol_to_delete = random.sample(sorted(eol_positions), n_eol_deletions)
+    eob_to_delete = random.sample(sorted(eob_positions), n_eob_deletions)
     eol_positions.difference_update(eol_to_delete)
     eob_positions.difference_update(eob_to_delete)
 
     # Sampling the boundaries to replace
-    eol_to_replace = random.sample(eol_positions, n_eol_replacements)
-    eob_to_replace = random.sample(eob_positions, n_eob_replacements)
+    eol_to_replace = random.sample(sorted(eol_positions), n_eol_replacements)
+    eob_to_replace = random.sample(sorted(eob_positions), n_eob_replacements)
 
     # Sampling the boundaries to add
     boundaries_to_add = random.sample(space_positions, n_eol_additions + n_eob_additions)
@@ -295,9 +306,6 @@ def mixed(input_file_path, output_file_path, p_eol_add, p_eob_add, p_eol_del, p_
     for eob_pos in eob_to_add:
         tagged_txt = replace_char(tagged_txt, eob_pos, cst.CAPTION_HOLDER)
 
-    print('Writing ' + output_file_path)
-    postprocess(tagged_txt, output_file_path, line_tag=line_tag, caption_tag=caption_tag)
-
     n_eol += n_eol_additions
     n_eol -= n_eol_deletions
     n_eol += n_eob_replacements
@@ -308,6 +316,20 @@ def mixed(input_file_path, output_file_path, p_eol_add, p_eob_add, p_eol_del, p_
     n_eob += n_eol_replacements
     n_eob -= n_eob_replacements
 
+    return tagged_txt, n_eol, n_eob
+
+
+def mixed(input_file_path, output_file_path, p_eol_add, p_eob_add, p_eol_del, p_eob_del,
+          p_eol_rep, p_eob_rep, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
+    logger.info('Initializing...')
+    tagged_txt = preprocess(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
+
+    tagged_txt, n_eol, n_eob = mixed_str(tagged_txt, p_eol_add, p_eob_add, p_eol_del, p_eob_del,
+                                         p_eol_rep, p_eob_rep)
+
+    logger.info('Writing %s', output_file_path)
+    postprocess(tagged_txt, output_file_path, line_tag=line_tag, caption_tag=caption_tag)
+
     return n_eol, n_eob
 
 
@@ -362,4 +384,5 @@ def main(args):
 
 
 if __name__ == '__main__':
+    cli_logging()
     main(parse_args())
@@ -13,8 +13,11 @@
 import argparse
 import random
 
+from logs import cli_logging, get_logger
 from ttml import TtmlReader, TtmlWriter, f_to_hmsf, hmsf_to_f
 
+logger = get_logger(__name__)
+
 DESCRIPTION = """
 A script to degrade subtitle segmentation (in lines and captions) in a ttml file.
 The degradation can be achieved by shifting boundaries, adding new boundaries, deleting boundaries, or replacing
@@ -73,7 +76,7 @@ def shift(input_file_path, output_file_path, n, p_eol, p_eob):
     :param p_eol: proportion of eol boundaries to be shifted
     :param p_eob: proportion of eob boundaries to be shifted
     """
-    print('Initializing...')
+    logger.info('Initializing...')
     ttml_reader = TtmlReader(input_file_path)
     ttml_writer = TtmlWriter(output_file_path)
 
@@ -131,10 +134,10 @@ def shift(input_file_path, output_file_path, n, p_eol, p_eob):
     n_eol = ttml_reader.n_lines() - n_eob
     p_eol_xp = n_eol_shifts / n_eol
     p_eob_xp = n_eob_shifts / n_eob
-    print('n eol shifts:\n  %d (%.2f%%)' % (n_eol_shifts, 100 * p_eol_xp))
-    print('n eob shifts:\n  %d (%.2f%%)' % (n_eob_shifts, 100 * p_eob_xp))
+    logger.info('n eol shifts:\n  %d (%.2f%%)', n_eol_shifts, 100 * p_eol_xp)
+    logger.info('n eob shifts:\n  %d (%.2f%%)', n_eob_shifts, 100 * p_eob_xp)
 
-    print('Writing...')
+    logger.info('Writing...')
     ttml_writer.write()
 
 
@@ -149,7 +152,7 @@ def add(input_file_path, output_file_path, p_eol, p_eob):
     :param p_eol: proportion of eol boundaries to be added
     :param p_eob: proportion of eob boundaries to be added
     """
-    print('Initializing...')
+    logger.info('Initializing...')
     ttml_reader = TtmlReader(input_file_path)
     ttml_writer = TtmlWriter(output_file_path)
 
@@ -217,10 +220,10 @@ def add(input_file_path, output_file_path, p_eol, p_eob):
 
     p_eol_xp = n_added_eol / n_eol
     p_eob_xp = n_added_eob / n_eob
-    print('n eol additions:\n  %d (%.2f%%)' % (n_added_eol, 100 * p_eol_xp))
-    print('n eob additions:\n  %d (%.2f%%)' % (n_added_eob, 100 * p_eob_xp))
+    logger.info('n eol additions:\n  %d (%.2f%%)', n_added_eol, 100 * p_eol_xp)
+    logger.info('n eob additions:\n  %d (%.2f%%)', n_added_eob, 100 * p_eob_xp)
 
-    print('Writing...')
+    logger.info('Writing...')
     ttml_writer.write()
 
 
@@ -260,7 +263,7 @@ def delete(input_file_path, output_file_path, p_eol, p_eob):
     :param p_eol: proportion of eol boundaries to be deleted
     :param p_eob: proportion of eob boundaries to be deleted
     """
-    print('Initializing...')
+    logger.info('Initializing...')
     ttml_reader = TtmlReader(input_file_path)
     ttml_writer = TtmlWriter(output_file_path)
 
@@ -303,10 +306,10 @@ def delete(input_file_path, output_file_path, p_eol, p_eob):
     n_eol = ttml_reader.n_lines() - n_eob
     p_eol_xp = n_deleted_eol / n_eol
     p_eob_xp = n_deleted_eob / n_eob
-    print('n eol deletions:\n  %d (%.2f%%)' % (n_deleted_eol, 100 * p_eol_xp))
-    print('n eob deletions:\n  %d (%.2f%%)' % (n_deleted_eob, 100 * p_eob_xp))
+    logger.info('n eol deletions:\n  %d (%.2f%%)', n_deleted_eol, 100 * p_eol_xp)
+    logger.info('n eob deletions:\n  %d (%.2f%%)', n_deleted_eob, 100 * p_eob_xp)
 
-    print('Writing...')
+    logger.info('Writing...')
     ttml_writer.write()
 
 
@@ -322,7 +325,7 @@ def replace(input_file_path, output_file_path, p_eol, p_eob):
     :param p_eol: proportion of eol boundaries to be replaced
     :param p_eob: proportion of eob boundaries to be replaced
     """
-    print('Initializing...')
+    logger.info('Initializing...')
     ttml_reader = TtmlReader(input_file_path)
     ttml_writer = TtmlWriter(output_file_path)
 
@@ -380,10 +383,10 @@ def replace(input_file_path, output_file_path, p_eol, p_eob):
     n_eol = ttml_reader.n_lines() - n_eob
     p_eol_xp = n_replaced_eol / n_eol
     p_eob_xp = n_replaced_eob / n_eob
-    print('n eol replacements:\n  %d (%.2f%%)' % (n_replaced_eol, 100 * p_eol_xp))
-    print('n eob replacements:\n  %d (%.2f%%)' % (n_replaced_eob, 100 * p_eob_xp))
+    logger.info('n eol replacements:\n  %d (%.2f%%)', n_replaced_eol, 100 * p_eol_xp)
+    logger.info('n eob replacements:\n  %d (%.2f%%)', n_replaced_eob, 100 * p_eob_xp)
 
-    print('Writing...')
+    logger.info('Writing...')
     ttml_writer.write()
 
 
@@ -433,4 +436,5 @@ def main(args):
 
 
 if __name__ == '__main__':
+    cli_logging()
     main(parse_args())
@@ -22,15 +22,24 @@ if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
 import evalsub.util.constants as cst
+from evalsub.util.logs import get_logger
 from evalsub.util.util import postprocess, preprocess, replace_char, replace_substring
 
+logger = get_logger(__name__)
+
 
 # MIXED  ###############################################################################################################
 
-def mixed(input_file_path, output_file_path, p_add, p_del, p_rep, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
-    print('Initializing...')
-    tagged_txt = preprocess(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
+def mixed_str(tagged_txt, p_add, p_del, p_rep):
+    """
+    Degrade the text of a preprocessed string by adding, deleting and replacing words.
 
+    :param tagged_txt: preprocessed tagged string (see `preprocess`)
+    :param p_add: proportion of words to be added
+    :param p_del: proportion of words to be deleted
+    :param p_rep: proportion of words to be replaced
+    :return: degraded string (to be postprocessed), and number of words after degradation
+    """
     words = set(re.finditer(r"[^ %s%s\r\n]+" % (cst.LINE_HOLDER, cst.CAPTION_HOLDER), tagged_txt))
     space_positions = [m.start() for m in re.finditer(r" ", tagged_txt)]
 
@@ -42,11 +51,11 @@ def mixed(input_file_path, output_file_path, p_add, p_del, p_rep, line_tag=cst.L
     n_word_replacements = round(p_rep * n_words)
 
     # Sampling the words to delete
-    words_to_delete = random.sample(words, n_word_deletions)
+    words_to_delete = random.sample(sorted(words, key=lambda m: m.start()), n_word_deletions)
     words.difference_update(words_to_delete)
 
     # Sampling the words to replace
-    words_to_replace = random.sample(words, n_word_replacements)
+    words_to_replace = random.sample(sorted(words, key=lambda m: m.start()), n_word_replacements)
 
     # Sampling the words to add
     words_to_add = random.sample(space_positions, n_word_additions)
@@ -66,9 +75,18 @@ def mixed(input_file_path, output_file_path, p_add, p_del, p_rep, line_tag=cst.L
     # Inserting spaces besides masked chars
     tagged_txt = re.sub(cst.MASK_CHAR, r" %s " % cst.MASK_CHAR, tagged_txt)
 
-    print('Writing ' + output_file_path)
-    postprocess(tagged_txt, output_file_path, line_tag=line_tag, caption_tag=caption_tag)
-
     n_words += n_word_additions
     n_words -= n_word_deletions
+    return tagged_txt, n_words
+
+
+def mixed(input_file_path, output_file_path, p_add, p_del, p_rep, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
+    logger.info('Initializing...')
+    tagged_txt = preprocess(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
+
+    tagged_txt, n_words = mixed_str(tagged_txt, p_add, p_del, p_rep)
+
+    logger.info('Writing %s', output_file_path)
+    postprocess(tagged_txt, output_file_path, line_tag=line_tag, caption_tag=caption_tag)
+
     return n_words
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Logging of evalsub.
+
+Library functions do not print: they log their progress and scores with the loggers of their modules, under the
+`evalsub` logger. Nothing is output unless logging is configured (warnings excepted), so that evalsub can be embedded
+quietly. Command-line tools configure it with `cli_logging`, which prints the messages to the standard output, as they
+were printed before.
+"""
+
+import logging
+import sys
+
+LOGGER_NAME = 'evalsub'
+
+
+def get_logger(module_name):
+    """
+    Logger of an evalsub module (under the `evalsub` logger, also when the module is run as a script).
+    """
+    if module_name != LOGGER_NAME and not module_name.startswith(LOGGER_NAME + '.'):
+        module_name = '%s.%s' % (LOGGER_NAME, module_name)
+
+    return logging.getLogger(module_name)
+
+
+class StdoutHandler(logging.StreamHandler):
+    """
+    Handler printing messages to the current standard output, so that redirections of `sys.stdout` (e.g. to capture
+    the output of evaluation processes) apply to the logged messages.
+    """
+    def __init__(self):
+        super().__init__(sys.stdout)
+        self.setFormatter(logging.Formatter('%(message)s'))
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, stream):
+        pass
+
+
+def cli_logging(level=logging.INFO):
+    """
+    Print the messages of evalsub loggers of at least `level` to the standard output (command-line tools).
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if not any(isinstance(handler, StdoutHandler) for handler in logger.handlers):
+        logger.addHandler(StdoutHandler())
+    logger.setLevel(level)
+
+
+def cli_level():
+    """
+    Level of the command-line logging (None if not configured), to configure worker processes the same way.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if not any(isinstance(handler, StdoutHandler) for handler in logger.handlers):
+        return None
+
+    return logger.level
+
+
+def init_worker_logging(level):
+    """
+    Configure the logging of a worker process as in the main process (see `cli_level`).
+    """
+    if level is not None:
+        cli_logging(level)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Profiling of the evaluation stages.
+
+Evaluation code delimits its stages (file reading, preprocessing, automatic segmentation, metrics, bootstrap
+resampling...) with `profile_stage` blocks, which are recorded while a `profiling` block is running in the process.
+Otherwise (by default), `profile_stage` returns a shared no-op context manager, so that the instrumentation costs a
+function call per stage.
+
+For each stage, named after the stages it is nested in (e.g. `metric:sigma/bootstrap`), a profile records:
+
+* the wall time (in seconds),
+* the CPU time (in seconds), of the process and of its child processes which terminated during the stage (pools;
+  of the process only on platforms without the `resource` module, e.g. Windows),
+* the peak memory (in bytes) allocated by Python and NumPy during the stage, above the memory allocated at its start
+  (see `tracemalloc`, which slows allocations down while profiling).
+"""
+
+from contextlib import contextmanager, nullcontext
+import json
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from evalsub.util.logs import get_logger
+
+logger = get_logger(__name__)
+
+# Profile recorded in the process (None when profiling is disabled)
+PROFILE = None
+NULL_STAGE = nullcontext()
+
+WALL_TIME = 'wall_time'
+CPU_TIME = 'cpu_time'
+PEAK_MEMORY = 'peak_memory'
+MAX_RSS = 'max_rss'
+STAGE = 'stage'
+STAGES = 'stages'
+
+
+def cpu_time():
+    """
+    CPU time of the process and of its terminated child processes (of the process only without `resource`).
+    """
+    if resource is None:
+        return time.process_time()
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def max_rss():
+    """
+    Peak resident memory of the process, in bytes (None without `resource`).
+    """
+    if resource is None:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Stage:
+    """
+    Running stage of a profile.
+    """
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.start_memory = 0
+        self.peak_memory = 0
+        self.start_wall_time = 0.
+        self.start_cpu_time = 0.
+
+    def __enter__(self):
+        stack = self.profile.stack
+        memory, peak_memory = tracemalloc.get_traced_memory()
+        # The peak of the enclosing stage (or of the profile) is tracked across its nested stages
+        parent = stack[-1] if stack else self.profile
+        parent.peak_memory = max(parent.peak_memory, peak_memory)
+        if stack:
+            self.name = '%s/%s' % (stack[-1].name, self.name)
+        tracemalloc.reset_peak()
+        self.start_memory = self.peak_memory = memory
+        stack.append(self)
+        self.start_cpu_time = cpu_time()
+        self.start_wall_time = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.start_wall_time
+        cpu_time_ = cpu_time() - self.start_cpu_time
+        self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+
+        stack = self.profile.stack
+        stack.pop()
+        parent = stack[-1] if stack else self.profile
+        parent.peak_memory = max(parent.peak_memory, self.peak_memory)
+        self.profile.stages.append({STAGE: self.name, WALL_TIME: wall_time, CPU_TIME: cpu_time_,
+                                    PEAK_MEMORY: self.peak_memory - self.start_memory})
+
+        return False
+
+
+class Profile:
+    """
+    Stages recorded by a `profiling` block, in the order they ended, and totals of the block.
+    """
+    def __init__(self):
+        self.stages = list()
+        self.stack = list()  # running stages
+        self.totals = dict()
+        self.start_memory = self.peak_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self.start_cpu_time = cpu_time()
+        self.start_wall_time = time.perf_counter()
+
+    def stop(self):
+        self.totals = {WALL_TIME: time.perf_counter() - self.start_wall_time,
+                       CPU_TIME: cpu_time() - self.start_cpu_time,
+                       PEAK_MEMORY: max(self.peak_memory, tracemalloc.get_traced_memory()[1]) - self.start_memory,
+                       MAX_RSS: max_rss()}
+
+    def add_stages(self, stages):
+        """
+        Add stages recorded in another process (e.g. a pool process), nested in the current stage.
+        """
+        for stage in stages:
+            stage = dict(stage)
+            if self.stack:
+                stage[STAGE] = '%s/%s' % (self.stack[-1].name, stage[STAGE])
+            self.stages.append(stage)
+
+    def as_dict(self):
+        profile = dict(self.totals)
+        profile[STAGES] = self.stages
+
+        return profile
+
+
+def profile_stage(name):
+    """
+    Block of an evaluation stage, recorded in the profile of the process, if any.
+    """
+    if PROFILE is None:
+        return NULL_STAGE
+
+    return Stage(PROFILE, name)
+
+
+@contextmanager
+def profiling(enabled=True):
+    """
+    Record the profile of the stages run in the block (nothing if not `enabled`).
+
+    :return: the profile (None if not `enabled`), whose totals are set when the block ends
+    """
+    global PROFILE
+    if not enabled:
+        yield None
+        return
+
+    previous_profile = PROFILE
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profile = PROFILE = Profile()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        PROFILE = previous_profile
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def format_profile(profile):
+    """
+    Table of the stages of a profile (see `Profile.as_dict`), as lines.
+    """
+    lines = ['%-48s %10s %10s %12s' % ('Stage', 'Wall (s)', 'CPU (s)', 'Peak (MB)')]
+    for stage in profile[STAGES] + [dict(profile, **{STAGE: 'total'})]:
+        lines.append('%-48s %10.3f %10.3f %12.1f' % (stage[STAGE], stage[WALL_TIME], stage[CPU_TIME],
+                                                      stage[PEAK_MEMORY] / 2 ** 20))
+    if profile[MAX_RSS] is not None:
+        lines.append('Peak resident memory (MB): %.1f' % (profile[MAX_RSS] / 2 ** 20))
+
+    return lines
+
+
+def profiled_main(main, args, profile=False):
+    """
+    Run the main function of a command-line tool, and print the profile of its stages if `profile`.
+    """
+    with profiling(profile) as main_profile:
+        main(args)
+
+    if main_profile is not None:
+        for line in format_profile(main_profile.as_dict()):
+            logger.info('%s', line)
+
+
+class ProfileWriter:
+    """
+    JSONL file of profiles, one line per system, written as soon as each system is evaluated (appended to the file if
+    `resume`).
+    """
+    def __init__(self, file_path, resume=False):
+        self.file = open(file_path, 'a' if resume else 'w')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_profile(self, profile, **keys):
+        """
+        :param profile: profile (see `Profile.as_dict`)
+        :param keys: identification of the profile (e.g. system)
+        """
+        record = dict(keys)
+        record.update(profile)
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+import csv
+import json
+import math
+import os
+import sys
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+import evalsub.util.constants as cst
+
+
+def is_jsonl(file_path):
+    return file_path.endswith('.jsonl')
+
+
+def read_results(file_path):
+    """
+    Read the rows of a results file (CSV, or JSONL if the file name ends with .jsonl).
+
+    :return: column names (None if the file is empty or does not exist), and list of rows (dictionaries; CSV values
+        are strings)
+    """
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return None, list()
+
+    with open(file_path, 'r', newline='') as f:
+        if is_jsonl(file_path):
+            rows = [json.loads(line) for line in f if line.strip()]
+            columns = list(rows[0]) if rows else None
+        else:
+            reader = csv.DictReader(f)
+            rows = list(reader)
+            columns = reader.fieldnames
+
+    return columns, rows
+
+
+def truncate_partial_row(file_path):
+    """
+    Remove the last row of a results file if it was only partially written (interrupted evaluation).
+    """
+    if not os.path.exists(file_path):
+        return
+
+    with open(file_path, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+
+
+# WRITER  ##############################################################################################################
+
+class ResultsWriter:
+    """
+    Results file written row by row (one row per system), as soon as each system is evaluated: CSV, or JSONL if the
+    file name ends with .jsonl. Rows are flushed when written, and synced to disk every `sync_rows` rows, so that an
+    interrupted evaluation loses at most the systems being evaluated. Rows are identified by their values of
+    `key_columns` (e.g. system, or reference and system).
+    """
+    def __init__(self, file_path, columns, resume=False, sync_rows=cst.RESULTS_SYNC_ROWS, key_columns=(cst.SYSTEM,)):
+        self.file_path = file_path
+        self.columns = list(columns)
+        self.sync_rows = sync_rows
+        self.n_unsynced_rows = 0
+        self.jsonl = is_jsonl(file_path)
+        self.key_columns = key_columns
+
+        self.done_keys = set()
+        existing_columns = None
+        if resume:
+            truncate_partial_row(file_path)
+            existing_columns, rows = read_results(file_path)
+            if existing_columns is not None and set(existing_columns) != set(self.columns):
+                raise ValueError("Cannot resume %s: its columns (%s) differ from the computed ones (%s)"
+                                 % (file_path, ', '.join(existing_columns), ', '.join(self.columns)))
+            self.done_keys.update(self.row_key(row) for row in rows)
+        if existing_columns is not None:
+            # Keeping the column order of the file
+            self.columns = existing_columns
+
+        self.file = open(file_path, 'a' if resume else 'w', newline='')
+        if not self.jsonl:
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=self.columns)
+            if existing_columns is None:
+                self.csv_writer.writeheader()
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def row_key(self, row):
+        return tuple(row[column] for column in self.key_columns)
+
+    def is_done(self, *key):
+        return key in self.done_keys
+
+    def write_row(self, row):
+        if self.jsonl:
+            # NaN written as null
+            row = {column: None if isinstance(row[column], float) and math.isnan(row[column]) else row[column]
+                   for column in self.columns}
+            self.file.write(json.dumps(row) + '\n')
+        else:
+            self.csv_writer.writerow(row)
+        self.file.flush()
+        self.done_keys.add(self.row_key(row))
+
+        self.n_unsynced_rows += 1
+        if self.n_unsynced_rows >= self.sync_rows:
+            self.sync()
+
+    def sync(self):
+        if self.n_unsynced_rows:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.n_unsynced_rows = 0
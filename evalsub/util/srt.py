@@ -175,6 +175,24 @@ def srt_to_tagged_sents(srt_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CA
     return tagged_sents, time_spans
 
 
+def srt_lines(srt_file_path):
+    """
+    Subtitle lines of an SRT file, read caption by caption.
+
+    :return: generator of subtitle lines
+    """
+    srt_reader = SrtReader(srt_file_path)
+    try:
+        while srt_reader.read_caption():
+            yield from srt_reader.current_lines()
+    finally:
+        srt_reader.close()
+
+
+def hash_sub(srt_file_path):
+    return utl.hash_pieces(srt_lines(srt_file_path))[0]
+
+
 # MAIN FUNCTIONS  ######################################################################################################
 
 def srt_to_tagged_txt(srt_file_path, tagged_txt_file_path, timecode_file_path, line_tag=cst.LINE_TAG,
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+# Licensed under Creative Commons Attribution-NonCommercial-ShareAlike 4.0
+# International, (the "License");
+# you may not use this file except in compliance with the License.
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License
+
+"""
+Persistent index of subtitle file hashes (SQLite), to detect duplicate deliverables across directory trees.
+
+Each subtitle file (TTML, SRT or tagged text) is indexed with its size, its modification time and two hashes of its
+text (see `utl.hash_pieces`): a text hash, identical for files with the same text whatever their format, timing and
+segmentation, and a normalized hash (lowercased words without punctuation), identical for near-duplicates. Files are
+only hashed again when their size or modification time changed. Files without subtitle text (and .xml files which are
+not TTML documents) are not indexed.
+"""
+
+import argparse
+from collections import defaultdict
+import hashlib
+import os
+import sqlite3
+import sys
+import xml.etree.ElementTree as ET
+
+# We include the path of the toplevel package in the system path,
+# so we can always use absolute imports within the package.
+toplevel_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if toplevel_path not in sys.path:
+    sys.path.insert(1, toplevel_path)
+
+import evalsub.util.constants as cst
+from evalsub.util.logs import cli_logging, get_logger
+import evalsub.util.srt as utl_srt
+import evalsub.util.ttml as utl_ttml
+import evalsub.util.util as utl
+
+logger = get_logger(__name__)
+
+SUB_FORMATS = {'.ttml': 'ttml', '.xml': 'ttml', '.srt': 'srt', '.txt': 'tagged'}
+# Extensions of files which are subtitle files only if their content is (e.g. not every .xml file is a TTML file)
+CHECKED_EXTENSIONS = {'.xml'}
+# Normalized hash of a file without any word
+EMPTY_HASH = hashlib.md5().hexdigest()
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    norm_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_text_hash ON files (text_hash);
+CREATE INDEX IF NOT EXISTS files_norm_hash ON files (norm_hash);
+"""
+
+
+def sub_format(file_path):
+    """
+    Subtitle format of a file ('ttml', 'srt' or 'tagged'), from its extension (and from its root element for .xml
+    files).
+
+    :return: subtitle format (None if the file is not a subtitle file)
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    sub_fmt = SUB_FORMATS.get(extension)
+    if extension in CHECKED_EXTENSIONS and not utl_ttml.is_ttml(file_path):
+        return None
+
+    return sub_fmt
+
+
+def hash_sub_file(file_path, sub_fmt):
+    """
+    Text and normalized hashes of a subtitle file, computed while its lines are streamed.
+    """
+    if sub_fmt == 'ttml':
+        pieces = utl_ttml.ttml_lines(file_path)
+    elif sub_fmt == 'srt':
+        pieces = utl_srt.srt_lines(file_path)
+    else:
+        pieces = utl.tagged_txt_pieces(file_path)
+
+    return utl.hash_pieces(pieces)
+
+
+def open_index(index_file_path):
+    index_dir_path = os.path.dirname(os.path.abspath(index_file_path))
+    os.makedirs(index_dir_path, exist_ok=True)
+    connection = sqlite3.connect(index_file_path)
+    connection.executescript(INDEX_SCHEMA)
+
+    return connection
+
+
+def update_index(connection, dir_paths):
+    """
+    Index the subtitle files of directory trees: new or modified (size or modification time) files are hashed, and
+    the files which no longer exist are removed from the index.
+
+    :param connection: connection to the index database
+    :param dir_paths: directories to scan (recursively)
+    :return: numbers of hashed, unchanged and removed files
+    """
+    n_hashed = n_unchanged = 0
+    seen_paths = set()
+
+    for dir_path in dir_paths:
+        for root, _, file_names in os.walk(dir_path):
+            for file_name in sorted(file_names):
+                file_path = os.path.abspath(os.path.join(root, file_name))
+                sub_fmt = sub_format(file_path)
+                if sub_fmt is None:
+                    continue
+                seen_paths.add(file_path)
+
+                stat = os.stat(file_path)
+                row = connection.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (file_path,)).fetchone()
+                if row == (stat.st_size, stat.st_mtime_ns):
+                    n_unchanged += 1
+                    continue
+
+                try:
+                    text_hash, norm_hash = hash_sub_file(file_path, sub_fmt)
+                except (ET.ParseError, UnicodeDecodeError, ValueError, IndexError) as e:
+                    logger.warning("Skipping %s (%s)", file_path, e)
+                    continue
+                if norm_hash == EMPTY_HASH:
+                    # Files without subtitle text would all be grouped as duplicates of each other
+                    logger.info("Skipping %s (no subtitle text)", file_path)
+                    seen_paths.discard(file_path)
+                    continue
+                connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                   (file_path, stat.st_size, stat.st_mtime_ns, sub_fmt, text_hash, norm_hash))
+                n_hashed += 1
+            connection.commit()
+
+    # Removing the files of the scanned directories which no longer exist
+    n_removed = 0
+    for dir_path in dir_paths:
+        prefix = os.path.join(os.path.abspath(dir_path), '')
+        for (file_path,) in connection.execute("SELECT path FROM files WHERE substr(path, 1, ?) = ?",
+                                               (len(prefix), prefix)).fetchall():
+            if file_path not in seen_paths:
+                connection.execute("DELETE FROM files WHERE path = ?", (file_path,))
+                n_removed += 1
+    connection.commit()
+
+    return n_hashed, n_unchanged, n_removed
+
+
+def find_duplicates(connection):
+    """
+    Groups of indexed files with the same text (duplicates), and groups of files with the same normalized words but
+    different texts (near-duplicates).
+
+    :param connection: connection to the index database
+    :return: lists of duplicate and near-duplicate groups (lists of file paths)
+    """
+    text_groups = defaultdict(list)
+    norm_groups = defaultdict(set)
+    for file_path, text_hash, norm_hash in connection.execute("SELECT path, text_hash, norm_hash FROM files "
+                                                              "ORDER BY path"):
+        text_groups[text_hash].append(file_path)
+        norm_groups[norm_hash].add(text_hash)
+
+    duplicates = [paths for paths in text_groups.values() if len(paths) > 1]
+    near_duplicates = [sorted(path for text_hash in text_hashes for path in text_groups[text_hash])
+                       for text_hashes in norm_groups.values() if len(text_hashes) > 1]
+
+    return duplicates, near_duplicates
+
+
+def print_groups(title, groups):
+    print("%s: %d" % (title, len(groups)))
+    for paths in groups:
+        print()
+        for path in paths:
+            print("\t%s" % path)
+    print()
+
+
+# MAIN  ################################################################################################################
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--directories', '-d', type=str, nargs='+', required=True,
+                        help="Directories where to look for subtitle files (recursively).")
+    parser.add_argument('--index_file', '-if', type=str, default=os.path.join(cst.CACHE_DIR_PATH, 'sub_index.sqlite'),
+                        help="SQLite index file (by default, in the evalsub cache directory).")
+
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    dir_paths = args.directories
+    index_file_path = args.index_file
+
+    connection = open_index(index_file_path)
+    try:
+        n_hashed, n_unchanged, n_removed = update_index(connection, dir_paths)
+        print("Hashed files: %d, unchanged files: %d, removed files: %d" % (n_hashed, n_unchanged, n_removed))
+        print()
+
+        duplicates, near_duplicates = find_duplicates(connection)
+        print_groups("Duplicates (same text)", duplicates)
+        print_groups("Near-duplicates (same words, up to case and punctuation)", near_duplicates)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    cli_logging()
+    main(parse_args())
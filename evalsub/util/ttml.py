@@ -12,7 +12,6 @@
 
 import argparse
 from collections import OrderedDict
-import hashlib
 import math
 import os
 import re
@@ -40,9 +39,16 @@ MAX_CPS = 15
 MASK_CHAR = '#'
 LINE_TAG = '<eol>'
 CAPTION_TAG = '<eob>'
+TTML_NAMESPACE = 'http://www.w3.org/ns/ttml'
 TTML_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template.ttml')
-
-ET.register_namespace('', 'http://www.w3.org/ns/ttml')
+# Flesch Reading Ease (English) coefficients, as in textstat
+FRE_BASE = 206.835
+FRE_SENTENCE_LENGTH = 1.015
+FRE_SYLL_PER_WORD = 84.6
+# Approximate size (in characters) of the filtered text chunks used for the incremental FRE score
+FRE_CHUNK_SIZE = 10000
+
+ET.register_namespace('', TTML_NAMESPACE)
 ET.register_namespace('ttm', 'http://www.w3.org/ns/ttml#metadata')
 ET.register_namespace('ttp', 'http://www.w3.org/ns/ttml#parameter')
 ET.register_namespace('tts', 'http://www.w3.org/ns/ttml#styling')
@@ -112,8 +118,14 @@ def hmsf_to_s(hmsf):
     return s
 
 
+EOS_RE = re.compile(r'((?<!["( -][A-Z])\.|[!?])([")])?(?= |$)')
+MASK_MERGE_RE = re.compile(r"%s %s" % (MASK_CHAR, MASK_CHAR))
+MASK_REMOVE_RE = re.compile(r" %s+" % MASK_CHAR)
+MASK_REMOVE_TAIL_RE = re.compile(r" %s*$" % MASK_CHAR)
+
+
 def find_eos_positions(s):
-    return [m.end() for m in re.finditer(r'((?<!["( -][A-Z])\.|[!?])([")])?(?= |$)', s)]
+    return [m.end() for m in EOS_RE.finditer(s)]
 
 
 # READER  ##############################################################################################################
@@ -140,6 +152,7 @@ class TtmlReader:
         self.n_over_cps_captions = 0
         self.cps_sum = 0
         self.n_cps = 0  # nb of captions for which cps has been computed
+        self.caption_colors = list()  # colors of the lines of the last read caption
     
     def reinit(self):
         self.caption_index = -1
@@ -155,6 +168,7 @@ class TtmlReader:
         self.n_over_cps_captions = 0
         self.cps_sum = 0
         self.n_cps = 0
+        self.caption_colors = list()
     
     def read_line(self):
         # print("\t\tRead line", self.caption_next_index, self.line_next_index)#DEBUG#
@@ -182,6 +196,7 @@ class TtmlReader:
                 self.n_over_cpl_lines += 1
             
             color = self.current_color()
+            self.caption_colors.append(color)
             # There should not be colors other than those already in the counter...
             try:
                 self.color_count[color] += 1
@@ -210,6 +225,7 @@ class TtmlReader:
 
         self.n_filled_captions += 1
         lines = list()
+        self.caption_colors = list()
         caption_current_index = self.caption_next_index
         
         while self.caption_next_index == caption_current_index:
@@ -304,6 +320,10 @@ class TtmlReader:
         etime = hmsf_to_s(end)
         return etime
     
+    # "current" = wrt the last read caption
+    def current_colors(self):
+        return self.caption_colors
+    
     # "current" = wrt the last read line
     def current_color(self):
         line = self.root[1][0][self.caption_index][self.line_index]
@@ -355,51 +375,199 @@ class TtmlWriter:
 
 # FUNCTIONS  ###########################################################################################################
 
+def ttml_lines(ttml_file_path):
+    """
+    Subtitle lines of a TTML file (as read by `TtmlReader`, without filtering nor masking), parsed incrementally: each
+    caption is discarded once its lines are read, so that memory does not grow with the file size.
+
+    :return: generator of subtitle lines
+    """
+    # Elements being parsed, and their positions among their siblings (from the root)
+    parents = list()
+    positions = list()
+    n_children = [0]
+    for event, elem in ET.iterparse(ttml_file_path, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            positions.append(n_children[-1])
+            n_children[-1] += 1
+            n_children.append(0)
+            continue
+
+        parents.pop()
+        n_children.pop()
+        # Captions are the children of root[1][0]
+        if positions[1:3] == [1, 0] and len(positions) == 4:
+            for line in elem:
+                # Break marks <br/> have no text
+                if line.text is not None:
+                    yield line.text
+            parents[-1].remove(elem)
+        positions.pop()
+
+
+def is_ttml(xml_file_path):
+    """
+    Whether an XML file is a TTML document (its root element is a <tt> element, in the TTML namespace), read up to its
+    root element only.
+    """
+    try:
+        for _, elem in ET.iterparse(xml_file_path, events=('start',)):
+            return elem.tag in ('{%s}tt' % TTML_NAMESPACE, 'tt')
+    except (ET.ParseError, UnicodeDecodeError):
+        pass
+
+    return False
+
+
 def hash_sub(ttml_file_path):
-    # print('Computing the hash fingerprint:')
-    # print('Initializing...')
-    ttml_reader = TtmlReader(ttml_file_path, filtering=False, masking=False)
-    
-    # print('Reading file...')
-    all_sub = ttml_reader.read_all()
-    
-    # print('Applying md5 function...')
-    hash_key = hashlib.md5(all_sub.encode()).hexdigest()
-    
-    return hash_key
+    return utl.hash_pieces(ttml_lines(ttml_file_path))[0]
 
 
-def make_sub_stats(ttml_file_path):
-    # Subtitles with masking
-    ttml_reader = TtmlReader(ttml_file_path, filtering=False, masking=True)
-    masked_all_sub = ttml_reader.read_all()
+def merge_masks(pieces):
+    """
+    Streaming equivalent of `re.sub("# #", "###", ''.join(pieces))`.
 
-    # Subtitles with filtering
-    filtered_all_sub = masked_all_sub
-    filtered_all_sub = filtered_all_sub.lstrip(MASK_CHAR + ' ')
-    filtered_all_sub = re.sub(r" %s+" % MASK_CHAR, r"", filtered_all_sub)
+    :param pieces: iterable of strings
+    :return: generator of strings
+    """
+    carry = ''
+    for piece in pieces:
+        buffer = carry + piece
+        # Matches (3 characters) cannot start within the last 2 characters, which are kept for the next piece
+        carry_start = max(len(buffer) - 2, 0)
+        for match in MASK_MERGE_RE.finditer(buffer):
+            carry_start = max(carry_start, match.end())
+        yield MASK_MERGE_RE.sub(3 * MASK_CHAR, buffer[:carry_start])
+        carry = buffer[carry_start:]
+    yield carry
+
+
+def remove_masks(pieces):
+    """
+    Streaming equivalent of `re.sub(" #+", "", ''.join(pieces).lstrip("# "))`.
 
-    n_filtered_sub_chars = len(filtered_all_sub)
-    sub_fre_score = textstat.flesch_reading_ease(filtered_all_sub) if FRE else -1
+    :param pieces: iterable of strings
+    :return: generator of strings
+    """
+    carry = ''
+    stripping = True
+    for piece in pieces:
+        if stripping:
+            piece = piece.lstrip(MASK_CHAR + ' ')
+            stripping = not piece
+        buffer = carry + piece
+        # A space followed by masks at the end may continue in the next piece
+        tail = MASK_REMOVE_TAIL_RE.search(buffer)
+        carry_start = tail.start() if tail else len(buffer)
+        yield MASK_REMOVE_RE.sub('', buffer[:carry_start])
+        carry = buffer[carry_start:]
+    yield MASK_REMOVE_RE.sub('', carry)
+
+
+def fre_chunks(pieces, chunk_size=FRE_CHUNK_SIZE):
+    """
+    Group streamed text into chunks of about `chunk_size` characters, cut after a sentence end (or a space), so that
+    word and sentence counts can be summed over chunks.
 
-    # Full subtitles
-    ttml_reader.reinit()
-    ttml_reader.set_masking(False)
-    all_sub = ttml_reader.read_all()
+    :param pieces: iterable of strings
+    :return: generator of strings
+    """
+    buffer = ''
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) < chunk_size:
+            continue
+        eos_positions = find_eos_positions(buffer)
+        cut = eos_positions[-1] if eos_positions else buffer.rfind(' ')
+        if cut > 0:
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer:
+        yield buffer
+
+
+def incremental_fre(chunks):
+    """
+    Flesch Reading Ease score of a streamed text, from word, sentence and syllable counts summed over text chunks
+    (see `fre_chunks`). Sentences are counted by textstat within each chunk, so that the score may slightly differ
+    from textstat's score on the whole text.
+    """
+    n_words = n_sentences = n_syllables = 0
+    for chunk in chunks:
+        n_words += textstat.lexicon_count(chunk)
+        n_sentences += textstat.sentence_count(chunk)
+        n_syllables += textstat.syllable_count(chunk)
 
-    n_sub_chars = len(all_sub)
-    sub_eos_positions = find_eos_positions(all_sub)
-    n_segments = len(sub_eos_positions)
+    if n_words == 0 or n_sentences == 0 or n_syllables == 0:
+        return 0.0
 
-    # On prépare la tokenisation du sous-titre :
-    #   - en plaçant des espaces après les apostrophes (sauf dans le cas de "c'est" ou "s'est", 1 mot)
-    #   - en supprimant les espaces avant ":","!" ou "?" (on ne compte pas la ponctuation)
-    #   - en plaçant des espaces après les tirets (sauf ceux en début de phrase)
-    all_sub = re.sub(r"([^cCsS])'", r"\1' ", all_sub)
-    all_sub = re.sub(r" ([:!?])", r"\1", all_sub)
-    all_sub = re.sub(r"([^ ])-", r"\1- ", all_sub)
+    return round(FRE_BASE - FRE_SENTENCE_LENGTH * n_words / n_sentences - FRE_SYLL_PER_WORD * n_syllables / n_words,
+                 2)
 
-    n_sub_words = len(all_sub.split(' '))
+
+def make_sub_stats(ttml_file_path):
+    """
+    Compute the statistics of a TTML subtitle file, reading it once.
+
+    Masked (filtered colors) and full subtitles are processed caption by caption: character, word and sentence
+    counts are accumulated as the captions are read, and the filtered text is streamed to the FRE score (if textstat
+    is available).
+
+    :param ttml_file_path: TTML subtitle file
+    :return: dictionary of statistics
+    """
+    ttml_reader = TtmlReader(ttml_file_path, filtering=False, masking=False)
+
+    n_sub_chars = 0
+    n_segments = 0
+    n_sub_words = 1
+    filtered_lens = list()
+
+    def masked_pieces():
+        nonlocal n_sub_chars, n_segments, n_sub_words
+
+        first = True
+        while not ttml_reader.is_file_over():
+            lines = ttml_reader.read_caption(flat=False)
+            colors = ttml_reader.current_colors()
+            caption = ' '.join(lines)
+            masked_lines = [len(line) * MASK_CHAR if i < len(colors) and colors[i] in ttml_reader.color_filter
+                            else line for i, line in enumerate(lines)]
+            masked_caption = MASK_MERGE_RE.sub(3 * MASK_CHAR, ' '.join(masked_lines))
+
+            # Full subtitles (captions are joined with spaces, which give the left context of the regexes)
+            context = '' if first else ' '
+            n_sub_chars += len(context) + len(caption)
+            n_segments += len(find_eos_positions(context + caption))
+            # On prépare la tokenisation du sous-titre :
+            #   - en plaçant des espaces après les apostrophes (sauf dans le cas de "c'est" ou "s'est", 1 mot)
+            #   - en supprimant les espaces avant ":","!" ou "?" (on ne compte pas la ponctuation)
+            #   - en plaçant des espaces après les tirets (sauf ceux en début de phrase)
+            # Words are then counted as the number of spaces (+ 1)
+            tokenized = re.sub(r"([^cCsS])'", r"\1' ", context + caption)
+            tokenized = re.sub(r" ([:!?])", r"\1", tokenized)
+            tokenized = re.sub(r"([^ ])-", r"\1- ", tokenized)
+            n_sub_words += tokenized.count(' ')
+
+            if not first:
+                yield ' '
+            yield masked_caption
+            first = False
+
+    def filtered_pieces():
+        for piece in remove_masks(merge_masks(masked_pieces())):
+            filtered_lens.append(len(piece))
+            yield piece
+
+    # Subtitles with filtering (masked lines removed)
+    if FRE:
+        sub_fre_score = incremental_fre(fre_chunks(filtered_pieces()))
+    else:
+        sub_fre_score = -1
+        for _ in filtered_pieces():
+            pass
+    n_filtered_sub_chars = sum(filtered_lens)
 
     sub_stats = dict()
 
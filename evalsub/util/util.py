@@ -10,13 +10,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License
 
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import inspect
 import os
 import re
 import sys
-
-import suber.data_types as subertyp
-from suber.hyp_to_ref_alignment import levenshtein_align_hypothesis_to_reference
-from suber.utilities import segment_to_string
+import tempfile
 
 # We include the path of the toplevel package in the system path,
 # so we can always use absolute imports within the package.
@@ -25,6 +26,7 @@ if toplevel_path not in sys.path:
     sys.path.insert(1, toplevel_path)
 
 import evalsub.util.constants as cst
+from evalsub.util.profiling import profile_stage
 import evalsub.util.srt as utl_srt
 import evalsub.util.ttml as utl_ttml
 
@@ -40,12 +42,13 @@ def get_masses(file_path, srt=False, ttml=False, line_tag=cst.LINE_TAG, caption_
     :param caption_tag: end of caption/block boundary tag
     :return: segmentation masses (segeval.BoundaryFormat.mass format)
     """
-    if ttml:
-        tagged_str, _ = utl_ttml.ttml_to_tagged_str(file_path, line_tag=line_tag, caption_tag=caption_tag)
-    elif srt:
-        tagged_str, _ = utl_srt.srt_to_tagged_str(file_path, line_tag=line_tag, caption_tag=caption_tag)
-    else:
-        tagged_str = ' '.join([line.strip() for line in open(file_path).readlines()])
+    with profile_stage('read'):
+        if ttml:
+            tagged_str, _ = utl_ttml.ttml_to_tagged_str(file_path, line_tag=line_tag, caption_tag=caption_tag)
+        elif srt:
+            tagged_str, _ = utl_srt.srt_to_tagged_str(file_path, line_tag=line_tag, caption_tag=caption_tag)
+        else:
+            tagged_str = ' '.join([line.strip() for line in open(file_path).readlines()])
 
     # Quick pre-processing before splitting
     # Removing (potential) multiple spaces
@@ -68,8 +71,70 @@ def get_masses(file_path, srt=False, ttml=False, line_tag=cst.LINE_TAG, caption_
     return eob_masses, eol_masses, eox_masses
 
 
-def postprocess(tagged_str, output_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
-                line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER):
+# Per-process cache of the reference preprocessing, by reference file, from the least to the most recently used
+# (reference file -> (function, arguments) -> (file size and mtime, result))
+REF_CACHE = OrderedDict()
+# Maximum number of reference files in the cache (unbounded if None)
+REF_CACHE_MAX_REFS = cst.REF_CACHE_MAX_REFS
+
+
+def set_ref_cache_max_refs(max_refs):
+    """
+    Set the maximum number of reference files whose preprocessing is cached in the process (unbounded if None), and
+    evict the least recently used ones above it (see `cached_ref`).
+    """
+    global REF_CACHE_MAX_REFS
+    REF_CACHE_MAX_REFS = max_refs
+    while REF_CACHE_MAX_REFS is not None and len(REF_CACHE) > REF_CACHE_MAX_REFS:
+        REF_CACHE.popitem(last=False)
+
+
+def cached_ref(fn, ref_file_path, **kwargs):
+    """
+    Result of `fn(ref_file_path, **kwargs)` (e.g. `preprocess` or `get_masses`), computed once per process for a
+    reference file evaluated against several systems (and again if the file changed). The result is shared between
+    calls, and must not be modified. The preprocessing of at most `REF_CACHE_MAX_REFS` reference files is kept, the
+    least recently used one being evicted first.
+
+    :param fn: reference preprocessing function
+    :param ref_file_path: reference file
+    :param kwargs: arguments of fn
+    :return: result of fn
+    """
+    ref_file_path = os.path.abspath(ref_file_path)
+    arguments = inspect.signature(fn).bind(ref_file_path, **kwargs)
+    arguments.apply_defaults()
+    key = (fn.__module__, fn.__qualname__, tuple(arguments.arguments.items()))
+    stat = os.stat(ref_file_path)
+    file_id = (stat.st_size, stat.st_mtime_ns)
+
+    ref_entries = REF_CACHE.get(ref_file_path)
+    if ref_entries is None:
+        ref_entries = REF_CACHE[ref_file_path] = dict()
+        set_ref_cache_max_refs(REF_CACHE_MAX_REFS)
+    else:
+        REF_CACHE.move_to_end(ref_file_path)
+
+    entry = ref_entries.get(key)
+    if entry is None or entry[0] != file_id:
+        entry = (file_id, fn(*arguments.args, **arguments.kwargs))
+        ref_entries[key] = entry
+
+    return entry[1]
+
+
+def evict_ref(ref_file_path):
+    """
+    Remove the cached preprocessing of a reference file (see `cached_ref`).
+    """
+    REF_CACHE.pop(os.path.abspath(ref_file_path), None)
+
+
+def postprocess_lines(tagged_str, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
+                      line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER):
+    """
+    Convert a preprocessed string back to tagged file lines (inverse of `preprocess_str`).
+    """
     # Replacing 1-char placeholders with boundaries
     tagged_str = re.sub(line_holder, line_tag, tagged_str)
     tagged_str = re.sub(caption_holder, caption_tag, tagged_str)
@@ -79,10 +144,30 @@ def postprocess(tagged_str, output_file_path, line_tag=cst.LINE_TAG, caption_tag
     tagged_str = re.sub(r" {2,}", r" ", tagged_str)
     # Segmenting in file lines
     tagged_lines = [line.strip() for line in tagged_str.splitlines()]
+
+    return tagged_lines
+
+
+def postprocess(tagged_str, output_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG,
+                line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER):
+    tagged_lines = postprocess_lines(tagged_str, line_tag=line_tag, caption_tag=caption_tag,
+                                     line_holder=line_holder, caption_holder=caption_holder)
     # Writing
     write_lines(tagged_lines, output_file_path)
 
 
+def renormalize(tagged_str, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG, line_holder=cst.LINE_HOLDER,
+                caption_holder=cst.CAPTION_HOLDER):
+    """
+    Normalize an (edited) preprocessed string as if it was written with `postprocess` and read back with
+    `preprocess`, without going through a file.
+    """
+    tagged_lines = postprocess_lines(tagged_str, line_tag=line_tag, caption_tag=caption_tag,
+                                     line_holder=line_holder, caption_holder=caption_holder)
+    return preprocess_str('\n'.join(tagged_lines), line_tag=line_tag, caption_tag=caption_tag,
+                          line_holder=line_holder, caption_holder=caption_holder)
+
+
 def preprocess(input_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG, line_holder=cst.LINE_HOLDER,
                caption_holder=cst.CAPTION_HOLDER, srt=False):
     r"""
@@ -106,12 +191,22 @@ def preprocess(input_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_T
     :param srt: wether the input file is in srt format
     :return: Preprocessed string
     """
-    if srt:
-        tagged_sents, _ = utl_srt.srt_to_tagged_sents(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
-        tagged_str = '\n'.join(tagged_sents)
-    else:
-        tagged_str = open(input_file_path).read()
+    with profile_stage('read'):
+        if srt:
+            tagged_sents, _ = utl_srt.srt_to_tagged_sents(input_file_path, line_tag=line_tag, caption_tag=caption_tag)
+            tagged_str = '\n'.join(tagged_sents)
+        else:
+            tagged_str = open(input_file_path).read()
+
+    return preprocess_str(tagged_str, line_tag=line_tag, caption_tag=caption_tag, line_holder=line_holder,
+                          caption_holder=caption_holder)
 
+
+def preprocess_str(tagged_str, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG, line_holder=cst.LINE_HOLDER,
+                   caption_holder=cst.CAPTION_HOLDER):
+    """
+    Preprocess a tagged string (see `preprocess`).
+    """
     tagged_str = tagged_str.strip()
     # Removing potential multiple spaces
     tagged_str = re.sub(r" {2,}", r" ", tagged_str)
@@ -135,6 +230,9 @@ def replace_substring(string, start, end, substring):
 
 
 def suber_format(tagged_str, line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER):
+    # SubER (and numpy) are only imported when automatic segmentation is used
+    import suber.data_types as subertyp
+
     # Inserting spaces besides 1-char placeholders
     tagged_str = re.sub(r"(%s|%s)" % (line_holder, caption_holder), r" \1 ", tagged_str)
 
@@ -158,13 +256,152 @@ def suber_format(tagged_str, line_holder=cst.LINE_HOLDER, caption_holder=cst.CAP
     return suber_segments
 
 
-def suber_auto_seg(ref_tagged_str, sys_tagged_str, line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER,
-                   sys_file_path=None):
+@lru_cache(maxsize=None)
+def suber_version():
+    from importlib import metadata
+
+    try:
+        return metadata.version(metadata.packages_distributions()['suber'][0])
+    except (KeyError, IndexError, metadata.PackageNotFoundError):
+        return 'unknown'
+
+
+def auto_seg_key(ref_tagged_str, sys_tagged_str, line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER,
+                 max_chunk_size=None):
+    """
+    Content hash identifying an automatic segmentation: reference hash, system hash, alignment settings and versions.
+    """
+    ref_hash = hashlib.sha256(ref_tagged_str.encode('utf-8')).hexdigest()
+    sys_hash = hashlib.sha256(sys_tagged_str.encode('utf-8')).hexdigest()
+    settings = "%s|%s|%s|%s|%s" % (line_holder, caption_holder, max_chunk_size, cst.AUTO_SEG_VERSION, suber_version())
+
+    return hashlib.sha256(("%s|%s|%s" % (ref_hash, sys_hash, settings)).encode('utf-8')).hexdigest()
+
+
+def normalize_words(text):
+    """
+    Lowercased words of a text, without punctuation (for near-duplicate detection).
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+def hash_pieces(pieces):
+    """
+    md5 hashes of a text given as a stream of pieces (e.g. subtitle lines), updated piece by piece, at constant memory.
+
+    :param pieces: iterable of strings
+    :return: hash of the pieces joined by spaces, and hash of their normalized words (see `normalize_words`)
+    """
+    text_hash = hashlib.md5()
+    norm_hash = hashlib.md5()
+
+    for i, piece in enumerate(pieces):
+        if i > 0:
+            text_hash.update(b' ')
+        text_hash.update(piece.encode())
+        for word in normalize_words(piece):
+            norm_hash.update(word.encode() + b' ')
+
+    return text_hash.hexdigest(), norm_hash.hexdigest()
+
+
+def tagged_txt_pieces(tagged_txt_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
+    """
+    Subtitle lines of a tagged text file, read line by line.
+
+    :return: generator of subtitle lines (text between segmentation tags)
+    """
+    with open(tagged_txt_file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            for piece in re.split(r"\s*(?:%s|%s)\s*" % (line_tag, caption_tag), line.strip()):
+                if piece:
+                    yield piece
+
+
+def hash_tagged_txt(tagged_txt_file_path, line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG):
+    return hash_pieces(tagged_txt_pieces(tagged_txt_file_path, line_tag=line_tag, caption_tag=caption_tag))[0]
+
+
+# In-process memoization of the most recently used automatic segmentations (key -> segmented system sentences)
+AUTO_SEG_MEMO = OrderedDict()
+
+
+def suber_auto_seg_sents(ref_tagged_str, sys_tagged_str, line_holder=cst.LINE_HOLDER,
+                         caption_holder=cst.CAPTION_HOLDER, max_chunk_size=None, n_jobs=1):
+    """
+    Segment the system text according to the reference sentences, with SubER Levenshtein alignment.
+
+    :return: segmented system sentences (with `cst.LINE_TAG` and `cst.CAPTION_TAG` boundaries)
+    """
+    from suber.hyp_to_ref_alignment import levenshtein_align_hypothesis_to_reference
+    from suber.utilities import segment_to_string
+
+    from evalsub.util.alignment import chunked_align_hypothesis_to_reference
+
     ref_suber_segments = suber_format(ref_tagged_str, line_holder=line_holder, caption_holder=caption_holder)
     sys_suber_segments = suber_format(sys_tagged_str, line_holder=line_holder, caption_holder=caption_holder)
-    sys_suber_auto_segments = levenshtein_align_hypothesis_to_reference(hypothesis=sys_suber_segments,
-                                                                        reference=ref_suber_segments)
-    sys_tagged_sents = [segment_to_string(segment, include_line_breaks=True) for segment in sys_suber_auto_segments]
+    if max_chunk_size is None:
+        sys_suber_auto_segments = levenshtein_align_hypothesis_to_reference(hypothesis=sys_suber_segments,
+                                                                            reference=ref_suber_segments)
+    else:
+        sys_suber_auto_segments = chunked_align_hypothesis_to_reference(sys_suber_segments, ref_suber_segments,
+                                                                        max_chunk_size, n_jobs=n_jobs)
+
+    return [segment_to_string(segment, include_line_breaks=True) for segment in sys_suber_auto_segments]
+
+
+def suber_auto_seg(ref_tagged_str, sys_tagged_str, line_holder=cst.LINE_HOLDER, caption_holder=cst.CAPTION_HOLDER,
+                   sys_file_path=None, max_chunk_size=None, n_jobs=1, cache_dir_path=cst.CACHE_DIR_PATH,
+                   out_dir_path=None):
+    """
+    Segment the system text according to the reference sentences, with SubER Levenshtein alignment.
+
+    Segmentations are memoized within the process (the last `cst.AUTO_SEG_MEMO_SIZE` ones), and persisted in
+    `cache_dir_path` (keyed by `auto_seg_key`), so that the alignment runs once per reference and system pair, e.g.
+    for both Sigma and TER_br.
+
+    :param ref_tagged_str: preprocessed reference string
+    :param sys_tagged_str: preprocessed system string
+    :param line_holder: placeholder for end-of-line tag
+    :param caption_holder: placeholder for end-of-bloc/caption tag
+    :param sys_file_path: if set, the segmented system text is written to a file named after it (with suffix
+        '_AS.txt')
+    :param max_chunk_size: if set, words are aligned by spans of at most this size, split at confident matches
+        (bounded memory on long documents, see `evalsub.util.alignment`)
+    :param n_jobs: number of processes used to align the spans (when `max_chunk_size` is set)
+    :param cache_dir_path: directory of the persistent cache (no persistent cache if None)
+    :param out_dir_path: directory where to write the segmented system text (next to the system file if None)
+    :return: preprocessed segmented system string
+    """
+    key = auto_seg_key(ref_tagged_str, sys_tagged_str, line_holder=line_holder, caption_holder=caption_holder,
+                       max_chunk_size=max_chunk_size)
+    cache_file_path = None
+    if cache_dir_path is not None:
+        cache_file_path = os.path.join(cache_dir_path, 'auto_seg', key[:2], key + '.txt')
+
+    if key in AUTO_SEG_MEMO:
+        sys_tagged_sents = AUTO_SEG_MEMO[key]
+        AUTO_SEG_MEMO.move_to_end(key)
+    else:
+        if cache_file_path is not None and os.path.isfile(cache_file_path):
+            with open(cache_file_path) as file:
+                sys_tagged_sents = file.read().split('\n')
+        else:
+            with profile_stage('auto_seg'):
+                sys_tagged_sents = suber_auto_seg_sents(ref_tagged_str, sys_tagged_str, line_holder=line_holder,
+                                                        caption_holder=caption_holder, max_chunk_size=max_chunk_size,
+                                                        n_jobs=n_jobs)
+            if cache_file_path is not None:
+                write_lines(['\n'.join(sys_tagged_sents)], cache_file_path, newline=False, atomic=True)
+        AUTO_SEG_MEMO[key] = sys_tagged_sents
+        while len(AUTO_SEG_MEMO) > cst.AUTO_SEG_MEMO_SIZE:
+            AUTO_SEG_MEMO.popitem(last=False)
+
+    if sys_file_path is not None:
+        auto_seg_file_name = os.path.splitext(os.path.basename(sys_file_path))[0] + "_AS.txt"
+        auto_seg_dir_path = out_dir_path if out_dir_path is not None else os.path.dirname(sys_file_path)
+        write_lines(sys_tagged_sents, os.path.join(auto_seg_dir_path, auto_seg_file_name), atomic=True)
+
     sys_tagged_str = "\n".join(sys_tagged_sents)
 
     # Removing spaces around boundaries (it is important to keep cst.LINE_TAG and cst.CAPTION_TAG here)
@@ -173,22 +410,31 @@ def suber_auto_seg(ref_tagged_str, sys_tagged_str, line_holder=cst.LINE_HOLDER,
     sys_tagged_str = re.sub(cst.LINE_TAG, line_holder, sys_tagged_str)
     sys_tagged_str = re.sub(cst.CAPTION_TAG, caption_holder, sys_tagged_str)
 
-    if sys_file_path is not None:
-        auto_seg_file_path = os.path.splitext(sys_file_path)[0] + "_AS.txt"
-        write_lines(sys_tagged_sents, auto_seg_file_path)
-
     return sys_tagged_str
 
 
-def write_lines(lines, file_path, newline=True, add=False, make_dir=True, convert=False):
+def write_lines(lines, file_path, newline=True, add=False, make_dir=True, convert=False, atomic=False):
     mode = 'a' if add else 'w'
-    if make_dir:
-        dir_path = os.path.dirname(file_path)
-        if dir_path:
-            os.makedirs(dir_path, exist_ok=True)
+    dir_path = os.path.dirname(file_path)
+    if make_dir and dir_path:
+        os.makedirs(dir_path, exist_ok=True)
     if convert:
         lines = map(str, lines)
     if newline:
         lines = map(lambda line: line + '\n', lines)
-    with open(file_path, mode) as file:
-        file.writelines(lines)
+    if atomic and not add:
+        # Written to a temporary file first, then renamed, so that concurrent readers never see partial files
+        fd, tmp_file_path = tempfile.mkstemp(dir=dir_path or None, prefix='.' + os.path.basename(file_path) + '.')
+        umask = os.umask(0)
+        os.umask(umask)
+        try:
+            os.chmod(tmp_file_path, 0o666 & ~umask)
+            with os.fdopen(fd, mode) as file:
+                file.writelines(lines)
+            os.replace(tmp_file_path, file_path)
+        except BaseException:
+            os.remove(tmp_file_path)
+            raise
+    else:
+        with open(file_path, mode) as file:
+            file.writelines(lines)
@@ -11,98 +11,113 @@
 # limitations under the License
 
 import argparse
+from collections import Counter
+from contextlib import nullcontext
+import logging
 import os.path
 
-import pandas as pd
-
-from evalsub.eval.seg_eval import seg_process
-from evalsub.eval.f1_eval import f1_process
-from evalsub.eval.cpl_eval import cpl_process
-from evalsub.eval.ter_eval import ter_process
-from evalsub.eval.sigma_eval import sigma_process
+from evalsub.api import evaluate, evaluate_pairs, evaluate_systems, manifest_path, read_manifest, result_columns
+from evalsub.shard_stats import evaluate_systems_stats, write_stats
 import evalsub.util.constants as cst
+from evalsub.util.logs import cli_logging, get_logger
+from evalsub.util.profiling import STAGES, ProfileWriter, profile_stage, profiling
+from evalsub.util.results import ResultsWriter
+
+logger = get_logger(__name__)
 
 DESCRIPTION = """
 Run EvalSub tool to compute segmentation metrics
 """
 
 
-def run_evaluation(ref_file_path, sys_file_path, results, window_size=None, nt=cst.DEFAULT_NT, max_cpl=cst.MAX_CPL,
-                   srt=False, auto_seg=False, confidence_interval=False):
-
-    results[cst.SYSTEM].append(os.path.basename(sys_file_path))
-    print("Evaluating " + sys_file_path)
-
-    if cst.PK in results or cst.WIN_DIFF in results or cst.SEG_SIM in results or cst.BOUND_SIM in results:
-        win_size, pk, win_diff, seg_sim, bound_sim = seg_process(sys_file_path, ref_file_path, srt=srt,
-                                                                 window_size=window_size, nt=nt)
-        if cst.WIN_SIZE in results:
-            results[cst.WIN_SIZE].append(win_size)
-        if cst.PK in results:
-            results[cst.PK].append(pk)
-            print('Pk: ' + str(round(pk, 3)))
-        if cst.WIN_DIFF in results:
-            results[cst.WIN_DIFF].append(win_diff)
-            print('WindowDiff: ' + str(round(win_diff, 3)))
-        if cst.NT in results:
-            results[cst.NT].append(nt)
-        if cst.SEG_SIM in results:
-            results[cst.SEG_SIM].append(seg_sim)
-            print('Segmentation similarity: ' + str(round(seg_sim, 3)))
-        if cst.BOUND_SIM in results:
-            results[cst.BOUND_SIM].append(bound_sim)
-            print('Boundary similarity: ' + str(round(bound_sim, 3)))
-
-    if cst.CPL_CONF in results:
-        cpl_conf = cpl_process(sys_file_path, max_cpl=max_cpl, srt=srt)
-        results[cst.CPL_CONF].append(cpl_conf)
-        print("CPL conformity: " + str(round(cpl_conf, 2)) + '%')
-
-    if cst.BLEU_BR in results or cst.BLEU_NB in results or cst.SIGMA in results:
-        sigma_score = sigma_process(ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg,
-                                    confidence_interval=confidence_interval)
-        bleu_br = sigma_score[cst.BLEU_BR]
-        bleu_nb = sigma_score[cst.BLEU_NB]
-        alpha = sigma_score[cst.ALPHA]
-        sigma = sigma_score[cst.SIGMA]
-        if cst.BLEU_BR in results:
-            results[cst.BLEU_BR].append(bleu_br.score)
-            print('BLEU_br: ' + bleu_br.format(score_only=True))
-        if cst.BLEU_NB in results:
-            results[cst.BLEU_NB].append(bleu_nb.score)
-            print('BLEU_nb: ' + bleu_nb.format(score_only=True))
-        if cst.ALPHA in results:
-            results[cst.ALPHA].append(alpha)
-        if cst.SIGMA in results:
-            results[cst.SIGMA].append(sigma.score)
-            print('Sigma: ' + sigma.format(score_only=True))
-
-    if cst.TER_BR in results:
-        ter_br = ter_process(ref_file_path, sys_file_path, srt=srt, auto_seg=auto_seg).score
-        results[cst.TER_BR].append(ter_br)
-        print('TER_br: ' + str(round(ter_br, 2)))
-
-    if cst.PRECISION in results or cst.RECALL in results or cst.F1 in results:
-        precision, recall, f1 = f1_process(ref_file_path, sys_file_path, cst.NEUTRAL_TAG, srt=srt,
-                                           line_tag=cst.LINE_TAG, caption_tag=cst.CAPTION_TAG)
-        if cst.PRECISION in results:
-            results[cst.PRECISION].append(precision)
-            print('Precision: ' + str(round(precision, 3)))
-        if cst.RECALL in results:
-            results[cst.RECALL].append(recall)
-            print('Recall: ' + str(round(recall, 3)))
-        if cst.F1 in results:
-            results[cst.F1].append(f1)
-            print('F1: ' + str(round(f1, 3)))
-
-
-def run_evaluations(ref_file_path, sys_file_paths, results, window_size=None, nt=cst.DEFAULT_NT, max_cpl=cst.MAX_CPL,
-                    srt=False, auto_seg=False, confidence_interval=False):
-
-    for sys_file_path in sys_file_paths:
-        run_evaluation(
-            ref_file_path, sys_file_path, results, window_size=window_size, nt=nt, max_cpl=max_cpl,
-            srt=srt, auto_seg=auto_seg, confidence_interval=confidence_interval)
+def write_result(writer, row, result, profile_writer=None, **keys):
+    """
+    Write the results row of a system, and its profile (with the writing of the row) if it was profiled.
+
+    :param profile_writer: profile file (see `ProfileWriter`)
+    :param keys: identification of the profile in the profile file
+    """
+    with profiling(result.profile is not None) as write_profile:
+        with profile_stage('write_results'):
+            writer.write_row(row)
+
+    if profile_writer is not None:
+        profile = dict(result.profile)
+        profile[STAGES] = profile[STAGES] + write_profile.stages
+        profile_writer.write_profile(profile, **keys)
+
+
+def evaluate_manifest(manifest_file_path, res_file_path, metrics, resume=False, n_jobs=1, profile_file_path=None,
+                      **kwargs):
+    """
+    Evaluate the reference/system pairs of a manifest (see `read_manifest`), and write their results in a single
+    results file, with the reference and system paths of the manifest and its metadata columns.
+
+    :param profile_file_path: JSONL file where to write the profiles of the pairs (if profiled)
+    :param kwargs: evaluation settings (see `evaluate`)
+    """
+    metadata_columns, manifest_rows = read_manifest(manifest_file_path)
+    score_columns = result_columns(metrics, profile=kwargs.get('profile', False))[1:]
+    conflicting_columns = set(metadata_columns).intersection([cst.REFERENCE, cst.SYSTEM] + score_columns)
+    if conflicting_columns:
+        raise ValueError("Manifest metadata columns conflicting with the results columns: %s"
+                         % ', '.join(sorted(conflicting_columns)))
+    columns = [cst.REFERENCE, cst.SYSTEM] + metadata_columns + score_columns
+
+    with ResultsWriter(res_file_path, columns, resume=resume, key_columns=(cst.REFERENCE, cst.SYSTEM)) as writer, \
+            (ProfileWriter(profile_file_path, resume=resume) if profile_file_path else nullcontext()) as profile_writer:
+        if resume:
+            manifest_rows = [manifest_row for manifest_row in manifest_rows
+                             if not writer.is_done(manifest_row[cst.MANIFEST_REFERENCE],
+                                                   manifest_row[cst.MANIFEST_SYSTEM])]
+        logger.info('Pairs to evaluate: %d', len(manifest_rows))
+
+        pairs = [(manifest_path(manifest_file_path, manifest_row[cst.MANIFEST_REFERENCE]),
+                  manifest_path(manifest_file_path, manifest_row[cst.MANIFEST_SYSTEM]))
+                 for manifest_row in manifest_rows]
+        for i, result in evaluate_pairs(pairs, metrics=metrics, n_jobs=n_jobs, **kwargs):
+            manifest_row = manifest_rows[i]
+            row = {cst.REFERENCE: manifest_row[cst.MANIFEST_REFERENCE], cst.SYSTEM: manifest_row[cst.MANIFEST_SYSTEM]}
+            row.update((column, manifest_row[column]) for column in metadata_columns)
+            row.update((column, value) for column, value in result.row().items() if column != cst.SYSTEM)
+            write_result(writer, row, result, profile_writer=profile_writer, reference=row[cst.REFERENCE],
+                         system=row[cst.SYSTEM])
+
+
+def emit_stats(ref_file_path, sys_file_paths, stats_dir_path, metrics, n_jobs=1, **kwargs):
+    """
+    Write the sufficient statistics of each system (see `evaluate_stats`) to a statistics file in `stats_dir_path`,
+    named after the system file.
+
+    :param kwargs: evaluation settings (see `evaluate_stats`)
+    """
+    unmergeable_metrics = set(metrics).difference(cst.MERGEABLE_METRICS)
+    if unmergeable_metrics:
+        logger.warning('Skipping the metrics without sufficient statistics: %s', ', '.join(sorted(unmergeable_metrics)))
+        metrics = [metric for metric in metrics if metric in cst.MERGEABLE_METRICS]
+
+    os.makedirs(stats_dir_path, exist_ok=True)
+    for sys_file_path, stats in zip(sys_file_paths, evaluate_systems_stats(ref_file_path, sys_file_paths,
+                                                                           metrics=metrics, n_jobs=n_jobs, **kwargs)):
+        stats_file_path = os.path.join(stats_dir_path, os.path.basename(sys_file_path) + cst.STATS_SUFFIX)
+        write_stats(stats, stats_file_path)
+        logger.info('Statistics written to file: %s', stats_file_path)
+
+
+def run_evaluation(ref_file_path, sys_file_path, results, **kwargs):
+    """
+    Evaluate a system against a reference with the metrics which are keys of `results`, appending its scores to
+    their lists (see `evalsub.api.evaluate` for a function returning them).
+
+    :param results: dictionary of lists, with the system, metrics and parameters to report as keys (other keys are
+        left untouched)
+    :param kwargs: evaluation settings (see `evaluate`)
+    """
+    metrics = [metric for metric in results if metric in cst.VALID_METRICS]
+    row = evaluate(ref_file_path, sys_file_path, metrics=metrics, **kwargs).row()
+    for column, value in row.items():
+        if column in results:
+            results[column].append(value)
 
 
 # MAIN  ################################################################################################################
@@ -131,13 +146,40 @@ def parse_args():
                         help="Segmented subtitle files to evaluate.")
     parser.add_argument('--reference_file', '-ref', type=str, default=cst.AMARA_FR,
                         help="Reference segmented subtitle file.")
+    parser.add_argument('--manifest', '-man', type=str,
+                        help="CSV file (or JSONL file, if ending with .jsonl) of reference/system pairs to evaluate "
+                             "instead of the system files, with 'reference' and 'system' columns (paths relative to "
+                             "the manifest), and optional metadata columns copied to the results.")
     parser.add_argument('--results_file', '-res', type=str,
-                        help="CSV file where to write the results.")
+                        help="CSV file (or JSONL file, if ending with .jsonl) where to write the results, "
+                             "as soon as each system is evaluated.")
+    parser.add_argument('--emit_stats', '-es', type=str,
+                        help="Directory where to write the sufficient statistics of each system (<system file>"
+                             "%s) instead of its scores, to be merged with those of the other shards of the corpus "
+                             "by evalsub/shard_stats.py." % cst.STATS_SUFFIX)
+    parser.add_argument('--resume', '-r', action='store_true',
+                        help="Whether to skip the systems already in the results file (and append the others).")
 
     parser.add_argument('--srt', '-srt', action='store_true',
                         help="Whether the subtitle files are in SRT format.")
     parser.add_argument('--auto_segmentation', '-as', action='store_true',
                         help="Whether to use automatic segmentation for system sequences.")
+    parser.add_argument('--auto_seg_chunk_size', '-ascs', type=int,
+                        help="If set, automatic segmentation aligns the words by spans of at most this size, "
+                             "split at confident matches, instead of aligning whole documents at once "
+                             "(bounded memory on long documents). The alignment is approximate: it can cost more "
+                             "edits than the full alignment, and change the Sigma and TER_br scores.")
+    parser.add_argument('--auto_seg_jobs', '-asj', type=int, default=1,
+                        help="Number of processes used to align the spans in chunked automatic segmentation "
+                             "(0 for all the CPUs).")
+    parser.add_argument('--auto_seg_cache_dir', '-ascd', default=cst.CACHE_DIR_PATH,
+                        help="Directory where automatic segmentations are cached, keyed by reference and system "
+                             "contents (by default, $EVALSUB_CACHE_DIR or ~/.cache/evalsub).")
+    parser.add_argument('--no_auto_seg_cache', '-nasc', action='store_true',
+                        help="If set, automatic segmentations are neither read from nor written to the cache.")
+    parser.add_argument('--auto_seg_output_dir', '-asod',
+                        help="Directory where to write the automatically segmented system files (*_AS.txt). "
+                             "By default, they are written next to the system files.")
 
     parser.add_argument('--window_size', '-k', type=int,
                         help="Window size for the window-based segmentation evaluation.")
@@ -146,15 +188,47 @@ def parse_args():
     parser.add_argument('--max_cpl', '-cpl', type=int, default=cst.MAX_CPL,
                         help="Maximum allowed length for subtitle lines.")
     parser.add_argument('--confidence_interval', '-ci', action='store_true', default=False,
-                        help="If set, compute (and print) the confidence interval (CI) for BLEU "
-                             "and Sigma. The CI is computed using bootstrap resampling (with 95% "
+                        help="If set, compute (and print) the confidence interval (CI) for BLEU, "
+                             "Sigma and TER_br. The CI is computed using bootstrap resampling (with 95% "
                              "confidence).")
+    parser.add_argument('--adaptive_ci', '-aci', action='store_true',
+                        help="If set, bootstrap resamples are drawn by batches until the CI bounds move by less "
+                             "than --ci_tolerance (instead of drawing 1000 resamples).")
+    parser.add_argument('--ci_min_samples', '-cimin', type=int, default=cst.BS_MIN_SAMPLES,
+                        help="Minimum number of bootstrap resamples with --adaptive_ci.")
+    parser.add_argument('--ci_max_samples', '-cimax', type=int, default=cst.BS_MAX_SAMPLES,
+                        help="Maximum number of bootstrap resamples with --adaptive_ci.")
+    parser.add_argument('--ci_tolerance', '-citol', type=float, default=cst.BS_TOLERANCE,
+                        help="Maximum move of the CI bounds (in score points) between two batches of %d "
+                             "resamples, for convergence with --adaptive_ci." % cst.BS_BATCH_SAMPLES)
+    parser.add_argument('--ci_jobs', '-cij', type=int, default=1,
+                        help="Number of processes used for bootstrap resampling (0 for all the CPUs). "
+                             "The CIs are identical whatever the number of processes.")
+    parser.add_argument('--ter_jobs', '-tj', type=int, default=1,
+                        help="Number of processes used to compute TER_br (0 for all the CPUs).")
+    parser.add_argument('--metric_jobs', '-mj', type=int, default=1,
+                        help="Number of processes computing the metric families of a system concurrently "
+                             "(0 for all the CPUs).")
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help="Whether to only print warnings and errors (scores are still written to the results "
+                             "file).")
+    parser.add_argument('--profile', '-prof', type=str, nargs='?', const='',
+                        help="If set, profile the evaluation stages of each system (wall time, CPU time and peak "
+                             "memory), print them, and add the totals to the results. If a JSONL file is given, the "
+                             "profiles of the stages are also written to it.")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="Number of processes evaluating systems in parallel (0 for all the CPUs). "
+                             "The results are written in the order of the system files.")
 
     args = parser.parse_args()
+    if args.auto_seg_chunk_size is not None and args.auto_seg_chunk_size < 1:
+        parser.error("--auto_seg_chunk_size must be at least 1")
     return args
 
 
 def main(args):
+    cli_logging(logging.WARNING if args.quiet else logging.INFO)
+
     all_metrics = args.all
     standard_metrics = args.standard
     end2end_metrics = args.end2end
@@ -183,39 +257,55 @@ def main(args):
     if text == 'imperfect':
         metrics.difference_update(cst.STD_METRICS)
 
-    print('Computing the following metrics:', ', '.join(metrics))
-
-    results = {cst.SYSTEM: list()}
-    results.update([(metric, list()) for metric in metrics])
-    # Window size is saved if Pk or WindowDiff is computed
-    if cst.PK in results or cst.WIN_DIFF in results:
-        results[cst.WIN_SIZE] = list()
-    # Transposition span is saved if SegSim or BoundSim is computed
-    if cst.SEG_SIM in results or cst.BOUND_SIM in results:
-        results[cst.NT] = list()
-    # Boundaries to words ratio (alpha) is saved if Sigma is computed
-    if cst.SIGMA in results:
-        results[cst.ALPHA] = list()
+    logger.info('Computing the following metrics: %s', ', '.join(metrics))
 
     sys_file_paths = args.system_files
     ref_file_path = args.reference_file
+    manifest_file_path = args.manifest
     res_file_path = args.results_file
-    srt = args.srt
-    auto_seg = args.auto_segmentation
-    confidence_interval = args.confidence_interval
-    window_size = args.window_size
-    nt = args.max_transpo
-    max_cpl = args.max_cpl
-
-    run_evaluations(
-        ref_file_path, sys_file_paths, results, window_size=window_size, nt=nt, max_cpl=max_cpl,
-        srt=srt, auto_seg=auto_seg, confidence_interval=confidence_interval)
-
-    # Write to csv file
-    print('Writing results to csv file:', res_file_path)
-    df = pd.DataFrame.from_dict(results)
-    with open(res_file_path, 'w') as out:
-        df.to_csv(out, index=False, header=True)
+    resume = args.resume
+    n_jobs = args.jobs
+    kwargs = dict(
+        window_size=args.window_size, nt=args.max_transpo, max_cpl=args.max_cpl, srt=args.srt,
+        auto_seg=args.auto_segmentation, confidence_interval=args.confidence_interval, ter_jobs=args.ter_jobs,
+        auto_seg_chunk_size=args.auto_seg_chunk_size, auto_seg_jobs=args.auto_seg_jobs,
+        auto_seg_cache_dir_path=None if args.no_auto_seg_cache else args.auto_seg_cache_dir,
+        auto_seg_out_dir_path=args.auto_seg_output_dir, adaptive_ci=args.adaptive_ci,
+        ci_min_samples=args.ci_min_samples, ci_max_samples=args.ci_max_samples, ci_tolerance=args.ci_tolerance,
+        ci_jobs=args.ci_jobs, metric_jobs=args.metric_jobs, profile=args.profile is not None)
+    profile_file_path = args.profile or None
+
+    if args.emit_stats is not None:
+        if manifest_file_path is not None:
+            raise ValueError("Statistics cannot be emitted for a manifest")
+        stats_kwargs = {key: kwargs[key] for key in ('max_cpl', 'srt', 'auto_seg', 'ter_jobs', 'auto_seg_chunk_size',
+                                                     'auto_seg_jobs', 'auto_seg_cache_dir_path',
+                                                     'auto_seg_out_dir_path')}
+        emit_stats(ref_file_path, sys_file_paths, args.emit_stats, list(metrics), n_jobs=n_jobs, **stats_kwargs)
+        return
+
+    # Results are written to the file as soon as each system is evaluated
+    logger.info('Writing results to file: %s', res_file_path)
+    if manifest_file_path is not None:
+        evaluate_manifest(manifest_file_path, res_file_path, metrics, resume=resume, n_jobs=n_jobs,
+                          profile_file_path=profile_file_path, **kwargs)
+        return
+
+    with ResultsWriter(res_file_path, result_columns(metrics, profile=kwargs['profile']), resume=resume) as writer, \
+            (ProfileWriter(profile_file_path, resume=resume) if profile_file_path else nullcontext()) as profile_writer:
+        if resume:
+            # Systems are identified by their file names in the results
+            sys_names = Counter(os.path.basename(sys_file_path) for sys_file_path in sys_file_paths)
+            duplicate_names = sorted(name for name, count in sys_names.items() if count > 1)
+            if duplicate_names:
+                raise ValueError("Cannot resume the evaluation of system files with the same name: %s"
+                                 % ', '.join(duplicate_names))
+            sys_file_paths = [sys_file_path for sys_file_path in sys_file_paths
+                              if not writer.is_done(os.path.basename(sys_file_path))]
+            logger.info('Systems to evaluate: %d', len(sys_file_paths))
+
+        for result in evaluate_systems(ref_file_path, sys_file_paths, metrics=metrics, n_jobs=n_jobs, **kwargs):
+            write_result(writer, result.row(), result, profile_writer=profile_writer, system=result.system)
 
 
 if __name__ == '__main__':